@@ -1,7 +1,32 @@
 # app_ultimate_version.py
 
+import argparse
+import contextvars
+import cProfile
+import functools
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import pickle
+import pstats
+import random
 import re
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+import unicodedata
 import warnings
+import zlib
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from difflib import SequenceMatcher
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
@@ -9,6 +34,11 @@ import streamlit as st
 import yfinance as yf
 from plotly.subplots import make_subplots
 
+try:
+    from numba import njit
+except ImportError: # 未安裝 numba 時，遞迴核心以純 NumPy 執行
+    njit = None
+
 warnings.filterwarnings('ignore')
 
 # ==============================================================================
@@ -24,11 +54,175 @@ st.set_page_config(
 # 週期映射
 PERIOD_MAP = {
     "30 分": ("60d", "30m"),
-    "4 小時": ("1y", "60m"),
+    "4 小時": ("1y", "4h"),
     "1 日": ("5y", "1d"),
     "1 週": ("max", "1wk")
 }
 
+# 多週期資料層：分析週期 -> (基礎K棒週期, 基礎序列下載期間, 重取樣規則)。基礎序列存在本地儲存並由多個週期共用，
+# 較高週期在本地依交易時段重取樣而不再各自下載；Yahoo 60分K 最多約兩年，無法涵蓋的日線以上歷史才另取日K。
+# 日線只需 5 年，全部歷史只在查詢週線時下載 (兩者共用同一份本地日K，較長的下載會涵蓋較短的)
+TIMEFRAME_SOURCES = {
+    "30m": ("30m", "60d", None),
+    "4h": ("60m", "1y", "4h"),
+    "1d": ("1d", "5y", None),
+    "1wk": ("1d", "max", "1wk"),
+}
+
+# 交易時段：市場 -> (交易所時區, 開盤時間, 收盤時間, 每週交易日數)；日內重取樣自每日開盤起切分
+# (台股 09:00/13:00、美股 09:30/13:30、加密貨幣 UTC 每 4 小時)，收盤時間與交易日數用來判斷最後一根K棒是否已收完
+MARKET_SESSIONS = {
+    "TW": ("Asia/Taipei", "09:00", "13:30", 5),
+    "US": ("America/New_York", "09:30", "16:00", 5),
+    "JP": ("Asia/Tokyo", "09:00", "15:30", 5),
+    "UK": ("Europe/London", "08:00", "16:30", 5),
+    "DE": ("Europe/Berlin", "09:00", "17:30", 5),
+    "CRYPTO": ("UTC", "00:00", "24:00", 7),
+}
+MARKET_SESSION_OVERRIDES = {"^TWII": "TW", "^N225": "JP", "^FTSE": "UK", "^GDAXI": "DE"}
+OHLCV_AGGREGATION = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+
+# 市場數據來源："yfinance" (線上) 或 "offline" (重播已記錄的 Parquet 快照，沒有快照的代碼產生合成K線；供離線測試、基準與壓力測試使用)
+DATA_ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_store")
+MARKET_DATA_PROVIDER = os.environ.get("MARKET_DATA_PROVIDER", "yfinance")
+OFFLINE_SNAPSHOT_DIR = os.environ.get("OFFLINE_SNAPSHOT_DIR", DATA_ROOT_DIR)
+OFFLINE_SYNTHETIC_BARS = int(os.environ.get("OFFLINE_SYNTHETIC_BARS", "2000"))
+OFFLINE_SYNTHETIC_END = os.environ.get("OFFLINE_SYNTHETIC_END", "2024-12-31")
+OFFLINE_BAR_FREQ = {"1m": "min", "5m": "5min", "15m": "15min", "30m": "30min", "60m": "60min", "1h": "60min", "1d": "B", "1wk": "W-FRI", "1mo": "MS"}
+
+# 本地 OHLCV 儲存 (Parquet，依 代碼/週期 分檔)；離線模式另存一處，避免合成數據混入真實歷史與共用快取
+OHLCV_STORE_DIR = os.environ.get("OHLCV_STORE_DIR", os.path.join(DATA_ROOT_DIR, "offline") if MARKET_DATA_PROVIDER == "offline" else DATA_ROOT_DIR)
+PERIOD_DAYS = {"d": 1, "wk": 7, "mo": 30, "y": 365}
+
+# AI模型分析所需的最少K棒數
+MIN_ANALYSIS_BARS = 52
+
+# 低記憶體模式：OHLCV 以程序內共用的唯讀 float32 區塊保存，指標、資金曲線等衍生序列也降為 float32
+PIPELINE_LOW_MEMORY = os.environ.get("PIPELINE_LOW_MEMORY", "0") == "1"
+
+# 報告資料組裝：平行請求的執行緒池與各請求逾時秒數
+FETCH_MAX_WORKERS = 16
+FETCH_TIMEOUT_SECONDS = {"df_raw": 30, "yf_info": 15, "inst_holders": 15, "news": 15}
+
+# Yahoo 上游請求：全域令牌桶限流 (每秒請求數/突發量)，失敗時以抖動指數退避重試
+UPSTREAM_RATE_PER_SECOND = float(os.environ.get("UPSTREAM_RATE_PER_SECOND", "4"))
+UPSTREAM_BURST = int(os.environ.get("UPSTREAM_BURST", "8"))
+UPSTREAM_MAX_RETRIES = 3
+UPSTREAM_BACKOFF_BASE_SECONDS = 0.5
+UPSTREAM_BACKOFF_MAX_SECONDS = 8.0
+# 只為 fetch_or_default 會讀取的請求種類保留最後一次成功的結果 (價格有 Parquet 倉儲可退回)，並以 LRU 限制筆數
+UPSTREAM_LAST_GOOD_KINDS = ("info", "institutional_holders", "news")
+UPSTREAM_LAST_GOOD_SIZE = 1024
+
+# 各階段延遲量測：Prometheus 直方圖的區間上限 (秒)，METRICS_PORT 非 0 時以獨立 HTTP 服務提供 /metrics；
+# 每次分析的 JSON 紀錄寫到 METRICS_LOG ("-" 為標準錯誤輸出、其他值為檔案路徑，空字串則交由應用程式自行設定 logging)
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+METRICS_LOG = os.environ.get("METRICS_LOG", "-")
+METRICS_LOGGER = logging.getLogger("ai_trend.metrics")
+LOGGER = logging.getLogger("ai_trend") # 執行期的警告與錯誤 (本地儲存、批次下載失敗等)，未設定處理器時由 logging 輸出到標準錯誤
+
+def configure_metrics_logger(target=METRICS_LOG):
+    # Streamlit 每次重跑都會重新執行模組，記錄器已有處理器時不重複加入
+    if not target or METRICS_LOGGER.handlers: return METRICS_LOGGER
+    handler = logging.StreamHandler() if target == "-" else logging.FileHandler(target, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    METRICS_LOGGER.addHandler(handler)
+    METRICS_LOGGER.setLevel(logging.INFO)
+    METRICS_LOGGER.propagate = False # 只輸出一次，不再經過根記錄器的處理器
+    return METRICS_LOGGER
+
+configure_metrics_logger()
+
+# 跨程序共用快取 (多個 Streamlit 副本與批次工作程序共用，重啟後保留)：後端 "sqlite" 或單程序的 "memory"，超過容量時依最近存取淘汰。
+# 安全性：DataFrame 以外的值 (基本面字典、新聞等) 以 pickle 儲存，讀取時會還原任意物件，
+# SHARED_CACHE_PATH (與所在目錄) 只能讓執行本應用的帳號寫入，不可放在其他使用者可寫的共用位置
+SHARED_CACHE_BACKEND = os.environ.get("SHARED_CACHE_BACKEND", "sqlite")
+SHARED_CACHE_PATH = os.environ.get("SHARED_CACHE_PATH", os.path.join(OHLCV_STORE_DIR, "shared_cache.sqlite"))
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("SHARED_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+SHARED_CACHE_TOUCH_SECONDS = 60 # 命中時最近存取時間超過此秒數才寫回 (淘汰順序只需粗略的時間，避免每次讀取都寫入資料庫)
+
+# 背景快取預熱：熱門標的與最常被查詢的標的在快取過期前 (價格 TTL 300 秒、基本面 3600 秒) 先行更新；
+# 共用快取中的項目若已由其他副本或互動請求在更新間隔內寫入則略過，上游請求使用獨立且較小的令牌桶
+PREWARM_ENABLED = os.environ.get("PREWARM_ENABLED", "1") == "1"
+PREWARM_CONCURRENCY = int(os.environ.get("PREWARM_CONCURRENCY", "4"))
+PREWARM_RATE_PER_SECOND = float(os.environ.get("PREWARM_RATE_PER_SECOND", "1"))
+PREWARM_BURST = 2
+PREWARM_TICK_SECONDS = 30
+PREWARM_PRICE_INTERVAL_SECONDS = 240
+PREWARM_FUNDAMENTALS_INTERVAL_SECONDS = 3000
+PREWARM_TOP_REQUESTED = 20
+PREWARM_BUDGET_SHARE = 0.8 # 每輪價格更新最多使用預熱速率額度的比例，保留餘裕給重試與基本面
+PREWARM_DEFAULT_PERIOD_KEY = "1 日"
+
+# 即時模式 (只限直接下載、不經重取樣的日內週期)：自動輪詢新K棒的秒數，以及即時K線圖保留的最近K棒數
+LIVE_PERIOD_KEYS = ("30 分",)
+LIVE_REFRESH_SECONDS = int(os.environ.get("LIVE_REFRESH_SECONDS", "60"))
+LIVE_CHART_CANDLES = 120
+
+# 參數掃描回測：快/慢均線視窗與均線類型網格
+SWEEP_FAST_WINDOWS = (5, 10, 15, 20, 30, 40)
+SWEEP_SLOW_WINDOWS = (30, 50, 75, 100, 150, 200)
+SWEEP_MA_TYPES = ("SMA", "EMA")
+SWEEP_METRICS = {"total_return": "總回報率 (%)", "win_rate": "勝率 (%)", "max_drawdown": "最大回撤 (%)"}
+
+# 策略參數最佳化：各策略 (以函式名稱) 的參數網格，沒有列出的策略沒有可調參數
+STRATEGY_PARAM_SPACES = {
+    "support_resistance": {"lookback": tuple(range(20, 125, 5))},
+    "bollinger_bands_strategy": {"period": tuple(range(10, 85, 5)), "dev": (1.5, 2.0, 2.5, 3.0, 3.5)},
+    "atr_stop": {"period": (7, 10, 14, 21, 28), "multiplier_sl": (1.0, 1.5, 2.0, 2.5, 3.0), "multiplier_tp": (2, 3, 4, 5, 6, 8)},
+    "donchian_channel": {"period": tuple(range(10, 105, 5))},
+    "keltner_channel": {"period": tuple(range(10, 65, 5)), "atr_multiplier": (1.0, 1.5, 2.0, 2.5, 3.0), "atr_period": (10, 14, 20)},
+    "ma_crossover": {"fast": (5, 8, 10, 13, 20, 30), "slow": (40, 50, 75, 100, 150, 200)},
+    "trailing_stop": {"atr_period": (7, 10, 14, 21, 28), "atr_multiplier": (1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 5.0)},
+    "chandelier_exit": {"period": (10, 14, 22, 30, 44), "atr_multiplier": (2.0, 2.5, 3.0, 3.5, 4.0, 5.0)},
+    "supertrend": {"period": (7, 10, 14, 20, 30), "multiplier": (1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 5.0)},
+}
+# 前進分析 (錨定擴張視窗)：前 OPTIMIZER_MIN_TRAIN_RATIO 為第一段訓練，其餘均分為 OPTIMIZER_FOLDS 段測試；
+# 交易次數不足的候選參數不列入排序；逐次減半 (halving) 每個視窗後只保留前 1/ETA 的候選參數
+OPTIMIZER_METHODS = ("grid", "random", "halving")
+OPTIMIZER_FOLDS = 4
+OPTIMIZER_MIN_TRAIN_RATIO = 0.4
+OPTIMIZER_MIN_TRADES = 3
+OPTIMIZER_HALVING_ETA = 3
+OPTIMIZER_RANDOM_SAMPLES = 200
+OPTIMIZER_CHUNK_SIZE = 64
+OPTIMIZED_PARAMS_PATH = os.environ.get("OPTIMIZED_PARAMS_PATH", os.path.join(DATA_ROOT_DIR, "optimized_params.json"))
+
+# 穩健度分析 (蒙地卡羅)：區塊自助抽樣重抽K棒報酬 (保留波動叢聚)，交易自助抽樣/順序重排則以整筆交易為單位；
+# 區塊長度預設為 n^(1/3)；每批路徑的矩陣格數上限用於限制記憶體，總格數上限則在長序列 (分K) 時減少路徑數
+# (至少 ROBUSTNESS_MIN_PATHS 條) 以控制耗時；扇形圖只保留 ROBUSTNESS_FAN_POINTS 個時間點
+ROBUSTNESS_METHODS = {"block": "區塊自助抽樣 (K棒報酬)", "bootstrap": "交易自助抽樣", "shuffle": "交易順序重排"}
+ROBUSTNESS_METRIC_LABELS = {"total_return": "總回報率 (%)", "max_drawdown": "最大回撤 (%)", "win_rate": "勝率 (%)"}
+ROBUSTNESS_PATHS = int(os.environ.get("ROBUSTNESS_PATHS", "2000"))
+ROBUSTNESS_BLOCK_SIZE = None
+ROBUSTNESS_QUANTILES = (5, 25, 50, 75, 95)
+ROBUSTNESS_MIN_PATHS = 200
+ROBUSTNESS_MAX_CELLS = 2_000_000
+ROBUSTNESS_MAX_TOTAL_CELLS = 10_000_000
+ROBUSTNESS_FAN_POINTS = 200
+ROBUSTNESS_SEED = 0
+
+# 圖表繪製：折線 (LTTB) 與K線 (OHLC 彙整) 的最大輸出點數
+CHART_MAX_POINTS = 2000
+CHART_MAX_CANDLES = 600
+
+# 市場掃描：每批下載的代碼數，以及掃描時使用的中性基本面/籌碼值 (不影響排序)
+SCANNER_BATCH_SIZE = 50
+SCANNER_NEUTRAL_FA = {"score": 3.5}
+SCANNER_NEUTRAL_CHIPS = {"inst_hold_pct": 0.4}
+SCANNER_FAILED_SHOWN = 10 # 下載失敗時錯誤訊息中列出的代碼數
+# 市場掃描的橫斷面排行：顯示名稱 -> 排序欄位；唐奇安通道以前 N 根K棒 (不含當根) 的高低點為上下軌
+SCANNER_DONCHIAN_WINDOW = 20
+SCANNER_RANKINGS = {"AI 融合評分": "AI 評分", "RSI 最高": "RSI", "ADX 趨勢最強": "ADX", "唐奇安突破": "突破幅度 (%)"}
+
+# 效能基準測試：合成K線筆數、基準檔路徑，以及判定退步的容許比例 (另需超過最小絕對差，避免微小案例的量測雜訊)
+BENCH_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+BENCH_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+BENCH_REGRESSION_TOLERANCE = 0.25
+BENCH_MIN_DELTA_SECONDS = 0.005
+BENCH_MIN_DELTA_MB = 1.0
+
 # 🚀 您的【所有資產清單】(與您提供的一致，此處省略以節省空間)
 FULL_SYMBOLS_MAP = {
     # 美股/ETF/指數
@@ -256,35 +450,690 @@ def sync_text_input_from_selection():
     except Exception:
         pass
 
+def apply_symbol_suggestion():
+    code = st.session_state.get('symbol_suggestion')
+    if code:
+        st.session_state.sidebar_search_input = code
+        st.session_state.symbol_suggestion = None
+
+def normalize_symbol_text(text):
+    return unicodedata.normalize('NFKC', text).strip().upper()
+
+class SymbolIndex:
+    # 代碼/名稱/關鍵字索引：正規化精確比對雜湊表 + 前綴樹 (Trie) 自動完成 + 模糊比對排序
+    _END = ''
+    RANK_CODE, RANK_KEYWORD, RANK_NAME = 0, 1, 2
+
+    def __init__(self, symbols_map):
+        self.symbols_map = symbols_map
+        self.exact, self.names, self.trie, self.tokens = {}, {}, {}, {}
+        for code, data in symbols_map.items():
+            # 依清單順序建立，保留原本線性搜尋「先出現者優先」的結果
+            for token in [code] + list(data["keywords"]):
+                self.exact.setdefault(normalize_symbol_text(token), code)
+            self.names.setdefault(normalize_symbol_text(data["name"]), code)
+            self._insert(code, code, self.RANK_CODE)
+            for keyword in data["keywords"]: self._insert(keyword, code, self.RANK_KEYWORD)
+            name_parts = [data["name"]] + re.split(r'[\s()（）/&·]+', data["name"])
+            for part in name_parts: self._insert(part, code, self.RANK_NAME)
+
+    def _insert(self, token, code, rank):
+        token = normalize_symbol_text(token)
+        if not token: return
+        node = self.trie
+        for ch in token: node = node.setdefault(ch, {})
+        codes = node.setdefault(self._END, {})
+        codes[code] = min(rank, codes.get(code, rank))
+        self.tokens.setdefault(token, {})[code] = codes[code]
+
+    def resolve(self, query):
+        key = normalize_symbol_text(query)
+        return self.exact.get(key) or self.names.get(key)
+
+    def _prefix_matches(self, prefix, max_candidates):
+        node = self.trie
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None: return {}
+        # 廣度優先：較短 (較接近輸入) 的補全先被收集
+        found, queue = {}, deque([(node, 0)])
+        while queue and len(found) < max_candidates:
+            current, depth = queue.popleft()
+            for key, child in current.items():
+                if key == self._END:
+                    for code, rank in child.items():
+                        found[code] = min(found.get(code, (rank, depth)), (rank, depth))
+                else:
+                    queue.append((child, depth + 1))
+        return found
+
+    def suggest(self, query, limit=8):
+        key = normalize_symbol_text(query)
+        if not key: return []
+        scores = {}
+        exact_code = self.resolve(key)
+        if exact_code: scores[exact_code] = (0, 0, 0)
+        for code, (rank, extra) in self._prefix_matches(key, limit * 4).items():
+            scores.setdefault(code, (1, rank, extra))
+        if len(scores) < limit:
+            # 前綴結果不足時，以字串相似度補上模糊比對結果
+            fuzzy, matcher = [], SequenceMatcher(None, b=key)
+            for token, codes in self.tokens.items():
+                matcher.set_seq1(token)
+                if key in token or (matcher.real_quick_ratio() >= 0.6 and matcher.quick_ratio() >= 0.6 and matcher.ratio() >= 0.6):
+                    fuzzy.extend((1 - matcher.ratio(), rank, code) for code, rank in codes.items())
+            for distance, rank, code in sorted(fuzzy):
+                scores.setdefault(code, (2, distance, rank))
+        return [code for code, _ in sorted(scores.items(), key=lambda item: item[1])[:limit]]
+
+SYMBOL_INDEX = SymbolIndex(FULL_SYMBOLS_MAP)
+
 def get_symbol_from_query(query: str) -> str:
     query = query.strip()
     query_upper = query.upper()
-    for code, data in FULL_SYMBOLS_MAP.items():
-        if query_upper == code.upper(): return code
-        if any(query_upper == kw.upper() for kw in data["keywords"]): return code
-    for code, data in FULL_SYMBOLS_MAP.items():
-        if query == data["name"]: return code
+    code = SYMBOL_INDEX.resolve(query)
+    if code: return code
     if re.fullmatch(r'\d{4,6}', query) and not any(ext in query_upper for ext in ['.TW', '.HK', '.SS', '-USD']):
         return f"{query}.TW"
     return query
 
-@st.cache_data(ttl=300, show_spinner="正在從 Yahoo Finance 獲取最新市場數據...")
+def _normalize_ohlcv(df):
+    if df is None or df.empty: return pd.DataFrame()
+    df.columns = [col.capitalize() for col in df.columns]
+    df.index.name = 'Date'
+    df = df[['Open', 'High', 'Low', 'Close', 'Volume']]
+    return df[~df.index.duplicated(keep='first')]
+
+def _store_path(symbol, interval):
+    safe_symbol = re.sub(r'[^A-Za-z0-9._-]', '_', symbol)
+    return os.path.join(OHLCV_STORE_DIR, interval, f"{safe_symbol}.parquet")
+
+def load_local_history(symbol, interval):
+    path = _store_path(symbol, interval)
+    if not os.path.exists(path): return pd.DataFrame()
+    try:
+        return pd.read_parquet(path)
+    except Exception:
+        LOGGER.warning("無法讀取本地儲存 %s，改為重新下載", path, exc_info=True)
+        return pd.DataFrame()
+
+def save_local_history(symbol, interval, df, period=None):
+    # period 為這份歷史完整涵蓋的下載期間，記錄在檔案的 attrs['store_period']
+    path = _store_path(symbol, interval)
+    if period is not None:
+        df = df.copy(deep=False)
+        df.attrs['store_period'] = period
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, path) # 原子替換，避免讀到寫一半的檔案
+    except Exception:
+        # 寫入失敗不影響本次回傳的數據 (本地儲存維持上一份)，但要留下紀錄並清掉寫一半的暫存檔
+        LOGGER.warning("無法寫入本地儲存 %s", path, exc_info=True)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+class YFinanceProvider:
+    # 線上數據來源：所有請求都會經過 UPSTREAM 的限流與重試
+    rate_limited = True
+
+    def history(self, symbol, interval, period=None, start=None):
+        if start is not None: return yf.Ticker(symbol).history(start=start, interval=interval, auto_adjust=True)
+        return yf.Ticker(symbol).history(period=period, interval=interval, auto_adjust=True)
+
+    def download(self, symbols, period, interval):
+        return yf.download(list(symbols), period=period, interval=interval, group_by='ticker', auto_adjust=True, threads=True, progress=False)
+
+    def info(self, symbol):
+        return yf.Ticker(symbol).info
+
+    def institutional_holders(self, symbol):
+        return yf.Ticker(symbol).institutional_holders
+
+    def news(self, symbol):
+        return yf.Ticker(symbol).news
+
+class OfflineProvider:
+    # 離線數據來源：優先重播 snapshot_dir/<週期>/<代碼>.parquet (與本地儲存相同的格式)，否則以代碼為種子產生可重現的合成K線
+    rate_limited = False
+
+    def __init__(self, snapshot_dir=OFFLINE_SNAPSHOT_DIR, synthetic_bars=OFFLINE_SYNTHETIC_BARS, synthetic_end=OFFLINE_SYNTHETIC_END):
+        self.snapshot_dir, self.synthetic_bars, self.synthetic_end = snapshot_dir, synthetic_bars, pd.Timestamp(synthetic_end)
+
+    def _rng(self, *parts):
+        return np.random.default_rng(zlib.crc32("|".join(parts).encode('utf-8')))
+
+    def synthetic_ohlcv(self, symbol, interval, bars=None):
+        bars = bars or self.synthetic_bars
+        rng = self._rng(symbol, interval)
+        index = pd.date_range(end=self.synthetic_end, periods=bars, freq=OFFLINE_BAR_FREQ.get(interval, "B"), name='Date')
+        close = rng.uniform(20, 500) * np.exp(np.cumsum(rng.normal(0, 0.01, bars))) # 無漂移：長序列 (基準測試的百萬根K棒) 不會發散
+        open_ = close * (1 + rng.normal(0, 0.004, bars))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.006, bars)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.006, bars)))
+        volume = rng.integers(100_000, 5_000_000, bars).astype(float)
+        return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume}, index=index)
+
+    def history(self, symbol, interval, period=None, start=None):
+        path = os.path.join(self.snapshot_dir, interval, f"{re.sub(r'[^A-Za-z0-9._-]', '_', symbol)}.parquet")
+        df = pd.read_parquet(path) if os.path.exists(path) else self.synthetic_ohlcv(symbol, interval)
+        if start is not None: df = df[df.index >= pd.Timestamp(start)]
+        return trim_to_period(df, period) if period else df
+
+    def download(self, symbols, period, interval):
+        return pd.concat({symbol: self.history(symbol, interval, period=period) for symbol in symbols}, axis=1)
+
+    def info(self, symbol):
+        rng = self._rng(symbol, "info")
+        quote_type = "CRYPTOCURRENCY" if symbol.endswith("-USD") else "INDEX" if symbol.startswith("^") else "EQUITY"
+        return {
+            "longName": f"{symbol} (Offline)", "currency": "TWD" if symbol.endswith(".TW") else "USD", "quoteType": quote_type,
+            "returnOnEquity": rng.uniform(-0.05, 0.35), "debtToEquity": rng.uniform(10, 150), "revenueGrowth": rng.uniform(-0.1, 0.3),
+            "trailingPE": rng.uniform(8, 40), "pegRatio": rng.uniform(0.5, 3),
+        }
+
+    def institutional_holders(self, symbol):
+        return pd.DataFrame({"Breakdown": ["% of Shares Held by Institutions"], "Holder": ["Offline"], "Value": [self._rng(symbol, "holders").uniform(0.1, 0.8)]})
+
+    def news(self, symbol):
+        return [{"title": f"{symbol} 離線模式：無即時新聞"}]
+
+MARKET_DATA_PROVIDERS = {"yfinance": YFinanceProvider, "offline": OfflineProvider}
+MARKET_DATA = MARKET_DATA_PROVIDERS[MARKET_DATA_PROVIDER]()
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+_UPSTREAM_BUDGET = contextvars.ContextVar("upstream_budget", default=None)
+
+class UpstreamFetcher:
+    # 所有 Yahoo 請求的單一出口：相同請求合併為一個進行中的呼叫、全域限流、抖動退避重試，並保留最後一次成功的結果
+    def __init__(self, rate=UPSTREAM_RATE_PER_SECOND, burst=UPSTREAM_BURST, max_retries=UPSTREAM_MAX_RETRIES,
+                 last_good_kinds=UPSTREAM_LAST_GOOD_KINDS, last_good_size=UPSTREAM_LAST_GOOD_SIZE):
+        self.bucket = TokenBucket(rate, burst) if rate else None # rate=None：不限流 (離線數據來源)
+        self.max_retries = max_retries
+        self.last_good_kinds, self.last_good_size = last_good_kinds, last_good_size
+        self._inflight = {}
+        self._last_good = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def budget(self, bucket):
+        # 在此區塊內 (含同一 context 的呼叫) 改用指定的令牌桶，例如背景預熱不佔用互動請求的額度
+        token = _UPSTREAM_BUDGET.set(bucket)
+        try:
+            yield
+        finally:
+            _UPSTREAM_BUDGET.reset(token)
+
+    def _call_with_retry(self, func, args, kwargs):
+        bucket = _UPSTREAM_BUDGET.get() or self.bucket
+        for attempt in range(self.max_retries + 1):
+            if bucket: bucket.acquire()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if attempt == self.max_retries: raise
+                cap = min(UPSTREAM_BACKOFF_MAX_SECONDS, UPSTREAM_BACKOFF_BASE_SECONDS * 2 ** attempt)
+                time.sleep(random.uniform(0, cap)) # full jitter，避免多個工作同時重試
+
+    def call(self, key, func, *args, **kwargs):
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner: future = self._inflight[key] = Future()
+        if not owner: return future.result() # 搭上已在進行中的相同請求 (成功或失敗都共用)
+        try:
+            result = self._call_with_retry(func, args, kwargs)
+            future.set_result(result)
+            if key[0] in self.last_good_kinds:
+                with self._lock:
+                    self._last_good.pop(key, None)
+                    self._last_good[key] = result # 重新插入以維持 LRU 順序
+                    while len(self._last_good) > self.last_good_size: self._last_good.pop(next(iter(self._last_good)))
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock: self._inflight.pop(key, None)
+
+    def last_good(self, key, default=None):
+        with self._lock: return self._last_good.get(key, default)
+
+UPSTREAM = UpstreamFetcher(rate=UPSTREAM_RATE_PER_SECOND if MARKET_DATA.rate_limited else None)
+
+def upstream_history(symbol, interval, period=None, start=None):
+    return UPSTREAM.call(('history', symbol, interval, period, start), MARKET_DATA.history, symbol, interval, period=period, start=start)
+
+def upstream_download(symbols, period, interval):
+    return UPSTREAM.call(('download', tuple(symbols), period, interval), MARKET_DATA.download, tuple(symbols), period, interval)
+
+class StageMetrics:
+    # 每個程序累計各階段的耗時直方圖、快取命中/未命中次數與處理筆數，輸出為 Prometheus 文字格式
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {} # stage -> [各區間累計次數, 總秒數, 次數]
+        self._cache = Counter()
+        self._rows = Counter()
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, cache=None, rows=None):
+        with self._lock:
+            histogram = self._histograms.setdefault(stage, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound: histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            if cache: self._cache[(stage, cache)] += 1
+            if rows: self._rows[stage] += rows
+
+    def prometheus_text(self):
+        with self._lock:
+            lines = ["# HELP ai_trend_stage_seconds Wall time per pipeline stage.", "# TYPE ai_trend_stage_seconds histogram"]
+            for stage, (counts, total, count) in sorted(self._histograms.items()):
+                lines += [f'ai_trend_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {n}' for bound, n in zip(self.buckets, counts)]
+                lines += [f'ai_trend_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}',
+                          f'ai_trend_stage_seconds_sum{{stage="{stage}"}} {total:.6f}', f'ai_trend_stage_seconds_count{{stage="{stage}"}} {count}']
+            lines += ["# HELP ai_trend_cache_requests_total Cache lookups per stage and result.", "# TYPE ai_trend_cache_requests_total counter"]
+            lines += [f'ai_trend_cache_requests_total{{stage="{stage}",result="{result}"}} {n}' for (stage, result), n in sorted(self._cache.items())]
+            lines += ["# HELP ai_trend_stage_rows_total Rows processed per stage.", "# TYPE ai_trend_stage_rows_total counter"]
+            lines += [f'ai_trend_stage_rows_total{{stage="{stage}"}} {n}' for stage, n in sorted(self._rows.items())]
+        return "\n".join(lines) + "\n"
+
+STAGE_METRICS = StageMetrics()
+_STAGE_TRACE = contextvars.ContextVar("stage_trace", default=None)
+
+@contextmanager
+def stage_trace(trace=None):
+    # 收集這段期間 (含以 contextvars 傳遞的工作執行緒) 的各階段紀錄
+    trace = [] if trace is None else trace
+    token = _STAGE_TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        _STAGE_TRACE.reset(token)
+
+@contextmanager
+def timed_stage(stage, rows=None, cache=None):
+    # 量測區塊的實際耗時；區塊內可更新 record['rows'] / record['cache']
+    record = {"stage": stage, "seconds": 0.0, "cache": cache, "rows": rows}
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        STAGE_METRICS.observe(stage, record["seconds"], record["cache"], record["rows"])
+        trace = _STAGE_TRACE.get()
+        if trace is not None: trace.append(record)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = STAGE_METRICS.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port=METRICS_PORT):
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+def _encode_cache_value(value):
+    # DataFrame 以 zstd 壓縮的 Parquet 儲存，其他型別 (或 Parquet 不支援的欄位) 改用 pickle (快取檔案必須是可信任的，見 SHARED_CACHE_PATH)
+    if isinstance(value, pd.DataFrame) and not value.attrs:
+        try:
+            buffer = io.BytesIO()
+            value.to_parquet(buffer, compression='zstd')
+            return b'P' + buffer.getvalue()
+        except Exception:
+            pass
+    return b'K' + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _decode_cache_value(blob):
+    blob = bytes(blob)
+    return pd.read_parquet(io.BytesIO(blob[1:])) if blob[:1] == b'P' else pickle.loads(blob[1:])
+
+class MemoryCacheBackend:
+    # 單程序的替代實作 (與 SQLite 後端相同介面)，用於無法寫入共用檔案的環境
+    def __init__(self, max_bytes=SHARED_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # key -> (namespace, blob, expires_at)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            if entry[2] is not None and entry[2] <= time.time():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def expires_at(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[2] if entry is not None and (entry[2] is None or entry[2] > time.time()) else None
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None: self._size -= len(entry[1])
+
+    def set(self, key, namespace, blob, expires_at):
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (namespace, blob, expires_at)
+            self._size += len(blob)
+            while self._size > self.max_bytes and len(self._entries) > 1: self._pop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock: self._pop(key)
+
+    def clear(self, namespace=None):
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if namespace is None or entry[0] == namespace]: self._pop(key)
+
+class SQLiteCacheBackend:
+    # 單一 SQLite 檔案 (WAL 模式) 供多個程序同時讀寫；每個執行緒/程序各自持有連線
+    def __init__(self, path=SHARED_CACHE_PATH, max_bytes=SHARED_CACHE_MAX_BYTES):
+        self.path, self.max_bytes = path, max_bytes
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid(): # fork 後的子程序不可沿用父程序的連線
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, namespace TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires_at, accessed_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None: return None
+        now = time.time()
+        if row[1] is not None and row[1] <= now:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+        if now - row[2] >= SHARED_CACHE_TOUCH_SECONDS: conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def expires_at(self, key):
+        row = self._conn().execute("SELECT expires_at FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, namespace, blob, expires_at):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)", (key, namespace, sqlite3.Binary(blob), len(blob), expires_at, now))
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        excess = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0] - self.max_bytes
+        if excess > 0:
+            # 依最近存取時間淘汰最舊的項目，直到總大小回到上限以內
+            freed = 0
+            for old_key, size in conn.execute("SELECT key, size FROM cache WHERE key != ? ORDER BY accessed_at", (key,)).fetchall():
+                if freed >= excess: break
+                conn.execute("DELETE FROM cache WHERE key = ?", (old_key,))
+                freed += size
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self, namespace=None):
+        if namespace is None: self._conn().execute("DELETE FROM cache")
+        else: self._conn().execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+
+SHARED_CACHE_BACKENDS = {"sqlite": SQLiteCacheBackend, "memory": MemoryCacheBackend}
+SHARED_CACHE = SHARED_CACHE_BACKENDS[SHARED_CACHE_BACKEND]()
+
+def _shared_cache_key(namespace, args):
+    return hashlib.sha1(repr((namespace, args)).encode('utf-8')).hexdigest()
+
+def shared_cache(ttl=None):
+    # 取代 st.cache_data 的跨程序快取：相同的 TTL 語意、不快取例外，並保留 .clear(*args) 介面；後端故障時直接呼叫原函式。
+    # .refresh(*args) 重新呼叫原函式並只在成功時覆寫快取，.age(*args) 回傳快取項目已存在的秒數，
+    # .store(value, *args) 直接寫入已在別處算好的結果
+    def decorator(func):
+        namespace = func.__qualname__
+
+        def store(args, value):
+            try:
+                SHARED_CACHE.set(_shared_cache_key(namespace, args), namespace, _encode_cache_value(value), time.time() + ttl if ttl else None)
+            except Exception:
+                pass
+            return value
+
+        def cached_call(args, record):
+            try:
+                blob = SHARED_CACHE.get(_shared_cache_key(namespace, args))
+                if blob is not None: return _decode_cache_value(blob)
+            except Exception:
+                pass
+            record["cache"] = "miss"
+            return store(args, func(*args))
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            with timed_stage(namespace, cache="hit") as record:
+                value = cached_call(args, record)
+                if isinstance(value, pd.DataFrame): record["rows"] = len(value)
+                return value
+
+        def clear(*args):
+            try:
+                if args: SHARED_CACHE.delete(_shared_cache_key(namespace, args))
+                else: SHARED_CACHE.clear(namespace)
+            except Exception:
+                pass
+
+        def refresh(*args):
+            with timed_stage(namespace, cache="refresh"): return store(args, func(*args))
+
+        def age(*args):
+            # 依到期時間回推；項目不存在、已過期、未設 TTL 或後端故障時為 None
+            try:
+                expires_at = SHARED_CACHE.expires_at(_shared_cache_key(namespace, args))
+            except Exception:
+                return None
+            return ttl - (expires_at - time.time()) if ttl and expires_at is not None else None
+
+        wrapper.clear, wrapper.refresh, wrapper.age = clear, refresh, age
+        wrapper.store = lambda value, *args: store(args, value)
+        return wrapper
+    return decorator
+
+def period_length(period):
+    # Yahoo period 參數 (例如 60d、1y) 對應的時間長度；"max" 等不限長度的值回傳 None
+    match = re.fullmatch(r'(\d+)(d|wk|mo|y)', period)
+    return pd.Timedelta(days=int(match.group(1)) * PERIOD_DAYS[match.group(2)]) if match else None
+
+def trim_to_period(df, period):
+    # 將本地累積的歷史裁切回與 Yahoo period 參數相同的視窗
+    length = period_length(period)
+    if df.empty or length is None: return df
+    return df[df.index > df.index[-1] - length]
+
+def timeframe_source(interval, period):
+    # 未列在 TIMEFRAME_SOURCES 的週期直接下載，不重取樣
+    return TIMEFRAME_SOURCES.get(interval, (interval, period, None))
+
+def market_session(symbol):
+    market = MARKET_SESSION_OVERRIDES.get(symbol)
+    if market is None: market = "TW" if symbol.endswith(('.TW', '.TWO')) else "CRYPTO" if symbol.endswith('-USD') else "US"
+    return MARKET_SESSIONS[market]
+
+def resample_ohlcv(df, symbol, rule, now=None):
+    # 向量化重取樣：以交易所當地時間算出每根基礎K棒所屬的目標K棒起點 (日內自開盤起切分、週線以週一為起點)，再一次 groupby 彙整；
+    # 最後一根只在尚未收完時捨棄 (與直接下載時相同)：基礎K棒已涵蓋到它的終點 (日內K棒或當日收盤、週線為本週最後交易日收盤)，
+    # 或現在時間已超過終點 (例如遇到休市) 即視為收完
+    if rule is None or df.empty: return df
+    tz_name, open_time, close_time, week_days = market_session(symbol)
+    tz = df.index.tz
+    local = df.index.tz_convert(tz_name).tz_localize(None) if tz is not None else df.index
+    day, close_offset = local.normalize(), pd.Timedelta(f"{close_time}:00")
+    if rule == "1wk":
+        labels = day - pd.to_timedelta(day.dayofweek, unit='D')
+        last_end = labels[-1] + pd.Timedelta(days=week_days - 1) + close_offset
+    else:
+        step, session_open = pd.Timedelta(rule), day + pd.Timedelta(f"{open_time}:00")
+        labels = session_open + (local - session_open) // step * step
+        last_end = min(labels[-1] + step, day[-1] + close_offset)
+    base_step = (local[1:] - local[:-1]).min() if len(local) > 1 else pd.Timedelta(0)
+    covered_until = min(local[-1] + base_step, day[-1] + close_offset)
+    now = (pd.Timestamp.now(tz='UTC') if now is None else now).tz_convert(tz_name).tz_localize(None)
+    if tz is not None: labels = labels.tz_localize(tz_name, ambiguous=False, nonexistent='shift_forward')
+    out = df.groupby(labels).agg(OHLCV_AGGREGATION)
+    out.index.name = 'Date'
+    return out if covered_until >= last_end or now >= last_end else out.iloc[:-1]
+
+def fetch_ohlcv_incremental(symbol, period, interval):
+    return fetch_ohlcv_with_partial(symbol, period, interval)[0]
+
+def _covers_period(stored_period, period):
+    # 本地儲存記錄完整下載過的 period：較短的下載不能當作較長的歷史 (例如 5y 日K 不能供週線的 max 使用)；沒有記錄的舊檔案視為涵蓋
+    if stored_period is None or stored_period == period: return True
+    stored_length, length = period_length(stored_period), period_length(period)
+    return stored_length is None or (length is not None and stored_length >= length)
+
+def fetch_ohlcv_with_partial(symbol, period, interval):
+    # 回傳 (已收完的K棒, 盤中尚未收完的最後一根K棒)；未收完的K棒只供即時模式顯示，不寫入本地儲存
+    stored = load_local_history(symbol, interval)
+    stored_period = stored.attrs.pop('store_period', None)
+    partial = pd.DataFrame()
+    length = period_length(period)
+    # 最後已儲存K棒早於 period 視窗 (例如超出 Yahoo 日內資料的回溯上限) 時，增量請求會回傳空表，直接重新下載整個 period
+    if not stored.empty and _covers_period(stored_period, period) and (length is None or stored.index[-1] > pd.Timestamp.now(tz=stored.index.tz) - length):
+        # 只下載最後已儲存K棒(含)之後的資料；重疊的K棒用來偵測除權息/分割造成的還原價變動
+        last_ts = stored.index[-1]
+        delta = _normalize_ohlcv(upstream_history(symbol, interval, start=last_ts))
+        if delta.empty: return stored, partial
+        if last_ts in delta.index and np.isclose(delta.at[last_ts, 'Close'], stored.at[last_ts, 'Close'], rtol=1e-6):
+            if len(delta) > 1: delta, partial = delta.iloc[:-1], delta.iloc[-1:] # 最後一根K棒尚未收完
+            df = pd.concat([stored, delta])
+            df = df[~df.index.duplicated(keep='last')].sort_index()
+            if len(df) > len(stored): save_local_history(symbol, interval, df, stored_period)
+            return df, partial
+    df = _normalize_ohlcv(upstream_history(symbol, interval, period=period))
+    if len(df) > 1: df, partial = df.iloc[:-1], df.iloc[-1:]
+    if not df.empty: save_local_history(symbol, interval, df, period)
+    return df, partial
+
+@shared_cache(ttl=300)
+def get_base_history(symbol, period, interval):
+    # 基礎序列 (本地儲存 + 增量更新)：共用同一基礎序列的週期 (例如日線與週線) 切換時直接取用，不再向上游請求
+    return fetch_ohlcv_incremental(symbol, period, interval)
+
+def stock_frame_from_base(base, symbol, period, interval):
+    # 由基礎序列重取樣並裁切成指定週期的K線
+    _, _, rule = timeframe_source(interval, period)
+    df = trim_to_period(resample_ohlcv(base, symbol, rule), period)
+    return df if not df.empty else pd.DataFrame()
+
+@shared_cache(ttl=300)
 def get_stock_data(symbol, period, interval):
+    # 上游失敗 (限流/網路) 時拋出例外而不快取；空表只代表代碼無效或無資料
+    base_interval, base_period, _ = timeframe_source(interval, period)
+    return stock_frame_from_base(get_base_history(symbol, base_period, base_interval), symbol, period, interval)
+
+def get_stock_data_or_stale(symbol, period, interval):
+    # 上游失敗時改用本地儲存的最後一份資料，並以 attrs['stale'] 標記為過時
     try:
-        ticker = yf.Ticker(symbol)
-        df = ticker.history(period=period, interval=interval, auto_adjust=True)
-        if df.empty: return pd.DataFrame()
-        df.columns = [col.capitalize() for col in df.columns]
-        df.index.name = 'Date'
-        df = df[['Open', 'High', 'Low', 'Close', 'Volume']]
-        df = df[~df.index.duplicated(keep='first')]
+        return get_stock_data(symbol, period, interval)
+    except Exception as e:
+        base_interval, _, rule = timeframe_source(interval, period)
+        df = trim_to_period(resample_ohlcv(load_local_history(symbol, base_interval), symbol, rule), period)
+        if df.empty: raise
+        df = df.copy()
+        df.attrs.update(stale=True, stale_reason=str(e) or type(e).__name__)
+        return df
+
+@shared_cache(ttl=300)
+def get_batch_frames(symbols, period, interval):
+    # 單一批次的下載：需要重取樣的週期下載其基礎序列，其餘週期只下載掃描所需的期間；上游失敗時拋出例外而不快取
+    base_interval, base_period, rule = timeframe_source(interval, period)
+    raw = upstream_download(symbols, base_period if rule else period, base_interval)
+    frames = {}
+    if raw is None or raw.empty: return frames
+    for symbol in symbols:
+        if isinstance(raw.columns, pd.MultiIndex):
+            if symbol not in raw.columns.get_level_values(0): continue
+            df = raw[symbol]
+        else:
+            df = raw
+        # 多代碼下載會對齊各市場的交易時間，先去除該代碼沒有交易的列
+        df = _normalize_ohlcv(df.dropna(how='all'))
         if len(df) > 1: df = df.iloc[:-1]
-        return df if not df.empty else pd.DataFrame()
+        df = trim_to_period(resample_ohlcv(df, symbol, rule), period)
+        if not df.empty: frames[symbol] = df
+    return frames
+
+def get_batch_stock_data(symbols, period, interval):
+    # 分批下載 (成功的批次各自快取)，回傳 (各代碼K線, {下載失敗的代碼: 錯誤訊息})；失敗的批次記錄到日誌，下次掃描重新請求
+    symbols = list(symbols)
+    frames, failed = {}, {}
+    for start in range(0, len(symbols), SCANNER_BATCH_SIZE):
+        batch = tuple(symbols[start:start + SCANNER_BATCH_SIZE])
+        try:
+            frames.update(get_batch_frames(batch, period, interval))
+        except Exception as e:
+            LOGGER.warning("批次下載失敗 (%s 等 %d 個代碼，%s/%s)", batch[0], len(batch), period, interval, exc_info=True)
+            failed.update(dict.fromkeys(batch, str(e) or type(e).__name__))
+    return frames, failed
+
+@shared_cache(ttl=3600)
+def get_ticker_info(symbol):
+    # 每個標的只向 Yahoo 請求一次 info，公司資訊與基本面評級共用；失敗時拋出例外，不快取失敗結果
+    return UPSTREAM.call(('info', symbol), MARKET_DATA.info, symbol) or {}
+
+@shared_cache(ttl=3600)
+def get_institutional_holders(symbol):
+    return UPSTREAM.call(('institutional_holders', symbol), MARKET_DATA.institutional_holders, symbol)
+
+@shared_cache(ttl=3600)
+def get_ticker_news(symbol):
+    return UPSTREAM.call(('news', symbol), MARKET_DATA.news, symbol) or []
+
+def fetch_or_default(func, *args, default=None, stale_key=None):
+    # stale_key：上游失敗時改用該請求最後一次成功的結果
+    try:
+        return func(*args)
     except Exception:
-        return pd.DataFrame()
+        return UPSTREAM.last_good(stale_key, default) if stale_key else default
 
-@st.cache_data(ttl=3600)
-def get_company_info(symbol):
+def build_company_info(symbol, yf_info):
     info = FULL_SYMBOLS_MAP.get(symbol, {})
     if info:
         if symbol.endswith(".TW") or symbol.startswith("^TWII"): category, currency = "台股 (TW)", "TWD"
@@ -292,8 +1141,6 @@ def get_company_info(symbol):
         else: category, currency = "美股 (US)", "USD"
         return {"name": info['name'], "category": category, "currency": currency}
     try:
-        ticker = yf.Ticker(symbol)
-        yf_info = ticker.info
         name = yf_info.get('longName') or yf_info.get('shortName') or symbol
         currency = yf_info.get('currency') or "USD"
         quote_type = yf_info.get('quoteType', '')
@@ -306,192 +1153,201 @@ def get_company_info(symbol):
     except Exception:
         return {"name": symbol, "category": "未分類", "currency": "USD"}
 
+@shared_cache(ttl=3600)
+def get_company_info(symbol):
+    if symbol in FULL_SYMBOLS_MAP: return build_company_info(symbol, None)
+    return build_company_info(symbol, fetch_or_default(get_ticker_info, symbol, stale_key=('info', symbol)))
+
+def format_currency_symbol(currency_code):
+    return 'NT$' if currency_code == 'TWD' else '$' if currency_code == 'USD' else currency_code + ' '
+
 @st.cache_data
 def get_currency_symbol(symbol):
-    currency_code = get_company_info(symbol).get('currency', 'USD')
-    return 'NT$' if currency_code == 'TWD' else '$' if currency_code == 'USD' else currency_code + ' '
+    return format_currency_symbol(get_company_info(symbol).get('currency', 'USD'))
 
 
 # ==============================================================================
 # 3. 專業級 TP/SL 策略函式 (已啟用)
 # ==============================================================================
 
-def support_resistance(df, lookback=60):
-    df['Support'] = df['Low'].rolling(window=lookback).min()
-    df['Resistance'] = df['High'].rolling(window=lookback).max()
-    df['Volume_Filter'] = df['Volume'] > df['Volume'].rolling(50).mean() * 1.3
-    df['SL'] = df['Support'] * 0.98
-    df['TP'] = df['Resistance'] * 1.02
-    return df
+# 各策略只從指標快取 (IndicatorCache) 取用所需指標，回傳新的 SL/TP 結果表，不修改輸入資料
+def support_resistance(df, lookback=60, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    out = pd.DataFrame(index=df.index)
+    out['Support'] = ctx.get('rolling_min', column='Low', window=lookback)
+    out['Resistance'] = ctx.get('rolling_max', column='High', window=lookback)
+    out['Volume_Filter'] = df['Volume'] > ctx.get('sma', column='Volume', window=50) * 1.3
+    out['SL'] = out['Support'] * 0.98
+    out['TP'] = out['Resistance'] * 1.02
+    return out
 
-def bollinger_bands_strategy(df, period=50, dev=2.5):
-    df['SMA'] = df['Close'].rolling(window=period).mean()
-    df['STD'] = df['Close'].rolling(window=period).std()
-    df['Upper'] = df['SMA'] + (df['STD'] * dev)
-    df['Lower'] = df['SMA'] - (df['STD'] * dev)
-    df['RSI'] = pandas_rsi(df['Close'], 14)
-    df['Volume_Filter'] = df['Volume'] > df['Volume'].rolling(50).mean() * 1.2
+def bollinger_bands_strategy(df, period=50, dev=2.5, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    out = pd.DataFrame(index=df.index)
+    out['SMA'] = ctx.get('sma', column='Close', window=period)
+    out['STD'] = ctx.get('rolling_std', column='Close', window=period)
+    out['Upper'] = out['SMA'] + (out['STD'] * dev)
+    out['Lower'] = out['SMA'] - (out['STD'] * dev)
+    out['RSI'] = ctx.get('rsi', period=14)
+    out['Volume_Filter'] = df['Volume'] > ctx.get('sma', column='Volume', window=50) * 1.2
     
     # 買進條件: RSI超賣且爆量； 賣出條件: RSI超買且爆量
-    buy_condition = (df['RSI'] < 30) & df['Volume_Filter']
-    sell_condition = (df['RSI'] > 70) & df['Volume_Filter']
-    
-    # 預設SL/TP為NaN
-    df['SL'] = np.nan
-    df['TP'] = np.nan
+    buy_condition = (out['RSI'] < 30) & out['Volume_Filter']
+    sell_condition = (out['RSI'] > 70) & out['Volume_Filter']
     
-    # 當前趨勢判斷 (基於SMA)
-    if df['Close'].iloc[-1] > df['SMA'].iloc[-1]: # 多頭趨勢
-        df['SL'] = df['Lower']
-        df['TP'] = df['Upper']
-    else: # 空頭趨勢
-        df['SL'] = df['Upper']
-        df['TP'] = df['Lower']
-    return df
+    # 趨勢判斷 (基於SMA) 逐根K棒進行：多頭下軌為SL、上軌為TP，空頭相反 (每根K棒只用到當時已知的數據)
+    bullish = df['Close'] > out['SMA']
+    out['SL'] = np.where(bullish, out['Lower'], out['Upper'])
+    out['TP'] = np.where(bullish, out['Upper'], out['Lower'])
+    return out
 
-def atr_stop(df, period=21, multiplier_sl=2.5, multiplier_tp=5):
-    df['ATR'] = pandas_atr(df, period=period)
-    df['ADX'] = pandas_adx(df, period=14)
-    df['Trend_Filter'] = df['ADX'] > 25
+def atr_stop(df, period=21, multiplier_sl=2.5, multiplier_tp=5, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    out = pd.DataFrame(index=df.index)
+    out['ATR'] = ctx.get('atr', period=period)
+    out['ADX'] = ctx.get('adx', period=14)
+    out['Trend_Filter'] = out['ADX'] > 25
     
     # 根據趨勢設定SL/TP
-    df['SL'] = np.where(df['Trend_Filter'], df['Close'] - (df['ATR'] * multiplier_sl), np.nan)
-    df['TP'] = np.where(df['Trend_Filter'], df['Close'] + (df['ATR'] * multiplier_tp), np.nan)
-    return df
+    out['SL'] = np.where(out['Trend_Filter'], df['Close'] - (out['ATR'] * multiplier_sl), np.nan)
+    out['TP'] = np.where(out['Trend_Filter'], df['Close'] + (out['ATR'] * multiplier_tp), np.nan)
+    return out
 
-def donchian_channel(df, period=50):
-    df['Upper'] = df['High'].rolling(window=period).max()
-    df['Lower'] = df['Low'].rolling(window=period).min()
-    df['MACD_Line'], _, _ = pandas_macd(df['Close'])
-    df['Volume_Filter'] = df['Volume'] > df['Volume'].rolling(50).mean() * 1.3
+def donchian_channel(df, period=50, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    out = pd.DataFrame(index=df.index)
+    out['Upper'] = ctx.get('rolling_max', column='High', window=period)
+    out['Lower'] = ctx.get('rolling_min', column='Low', window=period)
+    out['MACD_Line'] = ctx.get('macd')[0]
+    out['Volume_Filter'] = df['Volume'] > ctx.get('sma', column='Volume', window=50) * 1.3
     
-    buy_signal = (df['MACD_Line'] > 0) & df['Volume_Filter']
-    sell_signal = (df['MACD_Line'] < 0) & df['Volume_Filter']
+    buy_signal = (out['MACD_Line'] > 0) & out['Volume_Filter']
+    sell_signal = (out['MACD_Line'] < 0) & out['Volume_Filter']
     
-    df['SL'] = np.where(buy_signal, df['Lower'], np.nan)
-    df['TP'] = np.where(buy_signal, df['Upper'], np.nan)
-    return df
+    out['SL'] = np.where(buy_signal, out['Lower'], np.nan)
+    out['TP'] = np.where(buy_signal, out['Upper'], np.nan)
+    return out
 
-def keltner_channel(df, period=30, atr_multiplier=2.5, atr_period=14):
-    df['EMA'] = df['Close'].ewm(span=period, adjust=False).mean()
-    df['ATR'] = pandas_atr(df, period=atr_period)
-    df['Upper'] = df['EMA'] + (df['ATR'] * atr_multiplier)
-    df['Lower'] = df['EMA'] - (df['ATR'] * atr_multiplier)
-    df['OBV'] = (np.sign(df['Close'].diff()) * df['Volume']).fillna(0).cumsum()
-    df['OBV_Filter'] = df['OBV'] > df['OBV'].shift(1)
+def keltner_channel(df, period=30, atr_multiplier=2.5, atr_period=14, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    out = pd.DataFrame(index=df.index)
+    out['EMA'] = ctx.get('ema', span=period)
+    out['ATR'] = ctx.get('atr', period=atr_period)
+    out['Upper'] = out['EMA'] + (out['ATR'] * atr_multiplier)
+    out['Lower'] = out['EMA'] - (out['ATR'] * atr_multiplier)
+    out['OBV'] = ctx.get('obv')
+    out['OBV_Filter'] = out['OBV'] > out['OBV'].shift(1)
     
     # 多頭趨勢下，下軌為支撐(SL)，上軌為目標(TP)
-    df['SL'] = np.where(df['OBV_Filter'], df['Lower'], np.nan)
-    df['TP'] = np.where(df['OBV_Filter'], df['Upper'], np.nan)
-    return df
+    out['SL'] = np.where(out['OBV_Filter'], out['Lower'], np.nan)
+    out['TP'] = np.where(out['OBV_Filter'], out['Upper'], np.nan)
+    return out
 
-def ichimoku_cloud(df):
-    high_9 = df['High'].rolling(9).max()
-    low_9 = df['High'].rolling(9).min()
-    df['Tenkan'] = (high_9 + low_9) / 2
+def ichimoku_cloud(df, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    out = pd.DataFrame(index=df.index)
+    high_9 = ctx.get('rolling_max', column='High', window=9)
+    low_9 = ctx.get('rolling_min', column='Low', window=9)
+    out['Tenkan'] = (high_9 + low_9) / 2
     
-    high_26 = df['High'].rolling(26).max()
-    low_26 = df['Low'].rolling(26).min()
-    df['Kijun'] = (high_26 + low_26) / 2
+    high_26 = ctx.get('rolling_max', column='High', window=26)
+    low_26 = ctx.get('rolling_min', column='Low', window=26)
+    out['Kijun'] = (high_26 + low_26) / 2
     
-    df['Senkou_A'] = ((df['Tenkan'] + df['Kijun']) / 2).shift(26)
+    out['Senkou_A'] = ((out['Tenkan'] + out['Kijun']) / 2).shift(26)
     
-    high_52 = df['High'].rolling(52).max()
-    low_52 = df['Low'].rolling(52).min()
-    df['Senkou_B'] = ((high_52 + low_52) / 2).shift(26)
+    high_52 = ctx.get('rolling_max', column='High', window=52)
+    low_52 = ctx.get('rolling_min', column='Low', window=52)
+    out['Senkou_B'] = ((high_52 + low_52) / 2).shift(26)
     
-    # 價格在雲之上，雲層為支撐區；反之為壓力區
+    # 價格在雲之上，雲層為支撐區；反之為壓力區 (逐根K棒判斷)
     price = df['Close']
-    if price.iloc[-1] > df['Senkou_A'].iloc[-1] and price.iloc[-1] > df['Senkou_B'].iloc[-1]:
-        df['SL'] = df[['Senkou_A', 'Senkou_B']].min(axis=1)
-        df['TP'] = price + (price - df['SL']) * 2 # 簡單的目標價
-    else:
-        df['TP'] = df[['Senkou_A', 'Senkou_B']].min(axis=1)
-        df['SL'] = df[['Senkou_A', 'Senkou_B']].max(axis=1)
-    return df
+    above = (price > out['Senkou_A']) & (price > out['Senkou_B'])
+    cloud_low, cloud_high = out[['Senkou_A', 'Senkou_B']].min(axis=1), out[['Senkou_A', 'Senkou_B']].max(axis=1)
+    out['SL'] = np.where(above, cloud_low, cloud_high)
+    out['TP'] = np.where(above, price + (price - cloud_low) * 2, cloud_low) # 簡單的目標價
+    return out
 
-def ma_crossover(df, fast=20, slow=50):
-    df['Fast_MA'] = df['Close'].ewm(span=fast, adjust=False).mean()
-    df['Slow_MA'] = df['Close'].ewm(span=slow, adjust=False).mean()
-    df['OBV'] = (np.sign(df['Close'].diff()) * df['Volume']).fillna(0).cumsum()
-    df['OBV_Filter'] = df['OBV'] > df['OBV'].shift(1)
+def ma_crossover(df, fast=20, slow=50, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    out = pd.DataFrame(index=df.index)
+    out['Fast_MA'] = ctx.get('ema', span=fast)
+    out['Slow_MA'] = ctx.get('ema', span=slow)
+    out['OBV'] = ctx.get('obv')
+    out['OBV_Filter'] = out['OBV'] > out['OBV'].shift(1)
 
     # 黃金交叉且OBV向上，慢線為支撐；死亡交叉則快線為壓力
-    is_golden_cross = df['Fast_MA'] > df['Slow_MA']
+    is_golden_cross = out['Fast_MA'] > out['Slow_MA']
     
-    df['SL'] = np.where(is_golden_cross & df['OBV_Filter'], df['Slow_MA'], df['Fast_MA'])
-    df['TP'] = np.where(is_golden_cross & df['OBV_Filter'], df['Fast_MA'] * 1.05, df['Slow_MA'] * 0.95) # 示例目標
-    return df
+    out['SL'] = np.where(is_golden_cross & out['OBV_Filter'], out['Slow_MA'], out['Fast_MA'])
+    out['TP'] = np.where(is_golden_cross & out['OBV_Filter'], out['Fast_MA'] * 1.05, out['Slow_MA'] * 0.95) # 示例目標
+    return out
 
-def vwap_strategy(df):
-    df['Cum_Vol'] = df['Volume'].cumsum()
-    df['Cum_Vol_Price'] = (df['Volume'] * (df['High'] + df['Low'] + df['Close']) / 3).cumsum()
-    df['VWAP'] = df['Cum_Vol_Price'] / df['Cum_Vol']
+def vwap_strategy(df, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    out = pd.DataFrame(index=df.index)
+    out['VWAP'] = ctx.get('vwap')
     
     # VWAP 作為動態支撐/阻力
-    df['SL'] = df['VWAP'] * 0.98
-    df['TP'] = df['VWAP'] * 1.02
-    return df
+    out['SL'] = out['VWAP'] * 0.98
+    out['TP'] = out['VWAP'] * 1.02
+    return out
 
-def trailing_stop(df, atr_period=14, atr_multiplier=3):
-    df['ATR'] = pandas_atr(df, period=atr_period)
-    df['SL'] = df['Close'] - (df['ATR'] * atr_multiplier)
-    df['TP'] = df['Close'] + (df['ATR'] * 2 * atr_multiplier) # R:R=2:1
-    return df
+def trailing_stop(df, atr_period=14, atr_multiplier=3, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    out = pd.DataFrame(index=df.index)
+    out['ATR'] = ctx.get('atr', period=atr_period)
+    # 棘輪式ATR移動止損：持多時止損只上移、持空時只下移，價格穿越即翻轉
+    out['Trail_Stop'], out['Trail_Dir'] = atr_trailing_stop_kernel(_as_float_array(df['Close']), _as_float_array(out['ATR']), float(atr_multiplier))
+    out['SL'] = out['Trail_Stop']
+    out['TP'] = df['Close'] + (df['Close'] - out['Trail_Stop']) * 2 # R:R=2:1
+    return out
 
-def chandelier_exit(df, period=22, atr_multiplier=3.5):
-    df['ATR'] = pandas_atr(df, period=14)
-    df['High_Max'] = df['High'].rolling(window=period).max()
-    df['Low_Min'] = df['Low'].rolling(window=period).min()
+def chandelier_exit(df, period=22, atr_multiplier=3.5, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    out = pd.DataFrame(index=df.index)
+    out['ATR'] = ctx.get('atr', period=14)
+    out['High_Max'] = ctx.get('rolling_max', column='High', window=period)
+    out['Low_Min'] = ctx.get('rolling_min', column='Low', window=period)
     
-    # Chandelier Exit (Long and Short)
-    df['SL_Long'] = df['High_Max'] - df['ATR'] * atr_multiplier
-    df['TP_Short'] = df['Low_Min'] + df['ATR'] * atr_multiplier
+    # Chandelier Exit (Long and Short)，多頭止損只上移、空頭止損只下移
+    out['SL_Long'], out['TP_Short'], out['Chandelier_Dir'] = chandelier_exit_kernel(
+        _as_float_array(df['Close']), _as_float_array(out['High_Max']), _as_float_array(out['Low_Min']),
+        _as_float_array(out['ATR']), float(atr_multiplier))
     
-    # 根據當前價格位置決定使用多頭或空頭止損
-    if df['Close'].iloc[-1] > df['Close'].iloc[-period]: # 簡易上升趨勢
-        df['SL'] = df['SL_Long']
-        df['TP'] = df['Close'].iloc[-1] + (df['Close'].iloc[-1] - df['SL_Long'].iloc[-1]) * 2
-    else:
-        df['SL'] = df['TP_Short'] # 在空頭趨勢中， chandelier exit (short) 可作為止損
-        df['TP'] = df['Close'].iloc[-1] - (df['TP_Short'].iloc[-1] - df['Close'].iloc[-1]) * 2
-    return df
+    # 根據每根K棒的吊燈停損多空方向決定使用多頭或空頭止損 (空頭時 chandelier exit (short) 作為止損)
+    close, bullish = df['Close'], out['Chandelier_Dir'] > 0
+    out['SL'] = np.where(bullish, out['SL_Long'], out['TP_Short'])
+    out['TP'] = np.where(bullish, close + (close - out['SL_Long']) * 2, close - (out['TP_Short'] - close) * 2)
+    return out
 
-def supertrend(df, period=14, multiplier=3.5):
-    df['ATR'] = pandas_atr(df, period=period)
-    df['Upper_Band'] = ((df['High'] + df['Low']) / 2) + (multiplier * df['ATR'])
-    df['Lower_Band'] = ((df['High'] + df['Low']) / 2) - (multiplier * df['ATR'])
-    
-    df['Supertrend'] = df['Lower_Band'] # 預設
-    for i in range(1, len(df)):
-        if df['Close'].iloc[i-1] <= df['Supertrend'].iloc[i-1]:
-            df.loc[df.index[i], 'Supertrend'] = min(df['Upper_Band'].iloc[i], df['Supertrend'].iloc[i-1])
-        else:
-            df.loc[df.index[i], 'Supertrend'] = max(df['Lower_Band'].iloc[i], df['Supertrend'].iloc[i-1])
+def supertrend(df, period=14, multiplier=3.5, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    out = pd.DataFrame(index=df.index)
+    out['ATR'] = ctx.get('atr', period=period)
+    out['Upper_Band'] = ((df['High'] + df['Low']) / 2) + (multiplier * out['ATR'])
+    out['Lower_Band'] = ((df['High'] + df['Low']) / 2) - (multiplier * out['ATR'])
+    out['Supertrend'] = supertrend_kernel(_as_float_array(df['Close']), _as_float_array(out['Upper_Band']), _as_float_array(out['Lower_Band']))
             
-    if df['Close'].iloc[-1] > df['Supertrend'].iloc[-1]: # 上升趨勢
-        df['SL'] = df['Supertrend']
-        df['TP'] = df['Close'] + (df['Close'] - df['Supertrend']) * 2
-    else: # 下降趨勢
-        df['SL'] = df['Supertrend']
-        df['TP'] = df['Close'] - (df['Supertrend'] - df['Close']) * 2
-    return df
+    # 上升趨勢 TP = 收盤 + 2 × (收盤 - 超級趨勢)，下降趨勢 TP = 收盤 - 2 × (超級趨勢 - 收盤)：兩者代數上相同，逐根K棒成立
+    out['SL'] = out['Supertrend']
+    out['TP'] = df['Close'] + (df['Close'] - out['Supertrend']) * 2
+    return out
 
-def pivot_points(df):
-    df['Pivot'] = (df['High'].shift(1) + df['Low'].shift(1) + df['Close'].shift(1)) / 3
-    df['S1'] = (2 * df['Pivot']) - df['High'].shift(1)
-    df['R1'] = (2 * df['Pivot']) - df['Low'].shift(1)
-    df['S2'] = df['Pivot'] - (df['High'].shift(1) - df['Low'].shift(1))
-    df['R2'] = df['Pivot'] + (df['High'].shift(1) - df['Low'].shift(1))
+def pivot_points(df, ctx=None):
+    out = pd.DataFrame(index=df.index)
+    prev_high, prev_low, prev_close = df['High'].shift(1), df['Low'].shift(1), df['Close'].shift(1)
+    out['Pivot'] = (prev_high + prev_low + prev_close) / 3
+    out['S1'] = (2 * out['Pivot']) - prev_high
+    out['R1'] = (2 * out['Pivot']) - prev_low
+    out['S2'] = out['Pivot'] - (prev_high - prev_low)
+    out['R2'] = out['Pivot'] + (prev_high - prev_low)
     
-    price = df['Close']
-    if price.iloc[-1] > df['Pivot'].iloc[-1]: # 價格在樞軸點之上
-        df['SL'] = df['S1']
-        df['TP'] = df['R1']
-    else: # 價格在樞軸點之下
-        df['SL'] = df['R1']
-        df['TP'] = df['S1']
-    return df
+    # 價格在樞軸點之上：S1 為SL、R1 為TP；之下則相反 (逐根K棒判斷)
+    above = df['Close'] > out['Pivot']
+    out['SL'] = np.where(above, out['S1'], out['R1'])
+    out['TP'] = np.where(above, out['R1'], out['S1'])
+    return out
 
 # 策略字典
 STRATEGY_FUNCTIONS = {
@@ -522,23 +1378,26 @@ def pandas_rsi(close, period=14):
     rs = avg_gain / avg_loss
     return 100 - (100 / (1 + rs))
 
-def pandas_atr(df, period=14):
+def pandas_true_range(df):
     high_low = df['High'] - df['Low']
     high_close = np.abs(df['High'] - df['Close'].shift())
     low_close = np.abs(df['Low'] - df['Close'].shift())
-    ranges = pd.concat([high_low, high_close, low_close], axis=1)
-    true_range = np.max(ranges, axis=1)
+    # 逐元素取最大值並忽略缺值，單一標的序列與多標的面板 (K棒 × 代碼) 皆適用
+    return np.fmax(np.fmax(high_low, high_close), low_close)
+
+def pandas_atr(df, period=14, true_range=None):
+    true_range = pandas_true_range(df) if true_range is None else true_range
     return true_range.ewm(alpha=1/period, adjust=False).mean()
 
-def pandas_adx(df, period=14):
-    atr = pandas_atr(df, period)
+def pandas_adx(df, period=14, atr=None):
+    atr = pandas_atr(df, period) if atr is None else atr
     up_move = df['High'].diff()
-    down_move = df['Low'].diff()
-    plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0)
-    minus_dm = np.where((down_move > up_move) & (down_move > 0), -down_move, 0)
+    down_move = -df['Low'].diff()
+    plus_dm = up_move.where((up_move > down_move) & (up_move > 0), 0)
+    minus_dm = down_move.where((down_move > up_move) & (down_move > 0), 0)
     
-    plus_di = 100 * (pd.Series(plus_dm).ewm(alpha=1/period, adjust=False).mean() / atr)
-    minus_di = 100 * (pd.Series(minus_dm).ewm(alpha=1/period, adjust=False).mean() / atr)
+    plus_di = 100 * (plus_dm.ewm(alpha=1/period, adjust=False).mean() / atr)
+    minus_di = 100 * (minus_dm.ewm(alpha=1/period, adjust=False).mean() / atr)
     
     dx = 100 * (np.abs(plus_di - minus_di) / (plus_di + minus_di))
     return dx.ewm(alpha=1/period, adjust=False).mean()
@@ -551,39 +1410,442 @@ def pandas_macd(close, fast=8, slow=17, signal=9):
     macd_hist = macd_line - macd_signal
     return macd_line, macd_signal, macd_hist
 
-def calculate_technical_indicators(df):
-    df['EMA_10'] = df['Close'].ewm(span=10, adjust=False).mean()
-    df['EMA_50'] = df['Close'].ewm(span=50, adjust=False).mean()
-    df['EMA_200'] = df['Close'].ewm(span=200, adjust=False).mean()
-    df['SMA_20'] = df['Close'].rolling(window=20).mean()
+# --- 指標註冊表：每個指標宣告其參數與相依指標，同一份數據 (版本) 與參數只計算一次 ---
+INDICATOR_REGISTRY = {}
+INDICATOR_CACHE_SIZE = 32
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+def ohlcv_view(df):
+    # 已經只有 OHLCV 欄位時直接沿用，避免再複製一份
+    return df if list(df.columns) == OHLCV_COLUMNS else df[OHLCV_COLUMNS]
+
+def downcast_if_low_memory(obj):
+    if not PIPELINE_LOW_MEMORY: return obj
+    if isinstance(obj, pd.Series) and obj.dtype == np.float64: return obj.astype(np.float32)
+    if isinstance(obj, pd.DataFrame): return obj.astype({c: np.float32 for c, dtype in obj.dtypes.items() if dtype == np.float64})
+    return obj
+
+def register_indicator(name):
+    def decorator(func):
+        INDICATOR_REGISTRY[name] = func
+        return func
+    return decorator
+
+class IndicatorCache:
+    def __init__(self, df):
+        self.df = df
+        self._memo = {}
+        self._lock = threading.RLock()
+
+    def get(self, name, **params):
+        key = (name, tuple(sorted(params.items())))
+        with self._lock:
+            if key not in self._memo:
+                self._memo[key] = downcast_if_low_memory(INDICATOR_REGISTRY[name](self, **params))
+            return self._memo[key]
+
+def data_version(df):
+    # 只以 OHLCV 內容判斷版本，計算後附加的指標欄位不影響
+    ohlcv = ohlcv_view(df)
+    if ohlcv.empty: return (0,)
+    return (len(ohlcv), ohlcv.index[0], ohlcv.index[-1], int(pd.util.hash_pandas_object(ohlcv, index=True).sum()))
+
+_INDICATOR_CACHES = {}
+_INDICATOR_CACHES_LOCK = threading.Lock()
+
+def get_indicator_cache(df):
+    version = data_version(df)
+    with _INDICATOR_CACHES_LOCK:
+        ctx = _INDICATOR_CACHES.pop(version, None) or IndicatorCache(ohlcv_view(df))
+        _INDICATOR_CACHES[version] = ctx # 重新插入以維持 LRU 順序
+        while len(_INDICATOR_CACHES) > INDICATOR_CACHE_SIZE: _INDICATOR_CACHES.pop(next(iter(_INDICATOR_CACHES)))
+    return ctx
+
+_COMPACT_BLOCKS = {}
+_COMPACT_BLOCKS_LOCK = threading.Lock()
+
+def compact_ohlcv(df):
+    # 低記憶體模式：同一份 OHLCV 在程序內只保留一個唯讀的 float32 區塊，同時分析相同標的的工作階段共用
+    version = data_version(df)
+    with _COMPACT_BLOCKS_LOCK:
+        compact = _COMPACT_BLOCKS.pop(version, None)
+        if compact is None:
+            block = np.asfortranarray(ohlcv_view(df).to_numpy(dtype=np.float32)) # 欄優先，每個欄位都是連續記憶體
+            block.setflags(write=False)
+            compact = pd.DataFrame(block, index=df.index, columns=OHLCV_COLUMNS, copy=False)
+        _COMPACT_BLOCKS[version] = compact
+        while len(_COMPACT_BLOCKS) > INDICATOR_CACHE_SIZE: _COMPACT_BLOCKS.pop(next(iter(_COMPACT_BLOCKS)))
+    return compact
+
+@register_indicator('sma')
+def _indicator_sma(ctx, column='Close', window=20):
+    return ctx.df[column].rolling(window=window).mean()
+
+@register_indicator('rolling_std')
+def _indicator_rolling_std(ctx, column='Close', window=20):
+    return ctx.df[column].rolling(window=window).std()
+
+class RangeExtremaIndex:
+    # 區間極值索引 (稀疏表)：第 k 層保存每個起點往後 2^k 根的極值，任意視窗的極值由兩段重疊的 2^k 區段一次取得，
+    # 每個視窗只需一次向量化運算；只建到查詢過的最大視窗所需的層數。沿第 0 軸計算，單一序列與 (K棒 × 代碼) 面板皆適用，
+    # NaN 與 pandas rolling 相同會使涵蓋它的視窗為 NaN
+    def __init__(self, values, op):
+        self.op = op
+        self.levels = [np.asarray(values, dtype=np.float64)]
+
+    def _level(self, k):
+        while len(self.levels) <= k:
+            prev, half = self.levels[-1], 1 << (len(self.levels) - 1)
+            self.levels.append(self.op(prev[:-half], prev[half:]))
+        return self.levels[k]
+
+    def rolling(self, window):
+        n = len(self.levels[0])
+        out = np.full(self.levels[0].shape, np.nan)
+        if window < 1 or window > n: return out
+        k = window.bit_length() - 1
+        span, table = 1 << k, self._level(k)
+        out[window - 1:] = self.op(table[:n - window + 1], table[window - span:n - span + 1])
+        return out
+
+    def rolling_many(self, windows):
+        # 一次產生多個視窗 (例如回看期間的參數掃描)，回傳 (視窗數, ...) 陣列
+        return np.stack([self.rolling(window) for window in windows])
+
+def _wrap_like(template, values):
+    if isinstance(template, pd.DataFrame): return pd.DataFrame(values, index=template.index, columns=template.columns)
+    return pd.Series(values, index=template.index, name=template.name)
+
+@register_indicator('range_index')
+def _indicator_range_index(ctx, column='High', kind='max'):
+    # 每個欄位只建一次，所有策略與參數組合的滾動高低點都由同一份索引查詢
+    return RangeExtremaIndex(ctx.df[column].to_numpy(dtype=np.float64, na_value=np.nan), np.maximum if kind == 'max' else np.minimum)
+
+@register_indicator('rolling_max')
+def _indicator_rolling_max(ctx, column='High', window=20):
+    return _wrap_like(ctx.df[column], ctx.get('range_index', column=column, kind='max').rolling(window))
+
+@register_indicator('rolling_min')
+def _indicator_rolling_min(ctx, column='Low', window=20):
+    return _wrap_like(ctx.df[column], ctx.get('range_index', column=column, kind='min').rolling(window))
+
+@register_indicator('ema')
+def _indicator_ema(ctx, span=20):
+    return ctx.df['Close'].ewm(span=span, adjust=False).mean()
+
+@register_indicator('rsi')
+def _indicator_rsi(ctx, period=14):
+    return pandas_rsi(ctx.df['Close'], period)
+
+@register_indicator('macd')
+def _indicator_macd(ctx, fast=8, slow=17, signal=9):
+    return pandas_macd(ctx.df['Close'], fast, slow, signal)
+
+@register_indicator('true_range')
+def _indicator_true_range(ctx):
+    return pandas_true_range(ctx.df)
+
+@register_indicator('atr')
+def _indicator_atr(ctx, period=14):
+    return pandas_atr(ctx.df, period, true_range=ctx.get('true_range'))
+
+@register_indicator('adx')
+def _indicator_adx(ctx, period=14):
+    return pandas_adx(ctx.df, period, atr=ctx.get('atr', period=period))
+
+# 累加型指標一律以 float64 累加：低記憶體模式的 float32 OHLCV 直接 cumsum 會逐根累積捨入誤差，只有結果再降為 float32
+@register_indicator('obv')
+def _indicator_obv(ctx):
+    return (np.sign(ctx.df['Close'].diff()) * ctx.df['Volume'].astype(np.float64)).fillna(0).cumsum()
+
+@register_indicator('vwap')
+def _indicator_vwap(ctx):
+    df = ctx.df.astype(np.float64)
+    return (df['Volume'] * (df['High'] + df['Low'] + df['Close']) / 3).cumsum() / df['Volume'].cumsum()
+
+# --- 遞迴(路徑相依)指標核心：單次掃過 NumPy 陣列，安裝 numba 時自動 JIT 編譯 ---
+def jit_kernel(func):
+    return njit(cache=True, nogil=True)(func) if njit is not None else func
+
+def _as_float_array(series):
+    return np.ascontiguousarray(series.to_numpy(dtype=np.float64, na_value=np.nan))
+
+@jit_kernel
+def supertrend_kernel(close, upper_band, lower_band):
+    n = close.shape[0]
+    out = np.empty(n)
+    if n == 0: return out
+    out[0] = lower_band[0]
+    for i in range(1, n):
+        prev = out[i - 1]
+        # 與內建 min()/max() 相同的比較語意 (含 NaN 行為)
+        if close[i - 1] <= prev:
+            out[i] = prev if prev < upper_band[i] else upper_band[i]
+        else:
+            out[i] = prev if prev > lower_band[i] else lower_band[i]
+    return out
+
+@jit_kernel
+def atr_trailing_stop_kernel(close, atr, multiplier):
+    n = close.shape[0]
+    stop = np.full(n, np.nan)
+    direction = np.zeros(n)
+    current_dir = 1.0
+    for i in range(n):
+        long_stop = close[i] - atr[i] * multiplier
+        short_stop = close[i] + atr[i] * multiplier
+        prev = stop[i - 1] if i > 0 else np.nan
+        if np.isnan(prev):
+            stop[i] = long_stop if current_dir > 0 else short_stop
+        elif current_dir > 0:
+            if close[i] < prev: current_dir = -1.0; stop[i] = short_stop
+            else: stop[i] = max(prev, long_stop)
+        else:
+            if close[i] > prev: current_dir = 1.0; stop[i] = long_stop
+            else: stop[i] = min(prev, short_stop)
+        direction[i] = current_dir
+    return stop, direction
+
+@jit_kernel
+def chandelier_exit_kernel(close, high_max, low_min, atr, multiplier):
+    n = close.shape[0]
+    long_stop = high_max - atr * multiplier
+    short_stop = low_min + atr * multiplier
+    direction = np.ones(n)
+    for i in range(1, n):
+        prev_long, prev_short = long_stop[i - 1], short_stop[i - 1]
+        if not np.isnan(prev_long) and close[i - 1] > prev_long: long_stop[i] = max(long_stop[i], prev_long)
+        if not np.isnan(prev_short) and close[i - 1] < prev_short: short_stop[i] = min(short_stop[i], prev_short)
+        if close[i] > prev_short: direction[i] = 1.0
+        elif close[i] < prev_long: direction[i] = -1.0
+        else: direction[i] = direction[i - 1]
+    return long_stop, short_stop, direction
+
+def calculate_technical_indicators(df, ctx=None):
+    ctx = ctx if ctx is not None else get_indicator_cache(df)
+    df['EMA_10'] = ctx.get('ema', span=10)
+    df['EMA_50'] = ctx.get('ema', span=50)
+    df['EMA_200'] = ctx.get('ema', span=200)
+    df['SMA_20'] = ctx.get('sma', column='Close', window=20)
     
-    df['MACD_Line'], df['MACD_Signal'], df['MACD_Hist'] = pandas_macd(df['Close'])
-    df['RSI'] = pandas_rsi(df['Close'], period=9)
+    df['MACD_Line'], df['MACD_Signal'], df['MACD_Hist'] = ctx.get('macd')
+    df['RSI'] = ctx.get('rsi', period=9)
     
-    sma20 = df['Close'].rolling(window=20).mean()
-    std20 = df['Close'].rolling(window=20).std()
+    sma20 = df['SMA_20']
+    std20 = ctx.get('rolling_std', column='Close', window=20)
     df['BB_High'] = sma20 + (std20 * 2)
     df['BB_Low'] = sma20 - (std20 * 2)
     
-    df['ATR'] = pandas_atr(df, period=9)
-    df['ADX'] = pandas_adx(df, period=9)
+    df['ATR'] = ctx.get('atr', period=9)
+    df['ADX'] = ctx.get('adx', period=9)
     
-    df['OBV'] = (np.sign(df['Close'].diff()) * df['Volume']).fillna(0).cumsum()
-    df['Volume_MA_20'] = df['Volume'].rolling(window=20).mean()
+    df['OBV'] = ctx.get('obv')
+    df['Volume_MA_20'] = ctx.get('sma', column='Volume', window=20)
     df['OBV_MA_20'] = df['OBV'].rolling(window=20).mean()
     return df
 
-@st.cache_data(ttl=3600)
-def get_chips_and_news_analysis(symbol):
+# --- 串流指標引擎：保存各序列的遞迴狀態，每根新K棒 O(1) 更新，結果與批次函式一致 ---
+class _EwmState:
+    # 逐步重現 pandas ewm(adjust, ignore_na=False) 的遞迴公式
+    __slots__ = ('alpha', 'adjust', 'min_periods', 'weighted', 'old_wt', 'nobs', 'started')
+
+    def __init__(self, alpha, adjust=False, min_periods=0):
+        self.alpha, self.adjust, self.min_periods = alpha, adjust, max(min_periods, 1)
+        self.weighted, self.old_wt, self.nobs, self.started = np.nan, 1.0, 0, False
+
+    def update(self, value):
+        is_obs = value == value
+        if not self.started:
+            self.started, self.weighted, self.nobs = True, value, int(is_obs)
+        else:
+            self.nobs += is_obs
+            if self.weighted == self.weighted:
+                self.old_wt *= 1 - self.alpha
+                if is_obs:
+                    new_wt = 1.0 if self.adjust else self.alpha
+                    if self.weighted != value:
+                        self.weighted = (self.old_wt * self.weighted + new_wt * value) / (self.old_wt + new_wt)
+                    self.old_wt = self.old_wt + new_wt if self.adjust else 1.0
+            elif is_obs:
+                self.weighted = value
+        return self.weighted if self.nobs >= self.min_periods else np.nan
+
+    def seed(self, values):
+        # 以整段輸入一次設定狀態 (等同逐一 update)：加權值取 pandas ewm 的最後一筆，
+        # 權重和 old_wt 依各觀測值距今的步數衰減累加 (adjust=False 時只剩最後一筆觀測)
+        if not len(values): return
+        observed = np.flatnonzero(~np.isnan(values))
+        self.started, self.nobs = True, len(observed)
+        self.weighted = pd.Series(values).ewm(alpha=self.alpha, adjust=self.adjust).mean().iloc[-1]
+        if not len(observed): return
+        ages = len(values) - 1 - (observed if self.adjust else observed[-1:])
+        self.old_wt = float(((1 - self.alpha) ** ages).sum())
+
+class _RollingWindow:
+    __slots__ = ('values',)
+
+    def __init__(self, window):
+        self.values = deque(maxlen=window)
+
+    def update(self, value):
+        self.values.append(value)
+        return self
+
+    def seed(self, values):
+        self.values.clear()
+        self.values.extend(values[-self.values.maxlen:])
+
+    def mean(self):
+        if len(self.values) < self.values.maxlen: return np.nan
+        return sum(self.values) / len(self.values)
+
+    def std(self):
+        if len(self.values) < self.values.maxlen: return np.nan
+        mean = sum(self.values) / len(self.values)
+        return (sum((v - mean) ** 2 for v in self.values) / (len(self.values) - 1)) ** 0.5
+
+class StreamingIndicatorEngine:
+    # 與 calculate_technical_indicators 相同的欄位與參數
+    COLUMNS = ['EMA_10', 'EMA_50', 'EMA_200', 'SMA_20', 'MACD_Line', 'MACD_Signal', 'MACD_Hist', 'RSI',
+               'BB_High', 'BB_Low', 'ATR', 'ADX', 'OBV', 'Volume_MA_20', 'OBV_MA_20']
+
+    def __init__(self, rsi_period=9, atr_period=9, macd_params=(8, 17, 9), window=20):
+        fast, slow, signal = macd_params
+        self.ema = {name: _EwmState(2 / (span + 1)) for name, span in (('EMA_10', 10), ('EMA_50', 50), ('EMA_200', 200))}
+        self.macd_fast, self.macd_slow, self.macd_signal = _EwmState(2 / (fast + 1)), _EwmState(2 / (slow + 1)), _EwmState(2 / (signal + 1))
+        self.avg_gain = _EwmState(1 / rsi_period, adjust=True, min_periods=rsi_period)
+        self.avg_loss = _EwmState(1 / rsi_period, adjust=True, min_periods=rsi_period)
+        self.atr, self.adx_atr = _EwmState(1 / atr_period), _EwmState(1 / atr_period)
+        self.plus_dm, self.minus_dm, self.adx = _EwmState(1 / atr_period), _EwmState(1 / atr_period), _EwmState(1 / atr_period)
+        self.close_window, self.volume_window, self.obv_window = _RollingWindow(window), _RollingWindow(window), _RollingWindow(window)
+        self.prev_high = self.prev_low = self.prev_close = np.nan
+        self.obv = 0.0
+        self.last_index = None
+        self.last_close = np.nan
+
+    def update(self, index, high, low, close, volume):
+        row = {name: state.update(close) for name, state in self.ema.items()}
+        macd_line = self.macd_fast.update(close) - self.macd_slow.update(close)
+        macd_signal = self.macd_signal.update(macd_line)
+        row.update(MACD_Line=macd_line, MACD_Signal=macd_signal, MACD_Hist=macd_line - macd_signal)
+
+        delta = close - self.prev_close
+        avg_gain = self.avg_gain.update(delta if delta > 0 else 0.0)
+        avg_loss = self.avg_loss.update(-delta if delta < 0 else 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            row['RSI'] = 100 - (100 / (1 + np.float64(avg_gain) / np.float64(avg_loss)))
+
+        sma = self.close_window.update(close).mean()
+        std = self.close_window.std()
+        row.update(SMA_20=sma, BB_High=sma + std * 2, BB_Low=sma - std * 2)
+
+        true_range = np.nanmax([high - low, abs(high - self.prev_close), abs(low - self.prev_close)])
+        row['ATR'] = self.atr.update(true_range)
+        adx_atr = self.adx_atr.update(true_range)
+        up_move, down_move = high - self.prev_high, self.prev_low - low
+        plus_dm = up_move if (up_move > down_move) and (up_move > 0) else 0.0
+        minus_dm = down_move if (down_move > up_move) and (down_move > 0) else 0.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            plus_di = 100 * (np.float64(self.plus_dm.update(plus_dm)) / adx_atr)
+            minus_di = 100 * (np.float64(self.minus_dm.update(minus_dm)) / adx_atr)
+            dx = 100 * (abs(plus_di - minus_di) / (plus_di + minus_di))
+        row['ADX'] = self.adx.update(dx)
+
+        if delta == delta: self.obv += np.sign(delta) * volume
+        row['OBV'] = self.obv
+        row['Volume_MA_20'] = self.volume_window.update(volume).mean()
+        row['OBV_MA_20'] = self.obv_window.update(self.obv).mean()
+
+        self.prev_high, self.prev_low, self.prev_close = high, low, close
+        self.last_index, self.last_close = index, close
+        return row
+
+    def seed(self, df):
+        # 冷啟動：以向量化方式重建 update 的各項輸入序列，直接設定引擎狀態而不逐根K棒執行
+        high, low, close, volume = (df[column].to_numpy(np.float64) for column in ('High', 'Low', 'Close', 'Volume'))
+        prev_high, prev_low, prev_close = (np.concatenate([[np.nan], values[:-1]]) for values in (high, low, close))
+        for state in self.ema.values(): state.seed(close)
+        self.macd_fast.seed(close)
+        self.macd_slow.seed(close)
+        macd_line = (pd.Series(close).ewm(alpha=self.macd_fast.alpha, adjust=False).mean()
+                     - pd.Series(close).ewm(alpha=self.macd_slow.alpha, adjust=False).mean()).to_numpy()
+        self.macd_signal.seed(macd_line)
+
+        delta = close - prev_close
+        with np.errstate(invalid='ignore'):
+            self.avg_gain.seed(np.where(delta > 0, delta, 0.0))
+            self.avg_loss.seed(np.where(delta < 0, -delta, 0.0))
+            true_range = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+            up_move, down_move = high - prev_high, prev_low - low
+            plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+            minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+        self.atr.seed(true_range)
+        self.adx_atr.seed(true_range)
+        self.plus_dm.seed(plus_dm)
+        self.minus_dm.seed(minus_dm)
+        adx_atr = pd.Series(true_range).ewm(alpha=self.adx_atr.alpha, adjust=False).mean().to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            plus_di = 100 * pd.Series(plus_dm).ewm(alpha=self.plus_dm.alpha, adjust=False).mean().to_numpy() / adx_atr
+            minus_di = 100 * pd.Series(minus_dm).ewm(alpha=self.minus_dm.alpha, adjust=False).mean().to_numpy() / adx_atr
+            self.adx.seed(100 * (np.abs(plus_di - minus_di) / (plus_di + minus_di)))
+
+        obv = np.cumsum(np.where(np.isnan(delta), 0.0, np.sign(delta) * volume))
+        self.close_window.seed(close)
+        self.volume_window.seed(volume)
+        self.obv_window.seed(obv)
+        if len(df):
+            self.obv = obv[-1]
+            self.prev_high, self.prev_low, self.prev_close = high[-1], low[-1], close[-1]
+            self.last_index, self.last_close = df.index[-1], close[-1]
+        return self
+
+    def update_frame(self, df):
+        # 逐列寫入預先配置的陣列 (不保留每根K棒的 dict)，低記憶體模式下直接以 float32 儲存
+        out = np.empty((len(df), len(self.COLUMNS)), dtype=np.float32 if PIPELINE_LOW_MEMORY else np.float64)
+        for i, (idx, h, l, c, v) in enumerate(zip(df.index, df['High'].to_numpy(float), df['Low'].to_numpy(float),
+                                                   df['Close'].to_numpy(float), df['Volume'].to_numpy(float))):
+            row = self.update(idx, h, l, c, v)
+            out[i] = [row[name] for name in self.COLUMNS]
+        return pd.DataFrame(out, index=df.index, columns=self.COLUMNS, copy=False)
+
+@st.cache_resource
+def _streaming_indicator_store():
+    return {}
+
+def calculate_technical_indicators_incremental(key, df):
+    # 以 key (代碼, 週期) 延續既有引擎狀態，只計算上次之後新增的K棒；
+    # EWM、OBV 等遞迴指標取決於序列起點，起點改變 (trim_to_period 的視窗向後滑動) 時重新冷啟動，不沿用舊起點算出的值
+    store = _streaming_indicator_store()
+    entry = store.setdefault(key, {"lock": threading.Lock(), "engine": None, "indicators": None, "start": None})
+    with entry["lock"]:
+        engine = entry["engine"]
+        reusable = (engine is not None and len(df) and entry["start"] == df.index[0] and engine.last_index in df.index
+                    and np.isclose(df.at[engine.last_index, 'Close'], engine.last_close))
+        if not reusable:
+            # 冷啟動 (新的代碼/週期、視窗滑動、除權息調整、工作程序重啟) 以批次函式計算，再由最後狀態接續串流更新
+            indicators = calculate_technical_indicators(pd.DataFrame(index=df.index), get_indicator_cache(df))[StreamingIndicatorEngine.COLUMNS]
+            if PIPELINE_LOW_MEMORY: indicators = indicators.astype(np.float32)
+            engine = StreamingIndicatorEngine().seed(df)
+        else:
+            new_bars = df[df.index > engine.last_index]
+            indicators = pd.concat([entry["indicators"], engine.update_frame(new_bars)]) if not new_bars.empty else entry["indicators"]
+        # 視窗滑動時整份重建，儲存的指標表只涵蓋目前的視窗 (不超過一個 period)
+        entry["engine"], entry["indicators"], entry["start"] = engine, indicators, df.index[0] if len(df) else None
+        if not PIPELINE_LOW_MEMORY: return df.join(indicators.reindex(df.index))
+        # 低記憶體模式：相同數據版本的指標表在工作階段之間共用 (呼叫端不可就地修改)
+        version = data_version(df)
+        if entry.get("tech_version") != version:
+            entry["tech"], entry["tech_version"] = df.join(indicators.reindex(df.index)), version
+        return entry["tech"]
+
+def summarize_chips_and_news(inst_holders, news):
     try:
-        ticker = yf.Ticker(symbol)
-        inst_holders = ticker.institutional_holders
+        if news is None: raise ValueError("news unavailable")
         inst_hold_pct = 0
         if inst_holders is not None and not inst_holders.empty:
             value = inst_holders.iloc[0, 2] # '% of Shares Held by Institutions' column
             inst_hold_pct = float(str(value).replace('%','')) / 100 if isinstance(value, str) else float(value)
 
-        news = ticker.news
         news_summary = ""
         if news:
             headlines = [f"- {item['title']}" for item in news[:5]]
@@ -593,11 +1855,12 @@ def get_chips_and_news_analysis(symbol):
     except Exception:
         return {"inst_hold_pct": 0, "news_summary": "無法獲取新聞。"}
 
-@st.cache_data(ttl=3600)
-def calculate_advanced_fundamental_rating(symbol):
+@shared_cache(ttl=3600)
+def get_chips_and_news_analysis(symbol):
+    return summarize_chips_and_news(fetch_or_default(get_institutional_holders, symbol, stale_key=('institutional_holders', symbol)), fetch_or_default(get_ticker_news, symbol, stale_key=('news', symbol)))
+
+def rate_fundamentals(info):
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
         if info.get('quoteType') in ['INDEX', 'CRYPTOCURRENCY', 'ETF']:
             return {"score": 0, "summary": "不適用基本面分析。", "details": {}}
         score, details = 0, {}
@@ -626,71 +1889,248 @@ def calculate_advanced_fundamental_rating(symbol):
     except Exception:
         return {"score": 0, "summary": "無法獲取數據。", "details": {}}
 
+@shared_cache(ttl=3600)
+def calculate_advanced_fundamental_rating(symbol):
+    return rate_fundamentals(fetch_or_default(get_ticker_info, symbol, stale_key=('info', symbol)))
+
+_FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS, thread_name_prefix="report-fetch")
+
+def assemble_report_data(symbol, period, interval):
+    # 價格、info、法人持股、新聞四個請求平行送出 (info 只請求一次並共用)；失敗或逾時的請求改用最後一次成功的結果或預設值
+    tasks = {
+        "df_raw": (get_stock_data_or_stale, (symbol, period, interval), pd.DataFrame()),
+        "yf_info": (get_ticker_info, (symbol,), UPSTREAM.last_good(('info', symbol))),
+        "inst_holders": (get_institutional_holders, (symbol,), UPSTREAM.last_good(('institutional_holders', symbol))),
+        "news": (get_ticker_news, (symbol,), UPSTREAM.last_good(('news', symbol))),
+    }
+    started = time.monotonic()
+    # 每個請求帶著目前的 contextvars 執行，讓工作執行緒的階段量測記入同一份報告
+    futures = {key: _FETCH_EXECUTOR.submit(contextvars.copy_context().run, func, *args) for key, (func, args, _) in tasks.items()}
+    results, fetch_errors = {}, {}
+    for key, future in futures.items():
+        remaining = FETCH_TIMEOUT_SECONDS[key] - (time.monotonic() - started)
+        try:
+            results[key] = future.result(timeout=max(remaining, 0))
+        except Exception as e:
+            results[key] = tasks[key][2]
+            fetch_errors[key] = str(e) or type(e).__name__
+    return {
+        "df_raw": results["df_raw"],
+        "stale": bool(results["df_raw"].attrs.get('stale')),
+        "fetch_errors": fetch_errors,
+        "info": build_company_info(symbol, results["yf_info"]),
+        "fa_rating": rate_fundamentals(results["yf_info"]),
+        "chips_data": summarize_chips_and_news(results["inst_holders"], results["news"]),
+    }
+
+# AI融合訊號代碼 -> 行動建議 (總分 > 4 買進、> 1.5 偏買、< -1.5 偏賣、< -4 賣出)
+FUSION_ACTIONS = {2: '買進 (Buy)', 1: '中性偏買 (Hold/Buy)', 0: '中性/觀望', -1: '中性偏賣 (Hold/Sell)', -2: '賣出 (Sell/Short)'}
+FUSION_COLUMNS = ['AI_TA_Score', 'AI_Volume_Score', 'AI_Score', 'AI_Confidence', 'AI_Signal']
+
+def fusion_scores(ema10, ema50, ema200, rsi, hist, prev_hist, adx, obv, obv_ma, fa_rating, chips_news_data):
+    # 融合評分的逐元素規則：輸入為同長度的陣列 (單一標的的時間序列，或多標的的橫斷面)，輸出欄位依 FUSION_COLUMNS 排列
+    ta_score = np.select([(ema10 > ema50) & (ema50 > ema200), (ema10 < ema50) & (ema50 < ema200)], [2.0, -2.0], 0.0)
+    ta_score += np.select([rsi > 70, rsi < 30, rsi > 50], [-1.5, 1.5, 1.0], -1.0)
+    with np.errstate(invalid='ignore'):
+        ta_score += np.select([(hist > 0) & (hist > prev_hist), (hist < 0) & (hist < prev_hist)], [1.5, -1.5], 0.0)
+    ta_score *= np.where(adx > 25, 1.2, 0.8)
+
+    fa_score = ((fa_rating.get('score', 0) / 7.0) - 0.5) * 8.0 # Max score is 7
+    chips_score = (chips_news_data.get('inst_hold_pct', 0) - 0.4) * 4
+    volume_score = np.where(obv > obv_ma, 1.0, -1.0)
+
+    total_score = ta_score * 0.5 + fa_score * 0.25 + (chips_score + volume_score) * 0.25
+    signal = np.select([total_score > 4, total_score > 1.5, total_score < -4, total_score < -1.5], [2.0, 1.0, -2.0, -1.0], 0.0)
+    return np.column_stack([ta_score, volume_score, total_score, np.minimum(100, 50 + np.abs(total_score) * 8), signal])
+
+def generate_ai_fusion_signal_series(df, fa_rating, chips_news_data):
+    # 向量化計算每根K棒的融合評分 (與逐根呼叫 generate_ai_fusion_signal 相同的規則)；
+    # 與原邏輯一致只使用無缺值的K棒，前一根指的是前一根有效K棒，第一根有效K棒因無前值而留空；
+    # 以遮罩只取出用到的欄位，不複製整張指標表
+    valid = df.notna().all(axis=1).to_numpy()
+    column = lambda name: _as_float_array(df[name])[valid]
+    ema10, ema50, ema200 = (column(c) for c in ('EMA_10', 'EMA_50', 'EMA_200'))
+    rsi, hist, adx = (column(c) for c in ('RSI', 'MACD_Hist', 'ADX'))
+    prev_hist = np.concatenate([[np.nan], hist[:-1]])
+    scores = fusion_scores(ema10, ema50, ema200, rsi, hist, prev_hist, adx, column('OBV'), column('OBV_MA_20'), fa_rating, chips_news_data)
+    out = pd.DataFrame(scores, index=df.index[valid], columns=FUSION_COLUMNS)
+    if len(out): out.iloc[0] = np.nan
+    return downcast_if_low_memory(out.reindex(df.index))
+
 def generate_ai_fusion_signal(df, fa_rating, chips_news_data):
-    df_clean = df.dropna()
-    if df_clean.empty or len(df_clean) < 2: return {'action': '數據不足', 'score': 0, 'confidence': 0}
+    valid = df.notna().all(axis=1).to_numpy()
+    if valid.sum() < 2: return {'action': '數據不足', 'score': 0, 'confidence': 0}
+    df_clean = df.iloc[np.flatnonzero(valid)[-2:]] # 只需要最後兩根有效K棒
     
+    # 評分取自向量化序列的最後一根K棒，這裡只產生判讀說明
+    fusion = generate_ai_fusion_signal_series(df_clean, fa_rating, chips_news_data).iloc[-1]
     last, prev = df_clean.iloc[-1], df_clean.iloc[-2]
     opinions = {}
 
-    ta_score = 0
-    if last['EMA_10'] > last['EMA_50'] > last['EMA_200']: ta_score += 2; opinions['趨勢分析 (MA)'] = '✅ 強多頭排列'
-    elif last['EMA_10'] < last['EMA_50'] < last['EMA_200']: ta_score -= 2; opinions['趨勢分析 (MA)'] = '❌ 強空頭排列'
+    if last['EMA_10'] > last['EMA_50'] > last['EMA_200']: opinions['趨勢分析 (MA)'] = '✅ 強多頭排列'
+    elif last['EMA_10'] < last['EMA_50'] < last['EMA_200']: opinions['趨勢分析 (MA)'] = '❌ 強空頭排列'
     else: opinions['趨勢分析 (MA)'] = '⚠️ 中性盤整'
     
-    if last['RSI'] > 70: ta_score -= 1.5; opinions['動能分析 (RSI)'] = '❌ 超買區域'
-    elif last['RSI'] < 30: ta_score += 1.5; opinions['動能分析 (RSI)'] = '✅ 超賣區域'
-    elif last['RSI'] > 50: ta_score += 1; opinions['動能分析 (RSI)'] = '✅ 多頭區間'
-    else: ta_score -= 1; opinions['動能分析 (RSI)'] = '❌ 空頭區間'
+    if last['RSI'] > 70: opinions['動能分析 (RSI)'] = '❌ 超買區域'
+    elif last['RSI'] < 30: opinions['動能分析 (RSI)'] = '✅ 超賣區域'
+    elif last['RSI'] > 50: opinions['動能分析 (RSI)'] = '✅ 多頭區間'
+    else: opinions['動能分析 (RSI)'] = '❌ 空頭區間'
 
-    if last['MACD_Hist'] > 0 and last['MACD_Hist'] > prev['MACD_Hist']: ta_score += 1.5; opinions['動能分析 (MACD)'] = '✅ 多頭動能增強'
-    elif last['MACD_Hist'] < 0 and last['MACD_Hist'] < prev['MACD_Hist']: ta_score -= 1.5; opinions['動能分析 (MACD)'] = '❌ 空頭動能增強'
+    if last['MACD_Hist'] > 0 and last['MACD_Hist'] > prev['MACD_Hist']: opinions['動能分析 (MACD)'] = '✅ 多頭動能增強'
+    elif last['MACD_Hist'] < 0 and last['MACD_Hist'] < prev['MACD_Hist']: opinions['動能分析 (MACD)'] = '❌ 空頭動能增強'
     else: opinions['動能分析 (MACD)'] = '⚠️ 動能盤整'
         
-    if last['ADX'] > 25: ta_score *= 1.2; opinions['趨勢強度 (ADX)'] = f'✅ 強趨勢確認'
-    else: ta_score *= 0.8; opinions['趨勢強度 (ADX)'] = f'⚠️ 盤整趨勢'
+    if last['ADX'] > 25: opinions['趨勢強度 (ADX)'] = f'✅ 強趨勢確認'
+    else: opinions['趨勢強度 (ADX)'] = f'⚠️ 盤整趨勢'
 
-    fa_score = ((fa_rating.get('score', 0) / 7.0) - 0.5) * 8.0 # Max score is 7
-    chips_score = (chips_news_data.get('inst_hold_pct', 0) - 0.4) * 4
-    
-    volume_score = 0
-    if not pd.isna(last['OBV_MA_20']) and last['OBV'] > last['OBV_MA_20']: volume_score += 1; opinions['成交量 (OBV)'] = '✅ OBV 在均線之上'
-    else: volume_score -=1; opinions['成交量 (OBV)'] = '❌ OBV 在均線之下'
+    if last['OBV'] > last['OBV_MA_20']: opinions['成交量 (OBV)'] = '✅ OBV 在均線之上'
+    else: opinions['成交量 (OBV)'] = '❌ OBV 在均線之下'
     
-    total_score = ta_score * 0.5 + fa_score * 0.25 + (chips_score + volume_score) * 0.25
-    confidence = min(100, 50 + abs(total_score) * 8)
-    
-    action = '中性/觀望'
-    if total_score > 4: action = '買進 (Buy)'
-    elif total_score > 1.5: action = '中性偏買 (Hold/Buy)'
-    elif total_score < -4: action = '賣出 (Sell/Short)'
-    elif total_score < -1.5: action = '中性偏賣 (Hold/Sell)'
-    
-    return {'action': action, 'score': total_score, 'confidence': confidence, 'ai_opinions': opinions}
+    return {'action': FUSION_ACTIONS[int(fusion['AI_Signal'])], 'score': fusion['AI_Score'], 'confidence': fusion['AI_Confidence'], 'ai_opinions': opinions}
+
+def panel_calendar_key(index):
+    # 跨市場對齊用的時間鍵：日線以上取交易所當地日期 (台股、美股、加密貨幣的同一天落在同一列)，日內K棒統一換算為 UTC
+    if getattr(index, 'tz', None) is None: return index
+    local = index.tz_localize(None)
+    return local if (local == local.normalize()).all() else index.tz_convert('UTC').tz_localize(None)
+
+class PricePanel:
+    # 多標的價格面板：每個欄位是一個 (K棒 × 代碼) 矩陣。各代碼的K棒依自身交易日曆由第 0 列往下排列，
+    # 較短的序列在尾端補 NaN —— 休市日不會在序列中間插入空值，且所有指標都是因果計算，尾端補值不影響有效K棒，
+    # 因此同一份指標註冊表可對整個矩陣一次算完，結果與逐一標的計算相同。calendar/rows 保存對齊到聯集交易日曆的位置。
+    def __init__(self, frames):
+        self.symbols = list(frames)
+        self.lengths = np.array([len(frames[symbol]) for symbol in self.symbols], dtype=np.int64)
+        n, width = int(self.lengths.max(initial=0)), len(self.symbols)
+        self.valid = np.arange(n)[:, None] < self.lengths[None, :]
+        keys = [panel_calendar_key(frames[symbol].index) for symbol in self.symbols]
+        self.calendar = keys[0].append(keys[1:]).unique().sort_values() if keys else pd.DatetimeIndex([])
+        self.rows = np.full((n, width), -1, dtype=np.int64)
+        blocks = {field: np.full((n, width), np.nan) for field in OHLCV_COLUMNS}
+        for j, symbol in enumerate(self.symbols):
+            length = self.lengths[j]
+            self.rows[:length, j] = self.calendar.get_indexer(keys[j])
+            values = ohlcv_view(frames[symbol]).to_numpy(dtype=np.float64)
+            for i, field in enumerate(OHLCV_COLUMNS): blocks[field][:length, j] = values[:, i]
+        self.fields = {field: pd.DataFrame(block, columns=self.symbols) for field, block in blocks.items()}
+        self.ctx = IndicatorCache(self.fields)
+
+    def indicators(self):
+        # 與單一標的相同的指標與參數，每個結果都是 (K棒 × 代碼) 矩陣；尾端補值的位置遮回 NaN
+        mask = pd.DataFrame(self.valid, columns=self.symbols)
+        table = calculate_technical_indicators(dict(self.fields), ctx=self.ctx)
+        return {name: frame.where(mask) for name, frame in table.items()}
+
+    def latest(self, values, offset=0):
+        # 每個代碼倒數第 offset+1 根K棒的值 (K棒不足時為 NaN)
+        values = np.asarray(values, dtype=np.float64)
+        pos = self.lengths - 1 - offset
+        out = np.full(len(self.symbols), np.nan)
+        ok = pos >= 0
+        out[ok] = values[pos[ok], np.flatnonzero(ok)]
+        return out
+
+    def last_bar_time(self):
+        return self.calendar[self.rows[self.lengths - 1, np.arange(len(self.symbols))]]
+
+    def aligned(self, values):
+        # 轉為聯集交易日曆 (日曆 × 代碼)，該代碼當時沒有K棒 (休市、尚未上市) 的位置為 NaN
+        values = np.asarray(values, dtype=np.float64)
+        out = np.full((len(self.calendar), len(self.symbols)), np.nan)
+        cols = np.broadcast_to(np.arange(len(self.symbols)), self.rows.shape)
+        out[self.rows[self.valid], cols[self.valid]] = values[self.valid]
+        return pd.DataFrame(out, index=self.calendar, columns=self.symbols)
+
+def panel_fusion_scores(panel, indicators, fa_rating, chips_news_data):
+    # 與 generate_ai_fusion_signal 相同：每個代碼取最後兩根所有欄位皆有值的K棒；有效K棒不足兩根的代碼為 NaN
+    complete = np.logical_and.reduce([frame.notna().to_numpy() for frame in indicators.values()])
+    step = np.arange(complete.shape[0])[:, None]
+    last = np.where(complete, step, -1).max(axis=0)
+    prev = np.where(complete & (step < last), step, -1).max(axis=0)
+    cols = np.arange(len(panel.symbols))
+    at = lambda name, rows: indicators[name].to_numpy(dtype=np.float64)[rows, cols]
+    scores = fusion_scores(at('EMA_10', last), at('EMA_50', last), at('EMA_200', last), at('RSI', last),
+                           at('MACD_Hist', last), at('MACD_Hist', prev), at('ADX', last), at('OBV', last), at('OBV_MA_20', last),
+                           fa_rating, chips_news_data)
+    scores[prev < 0] = np.nan
+    return pd.DataFrame(scores, index=panel.symbols, columns=FUSION_COLUMNS)
+
+def scan_market(symbols, period, interval):
+    # 所有標的組成一個價格面板：指標、融合評分與橫斷面排行 (RSI、ADX 趨勢、唐奇安突破) 都是對整個矩陣的單次向量化計算；
+    # 下載失敗的代碼記錄在 attrs['failed'] ({代碼: 錯誤訊息})
+    frames, failed = get_batch_stock_data(symbols, period, interval)
+    frames = {symbol: df for symbol, df in frames.items() if len(df) >= MIN_ANALYSIS_BARS}
+    if not frames:
+        empty = pd.DataFrame()
+        empty.attrs['failed'] = failed
+        return empty
+    panel = PricePanel(frames)
+    indicators = panel.indicators()
+    fusion = panel_fusion_scores(panel, indicators, SCANNER_NEUTRAL_FA, SCANNER_NEUTRAL_CHIPS)
+
+    latest = lambda name, offset=0: panel.latest(indicators[name], offset)
+    price, prev_close = latest('Close'), latest('Close', 1)
+    upper = panel.latest(panel.ctx.get('rolling_max', column='High', window=SCANNER_DONCHIAN_WINDOW), 1)
+    lower = panel.latest(panel.ctx.get('rolling_min', column='Low', window=SCANNER_DONCHIAN_WINDOW), 1)
+    with np.errstate(invalid='ignore'):
+        breakout = np.select([price > upper, price < lower], [(price / upper - 1) * 100, (price / lower - 1) * 100], 0.0)
+    ranking = pd.DataFrame({
+        "代碼": panel.symbols,
+        "名稱": [FULL_SYMBOLS_MAP.get(symbol, {}).get('name', symbol) for symbol in panel.symbols],
+        "AI 行動建議": fusion['AI_Signal'].map(FUSION_ACTIONS).to_numpy(),
+        "AI 評分": fusion['AI_Score'].round(2).to_numpy(),
+        "信心指數 (%)": fusion['AI_Confidence'].round(0).to_numpy(),
+        "價格": price,
+        "漲跌幅 (%)": np.round((price - prev_close) / prev_close * 100, 2),
+        "RSI": np.round(latest('RSI'), 1),
+        "ADX": np.round(latest('ADX'), 1),
+        "ADX 趨勢": np.where(latest('EMA_10') > latest('EMA_50'), '多頭', '空頭'),
+        "唐奇安通道": np.select([breakout > 0, breakout < 0], ['⬆️ 突破上軌', '⬇️ 跌破下軌'], '—'),
+        "突破幅度 (%)": np.round(breakout, 2),
+        "最後K棒": panel.last_bar_time(),
+    })
+    ranking = ranking[fusion['AI_Score'].notna().to_numpy()].sort_values("AI 評分", ascending=False).reset_index(drop=True)
+    ranking.attrs['failed'] = failed
+    return ranking
+
+def rank_market_scan(ranking, view):
+    # 橫斷面排行：唐奇安突破只列出突破上下軌的標的，依突破幅度的絕對值排序
+    column = SCANNER_RANKINGS[view]
+    if column != "突破幅度 (%)": return ranking.sort_values(column, ascending=False).reset_index(drop=True)
+    breakouts = ranking[ranking[column] != 0]
+    return breakouts.sort_values(column, ascending=False, key=np.abs).reset_index(drop=True)
 
 # ==============================================================================
 # 5. 回測與圖表繪製
 # ==============================================================================
+def compact_capital_curve(capital_curve, max_points=CHART_MAX_POINTS):
+    # 資金曲線只用於繪圖：低記憶體模式下直接保存 LTTB 降採樣後的 float32 序列
+    if not PIPELINE_LOW_MEMORY: return capital_curve
+    idx = lttb_indices(capital_curve.to_numpy(dtype=np.float64), max_points)
+    return capital_curve.iloc[idx].astype(np.float32)
+
+def crossover_strategy_returns(df):
+    # 策略: SMA 20 / EMA 50 交叉 (中間序列不寫回 df，呼叫端不需先複製)；回傳持倉與每根K棒的策略報酬
+    close = df['Close'].astype(np.float64)
+    sma_20 = close.rolling(window=20).mean()
+    ema_50 = close.ewm(span=50, adjust=False).mean()
+    position = pd.Series(np.where(sma_20 > ema_50, 1, -1), index=df.index)
+    return position, close.pct_change() * position.shift(1)
+
 def run_backtest(df, initial_capital=100000):
     try:
-        # 策略: SMA 20 / EMA 50 交叉
-        df['SMA_20'] = df['Close'].rolling(window=20).mean()
-        df['EMA_50'] = df['Close'].ewm(span=50, adjust=False).mean()
-        
-        df['position'] = np.where(df['SMA_20'] > df['EMA_50'], 1, -1)
-        df['returns'] = df['Close'].pct_change()
-        df['strategy_returns'] = df['returns'] * df['position'].shift(1)
+        position, strategy_returns = crossover_strategy_returns(df)
         
         # 計算指標
-        cumulative_returns = (1 + df['strategy_returns']).cumprod()
+        cumulative_returns = (1 + strategy_returns).cumprod()
         total_return = (cumulative_returns.iloc[-1] - 1) * 100
         
-        trades = df['position'].diff().ne(0) & df['position'].shift().ne(0)
+        trades = position.diff().ne(0) & position.shift().ne(0)
         total_trades = trades.sum()
         if total_trades == 0:
             return {"total_trades": 0, "message": "無交易信號"}
             
-        trade_returns = df['strategy_returns'][trades]
+        trade_returns = strategy_returns[trades]
         win_rate = (trade_returns > 0).sum() / total_trades * 100 if total_trades > 0 else 0
         
         # 最大回撤
@@ -698,7 +2138,7 @@ def run_backtest(df, initial_capital=100000):
         drawdown = (cumulative_returns - peak) / peak
         max_drawdown = drawdown.min() * 100
         
-        capital_curve = initial_capital * cumulative_returns
+        capital_curve = compact_capital_curve(initial_capital * cumulative_returns)
         
         return {
             "total_return": f"{total_return:.2f}",
@@ -711,31 +2151,446 @@ def run_backtest(df, initial_capital=100000):
     except Exception as e:
         return {"total_trades": 0, "message": f"回測錯誤: {e}"}
 
-def create_comprehensive_chart(df, symbol, period_key):
-    fig = make_subplots(rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.05,
-                        row_heights=[0.6, 0.2, 0.2])
+def resample_path_metrics(log_returns):
+    # 一次計算整批路徑 (路徑 × 步數，對數報酬) 的總報酬、最大回撤與勝率 (非零報酬中獲利的比例)，回傳 (指標, 對數權益矩陣)；
+    # 回撤在對數空間計算 (峰值含起始資金)，整個矩陣不需取指數
+    log_equity = np.cumsum(log_returns, axis=1)
+    drawdown = (log_equity - np.maximum(np.maximum.accumulate(log_equity, axis=1), 0.0)).min(axis=1)
+    wins, trades = (log_returns > 0).sum(axis=1), (log_returns != 0).sum(axis=1)
+    metrics = {
+        "total_return": np.expm1(log_equity[:, -1]) * 100,
+        "max_drawdown": np.expm1(drawdown) * 100,
+        "win_rate": np.divide(wins * 100.0, trades, out=np.zeros(len(log_returns)), where=trades > 0),
+    }
+    return metrics, log_equity
+
+def resample_indices(rng, n, paths, method, block_size):
+    # 產生重抽樣索引矩陣 (路徑 × n)：區塊法以區塊起點 + 偏移串接，索引可超出 n (呼叫端將序列環狀延伸 block_size - 1 個元素)，
+    # 避免序列尾端被抽到的機率偏低
+    if method == "shuffle": return rng.permuted(np.broadcast_to(np.arange(n), (paths, n)), axis=1)
+    if method == "bootstrap": return rng.integers(0, n, size=(paths, n))
+    starts = rng.integers(0, n, size=(paths, -(-n // block_size)))
+    return (starts[:, :, None] + np.arange(block_size)).reshape(paths, -1)[:, :n]
+
+def run_robustness_analysis(df, method="block", paths=ROBUSTNESS_PATHS, block_size=ROBUSTNESS_BLOCK_SIZE,
+                            seed=ROBUSTNESS_SEED, max_cells=ROBUSTNESS_MAX_CELLS, fan_points=ROBUSTNESS_FAN_POINTS):
+    # SMA 20/EMA 50 交叉策略的蒙地卡羅穩健度分析：單一歷史路徑的報酬/回撤/勝率只是一個樣本，
+    # 以重抽樣產生數千條路徑並回報各指標的分位數 (信賴區間) 與權益扇形圖；路徑分批計算以限制記憶體。
+    # 區塊法重抽的是K棒，區塊接縫會切斷交易，因此勝率改以獲利K棒比例表示 (實際值以同一定義計算)
+    position, strategy_returns = crossover_strategy_returns(df)
+    returns = strategy_returns.to_numpy(dtype=np.float64)[1:]
+    index = df.index[1:]
+    if method != "block" and len(returns):
+        # 以整筆交易為重抽樣單位：連續相同持倉的複利報酬
+        held = position.shift(1).to_numpy(dtype=np.float64)[1:]
+        starts = np.concatenate([[0], np.flatnonzero(held[1:] != held[:-1]) + 1])
+        returns = np.expm1(np.add.reduceat(np.log1p(returns), starts))
+        index = pd.RangeIndex(1, len(returns) + 1, name="交易序號")
+    n = len(returns)
+    if n < 2: return {"method": method, "paths": 0, "message": "樣本數不足，無法進行重抽樣"}
+    block_size = max(1, min(n, int(round(block_size or n ** (1 / 3)))))
+    paths = min(paths, max(ROBUSTNESS_MIN_PATHS, ROBUSTNESS_MAX_TOTAL_CELLS // n))
+    log_returns = np.log1p(np.nan_to_num(returns))
+    observed, observed_equity = resample_path_metrics(log_returns[None, :])
+    circular = np.concatenate([log_returns, log_returns[:block_size - 1]])
+
+    rng = np.random.default_rng(seed)
+    fan_idx = np.unique(np.linspace(0, n - 1, min(n, fan_points)).astype(int))
+    batch = max(1, max_cells // n)
+    metrics, fan = {key: [] for key in observed}, []
+    for done in range(0, paths, batch):
+        idx = resample_indices(rng, n, min(batch, paths - done), method, block_size)
+        batch_metrics, log_equity = resample_path_metrics(circular[idx])
+        for key, values in batch_metrics.items(): metrics[key].append(values)
+        fan.append(np.exp(log_equity[:, fan_idx]))
+    metrics = {key: np.concatenate(values) for key, values in metrics.items()}
+    quantile_columns = [f"P{q}" for q in ROBUSTNESS_QUANTILES]
+    intervals = pd.DataFrame([
+        [ROBUSTNESS_METRIC_LABELS[key], observed[key][0], *np.percentile(values, ROBUSTNESS_QUANTILES)] for key, values in metrics.items()
+    ], columns=["指標", "實際", *quantile_columns])
+    if method == "block": intervals.loc[intervals["指標"] == ROBUSTNESS_METRIC_LABELS["win_rate"], "指標"] = "獲利K棒比例 (%)"
+    return {
+        "method": method, "paths": paths, "block_size": block_size if method == "block" else None,
+        "intervals": intervals,
+        "loss_probability": (metrics["total_return"] < 0).mean() * 100,
+        "fan": pd.DataFrame(np.percentile(np.concatenate(fan), ROBUSTNESS_QUANTILES, axis=0).T, index=index[fan_idx], columns=quantile_columns),
+        "actual": pd.Series(np.exp(observed_equity[0][fan_idx]), index=index[fan_idx]),
+    }
+
+@jit_kernel
+def sltp_backtest_kernel(open_, high, low, close, sl, tp):
+    # 單次掃過時間軸，同時模擬所有策略 (sl/tp 為 策略數 × 時間)：
+    # K棒收盤時 SL < 收盤 < TP 為多頭訊號、TP < 收盤 < SL 為空頭訊號，於下一根開盤進場；
+    # 持倉期間以 High/Low 判斷盤中觸及停損或停利 (同根皆觸及時保守視為先停損)，跳空則以開盤價成交
+    n_strategies, n = sl.shape
+    equity = np.ones((n_strategies, n))
+    entry_prices = np.full((n_strategies, n), np.nan)
+    exit_prices = np.full((n_strategies, n), np.nan)
+    directions = np.zeros((n_strategies, n))
+    for s in range(n_strategies):
+        cash, pos, entry, stop, target = 1.0, 0.0, np.nan, np.nan, np.nan
+        pending, pending_stop, pending_target = 0.0, np.nan, np.nan
+        for t in range(n):
+            if pos == 0 and pending != 0:
+                pos, entry, stop, target = pending, open_[t], pending_stop, pending_target
+                entry_prices[s, t], directions[s, t] = entry, pos
+            pending = 0.0
+            if pos != 0:
+                exit_price = np.nan
+                if pos > 0:
+                    if low[t] <= stop: exit_price = min(open_[t], stop)
+                    elif high[t] >= target: exit_price = max(open_[t], target)
+                else:
+                    if high[t] >= stop: exit_price = max(open_[t], stop)
+                    elif low[t] <= target: exit_price = min(open_[t], target)
+                if t == n - 1 and np.isnan(exit_price): exit_price = close[t] # 期末強制平倉
+                if not np.isnan(exit_price):
+                    cash *= 1 + pos * (exit_price - entry) / entry
+                    exit_prices[s, t], directions[s, t] = exit_price, pos
+                    pos = 0.0
+            equity[s, t] = cash if pos == 0 else cash * (1 + pos * (close[t] - entry) / entry)
+            if pos == 0 and t < n - 1:
+                if sl[s, t] < close[t] < tp[s, t]: pending = 1.0
+                elif tp[s, t] < close[t] < sl[s, t]: pending = -1.0
+                pending_stop, pending_target = sl[s, t], tp[s, t]
+    return equity, entry_prices, exit_prices, directions
+
+def compute_strategy_sltp(df, strategy_names=None, ctx=None, strategy_params=None):
+    # 每個策略只計算一次，只保留報告與回測實際使用的 SL/TP 陣列，策略的中間欄位隨即釋放；
+    # strategy_params 為 {策略名稱: 參數}，例如最佳化後的參數，未指定的策略使用預設值
+    names = list(strategy_names or STRATEGY_FUNCTIONS.keys())
+    strategy_params = strategy_params or {}
+    base = ohlcv_view(df)
+    ctx = ctx if ctx is not None else get_indicator_cache(base) # 所有策略共用同一份指標快取 (例如 ATR 14 只計算一次)
+    sltp = {}
+    for name in names:
+        func = STRATEGY_FUNCTIONS[name]
+        with timed_stage(f"strategy.{func.__name__}", rows=len(base)):
+            df_strategy = func(base, ctx=ctx, **strategy_params.get(name, {}))
+            sltp[name] = (_as_float_array(df_strategy['SL']), _as_float_array(df_strategy['TP']))
+    return sltp
+
+def run_strategy_backtest(df, strategy_names=None, initial_capital=100000, sltp=None):
+    # 重播各策略每根K棒的 SL/TP，回傳每個策略的交易明細、資金曲線與回撤；
+    # 逐一策略執行回測核心，同一時間只有一個策略的 (時間長度) 暫存陣列
+    names = list(strategy_names or STRATEGY_FUNCTIONS.keys())
+    sltp = sltp if sltp is not None else compute_strategy_sltp(df, names)
+    open_, high, low, close = (_as_float_array(df[c]) for c in ('Open', 'High', 'Low', 'Close'))
+
+    results = {}
+    for name in names:
+        sl, tp = sltp[name]
+        equity, entry_prices, exit_prices, directions = (a[0] for a in sltp_backtest_kernel(open_, high, low, close, sl[None, :], tp[None, :]))
+        entry_idx, exit_idx = np.flatnonzero(~np.isnan(entry_prices)), np.flatnonzero(~np.isnan(exit_prices))
+        trade_dir = directions[entry_idx]
+        trade_returns = trade_dir * (exit_prices[exit_idx] - entry_prices[entry_idx]) / entry_prices[entry_idx]
+        trades = pd.DataFrame({
+            "進場時間": df.index[entry_idx], "出場時間": df.index[exit_idx],
+            "方向": np.where(trade_dir > 0, "多", "空"),
+            "進場價": entry_prices[entry_idx], "出場價": exit_prices[exit_idx],
+            "報酬率 (%)": trade_returns * 100,
+        })
+        peak = np.maximum.accumulate(equity)
+        results[name] = {
+            "total_return": (equity[-1] - 1) * 100 if len(df) else 0.0,
+            "win_rate": (trade_returns > 0).mean() * 100 if len(trade_returns) else 0.0,
+            "max_drawdown": ((equity - peak) / peak).min() * 100 if len(df) else 0.0,
+            "total_trades": len(trades),
+            "capital_curve": compact_capital_curve(pd.Series(initial_capital * equity, index=df.index)),
+            "trades": trades,
+        }
+    return results
+
+def run_fusion_backtest(df, fusion, initial_capital=100000):
+    # AI融合訊號回測：訊號 >= 1 (偏買/買進) 持多、<= -1 (偏賣/賣出) 持空、其餘空手，於下一根K棒生效
+    close = _as_float_array(df['Close'])
+    signal = np.nan_to_num(_as_float_array(fusion['AI_Signal']))
+    position = np.sign(signal) * (np.abs(signal) >= 1)
+    held = np.zeros(len(close))
+    held[1:] = position[:-1]
+    returns = np.zeros(len(close))
+    returns[1:] = close[1:] / close[:-1] - 1
+    strategy_returns = returns * held
+    equity = np.cumprod(1 + strategy_returns)
+    peak = np.maximum.accumulate(equity) if len(equity) else equity
+
+    # 連續相同且非零的持倉視為一筆交易
+    bounds = np.flatnonzero(held[1:] != held[:-1]) + 1
+    starts, ends = np.concatenate([[0], bounds]), np.append(bounds, len(held))
+    starts, ends = starts[held[starts] != 0], ends[held[starts] != 0]
+    trade_returns = np.array([np.prod(1 + strategy_returns[start:end]) - 1 for start, end in zip(starts, ends)])
+    trades = pd.DataFrame({
+        "進場時間": df.index[starts - 1], "出場時間": df.index[ends - 1],
+        "方向": np.where(held[starts] > 0, "多", "空"),
+        "報酬率 (%)": trade_returns * 100,
+    })
+    return {
+        "total_return": (equity[-1] - 1) * 100 if len(df) else 0.0,
+        "win_rate": (trade_returns > 0).mean() * 100 if len(trade_returns) else 0.0,
+        "max_drawdown": ((equity - peak) / peak).min() * 100 if len(df) else 0.0,
+        "total_trades": len(trades),
+        "capital_curve": compact_capital_curve(pd.Series(initial_capital * equity, index=df.index)),
+        "trades": trades,
+    }
+
+def summarize_strategy_backtests(results):
+    return pd.DataFrame([{
+        "策略": name,
+        "總回報率 (%)": round(r['total_return'], 2),
+        "勝率 (%)": round(r['win_rate'], 2),
+        "最大回撤 (%)": round(r['max_drawdown'], 2),
+        "交易次數": r['total_trades'],
+    } for name, r in results.items()]).sort_values("總回報率 (%)", ascending=False).reset_index(drop=True)
+
+def moving_average_matrix(close, windows, ma_type):
+    series = pd.Series(close)
+    if ma_type == "SMA": rows = [series.rolling(window=w).mean() for w in windows]
+    else: rows = [series.ewm(span=w, adjust=False).mean() for w in windows]
+    return np.vstack([r.to_numpy() for r in rows])
+
+def run_parameter_sweep(df, fast_windows=SWEEP_FAST_WINDOWS, slow_windows=SWEEP_SLOW_WINDOWS, ma_types=SWEEP_MA_TYPES):
+    # 與 run_backtest 相同的交叉策略與績效定義，但以 (參數組合 × 時間) 矩陣一次計算整個網格
+    close = _as_float_array(df['Close'])
+    windows = sorted(set(fast_windows) | set(slow_windows))
+    ma_rows = {}
+    for ma_type in ma_types:
+        for w, row in zip(windows, moving_average_matrix(close, windows, ma_type)): ma_rows[(ma_type, w)] = row
+    keys = list(ma_rows)
+    ma_matrix = np.vstack([ma_rows[k] for k in keys])
+    key_index = {k: i for i, k in enumerate(keys)}
+
+    pairs = [(ft, f, st_, sl) for ft in ma_types for st_ in ma_types for f in fast_windows for sl in slow_windows if f < sl]
+    if not pairs or len(close) < 2: return pd.DataFrame()
+    fast_idx = np.array([key_index[(ft, f)] for ft, f, _, _ in pairs])
+    slow_idx = np.array([key_index[(st_, sl)] for _, _, st_, sl in pairs])
+
+    with np.errstate(invalid='ignore'):
+        position = np.where(ma_matrix[fast_idx] > ma_matrix[slow_idx], 1.0, -1.0)
+    returns = np.full(len(close), np.nan)
+    returns[1:] = close[1:] / close[:-1] - 1
+    strategy_returns = np.full(position.shape, np.nan)
+    strategy_returns[:, 1:] = returns[None, 1:] * position[:, :-1]
+
+    cumulative = np.cumprod(1 + np.nan_to_num(strategy_returns), axis=1)
+    cumulative[:, 0] = np.nan
+    total_return = (cumulative[:, -1] - 1) * 100
+
+    trades = np.ones(position.shape, dtype=bool)
+    trades[:, 1:] = position[:, 1:] != position[:, :-1]
+    total_trades = trades.sum(axis=1)
+    wins = (np.nan_to_num(strategy_returns) > 0) & trades
+    win_rate = wins.sum(axis=1) / total_trades * 100
+
+    peak = np.fmax.accumulate(cumulative, axis=1)
+    with np.errstate(invalid='ignore'):
+        max_drawdown = np.nanmin((cumulative - peak) / peak, axis=1) * 100
+
+    result = pd.DataFrame(pairs, columns=['fast_type', 'fast', 'slow_type', 'slow'])
+    result['total_return'], result['win_rate'], result['max_drawdown'], result['total_trades'] = total_return, win_rate, max_drawdown, total_trades
+    return result
+
+def strategy_candidates(strategy_name, method="grid", samples=OPTIMIZER_RANDOM_SAMPLES, seed=0):
+    # 展開策略的參數網格；random 自網格中不重複抽樣 samples 組 (以 seed 重現)
+    space = STRATEGY_PARAM_SPACES.get(STRATEGY_FUNCTIONS[strategy_name].__name__, {})
+    if not space: return []
+    candidates = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    if method == "random" and samples < len(candidates):
+        candidates = [candidates[i] for i in sorted(np.random.default_rng(seed).choice(len(candidates), samples, replace=False))]
+    return candidates
+
+def walk_forward_splits(n, folds=OPTIMIZER_FOLDS, min_train_ratio=OPTIMIZER_MIN_TRAIN_RATIO):
+    # 回傳各視窗終點 [e0, e1, ..., n]：第 k 段以 [0, e_k) 訓練、[e_k, e_k+1) 測試，最後一個視窗 [0, n) 為全期
+    first = int(n * min_train_ratio)
+    step = (n - first) // folds
+    return [first + k * step for k in range(folds)] + [n]
+
+def _score_segment(ohlc, sl, tp, start, end):
+    # 以回測核心一次模擬一批候選參數在 [start, end) 區段的交易 (區段開始時空手)，回傳 (排序分數, 總報酬 %)
+    open_, high, low, close = (a[start:end] for a in ohlc)
+    equity, _, exit_prices, _ = sltp_backtest_kernel(open_, high, low, close, np.ascontiguousarray(sl[:, start:end]), np.ascontiguousarray(tp[:, start:end]))
+    total_return = (equity[:, -1] - 1) * 100
+    trades = (~np.isnan(exit_prices)).sum(axis=1)
+    return np.where(trades >= OPTIMIZER_MIN_TRADES, total_return, -np.inf), total_return
+
+def optimize_strategy(df, strategy_name, method="halving", samples=OPTIMIZER_RANDOM_SAMPLES, folds=OPTIMIZER_FOLDS, seed=0):
+    # 前進分析參數最佳化：每個視窗只建立一份指標快取供所有候選參數共用 (例如相同週期的 ATR 只計算一次)，
+    # 候選參數分批產生 SL/TP 矩陣後一次回測；每段以訓練期最佳者的測試期報酬累計樣本外績效，推薦參數取全期最佳者
+    func = STRATEGY_FUNCTIONS[strategy_name]
+    candidates = strategy_candidates(strategy_name, method, samples, seed)
+    base = ohlcv_view(df)
+    ends = walk_forward_splits(len(base), folds)
+    if not candidates or ends[0] < MIN_ANALYSIS_BARS or ends[1] <= ends[0]: return None
+    ohlc = tuple(_as_float_array(base[c]) for c in ('Open', 'High', 'Low', 'Close'))
+    train_scores = np.full((len(ends), len(candidates)), np.nan)
+    test_returns = np.full((len(ends), len(candidates)), np.nan)
+    alive, selected, evaluated = np.arange(len(candidates)), [], 0
+    for j, end in enumerate(ends):
+        window = base.iloc[:end]
+        ctx = IndicatorCache(window)
+        for chunk in np.array_split(alive, max(1, int(np.ceil(len(alive) / OPTIMIZER_CHUNK_SIZE)))):
+            outputs = [func(window, ctx=ctx, **candidates[i]) for i in chunk]
+            sl = np.vstack([_as_float_array(out['SL']) for out in outputs])
+            tp = np.vstack([_as_float_array(out['TP']) for out in outputs])
+            train_scores[j, chunk] = _score_segment(ohlc, sl, tp, 0, end)[0]
+            if j: test_returns[j, chunk] = _score_segment(ohlc, sl, tp, ends[j - 1], end)[1]
+            evaluated += len(chunk)
+        selected.append(alive[np.argmax(train_scores[j, alive])])
+        if method == "halving" and j < len(ends) - 1 and len(alive) > 1:
+            keep = max(1, int(np.ceil(len(alive) / OPTIMIZER_HALVING_ETA)))
+            mean_score = train_scores[:j + 1, alive].mean(axis=0)
+            alive = np.union1d(alive[np.argsort(-mean_score, kind='stable')[:keep]], selected[-1]) # 保留本段選出者以計算其測試期報酬
+
+    best = selected[-1]
+    if not np.isfinite(train_scores[-1, best]): return None # 沒有任何候選參數達到最少交易次數
+    folds_detail = [{
+        "train_end": str(base.index[ends[k] - 1]), "test_end": str(base.index[ends[k + 1] - 1]),
+        "params": candidates[selected[k]],
+        "train_return": _json_number(train_scores[k, selected[k]]), "test_return": _json_number(test_returns[k + 1, selected[k]]),
+    } for k in range(len(ends) - 1)]
+    oos = np.array([fold["test_return"] if fold["test_return"] is not None else 0.0 for fold in folds_detail])
+    return {
+        "params": candidates[best],
+        "total_return": float(train_scores[-1, best]),
+        "oos_return": float((np.prod(1 + oos / 100) - 1) * 100),
+        "method": method, "candidates": len(candidates), "evaluations": evaluated,
+        "bars": len(base), "walk_forward": folds_detail,
+    }
+
+def load_optimized_params(symbol, interval, path=OPTIMIZED_PARAMS_PATH):
+    # 回傳 {策略名稱: 參數}；沒有最佳化結果時為空字典 (策略使用預設參數)
+    try:
+        with open(path, encoding="utf-8") as f: results = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {name: result["params"] for name, result in results.get(interval, {}).get(symbol, {}).items() if name in STRATEGY_FUNCTIONS}
+
+def save_optimized_params(interval, results, path=OPTIMIZED_PARAMS_PATH):
+    # 合併寫入：{週期: {代碼: {策略名稱: 結果}}}，只覆蓋本次最佳化的 (代碼, 策略)
+    try:
+        with open(path, encoding="utf-8") as f: stored = json.load(f)
+    except (OSError, ValueError):
+        stored = {}
+    for symbol, strategies in results.items(): stored.setdefault(interval, {}).setdefault(symbol, {}).update(strategies)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f: json.dump(stored, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def create_sweep_heatmap(sweep, metric, fast_type, slow_type):
+    subset = sweep[(sweep['fast_type'] == fast_type) & (sweep['slow_type'] == slow_type)]
+    grid = subset.pivot(index='fast', columns='slow', values=metric)
+    fig = go.Figure(go.Heatmap(z=grid.values, x=[str(c) for c in grid.columns], y=[str(i) for i in grid.index],
+                               colorscale='RdYlGn', text=np.round(grid.values, 2), texttemplate="%{text}",
+                               colorbar=dict(title=SWEEP_METRICS[metric])))
+    fig.update_layout(title=f'{fast_type} 快線 × {slow_type} 慢線：{SWEEP_METRICS[metric]}', height=400,
+                      xaxis_title=f'{slow_type} 慢線週期', yaxis_title=f'{fast_type} 快線週期')
+    return fig
+
+@jit_kernel
+def lttb_kernel(y, threshold):
+    # Largest-Triangle-Three-Buckets：保留視覺形狀的折線降採樣，回傳被選取的位置 (x 為K棒序號)
+    n = y.shape[0]
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[threshold - 1] = 0, n - 1
+    bucket = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * bucket) + 1, int((i + 1) * bucket) + 1
+        next_end = min(int((i + 2) * bucket) + 1, n)
+        avg_x, avg_y, count = 0.0, 0.0, 0
+        for j in range(end, next_end):
+            if not np.isnan(y[j]): avg_x += j; avg_y += y[j]; count += 1
+        if count > 0: avg_x /= count; avg_y /= count
+        else: avg_x, avg_y = float(end), y[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((a - avg_x) * (y[j] - y[a]) - (a - j) * (avg_y - y[a]))
+            if area > best_area: best, best_area = j, area
+        a = best
+        selected[i + 1] = a
+    return selected
+
+def lttb_indices(values, threshold):
+    n = len(values)
+    if threshold >= n or threshold < 3: return np.arange(n)
+    return np.unique(lttb_kernel(np.ascontiguousarray(values, dtype=np.float64), int(threshold)))
+
+def _bucket_starts(n, max_bars):
+    size = int(np.ceil(n / max_bars)) if max_bars > 0 else 1
+    return np.arange(0, n, max(size, 1))
+
+def aggregate_ohlc(df, max_bars):
+    # 將連續K棒合併為不超過 max_bars 根：開盤取首根、收盤取末根、高低取極值、量加總
+    n = len(df)
+    if n <= max_bars: return df
+    starts = _bucket_starts(n, max_bars)
+    ends = np.append(starts[1:], n) - 1
+    return pd.DataFrame({
+        'Open': df['Open'].to_numpy()[starts],
+        'High': np.maximum.reduceat(df['High'].to_numpy(), starts),
+        'Low': np.minimum.reduceat(df['Low'].to_numpy(), starts),
+        'Close': df['Close'].to_numpy()[ends],
+        'Volume': np.add.reduceat(df['Volume'].to_numpy(), starts),
+    }, index=df.index[starts])
+
+def aggregate_extreme(series, max_bars):
+    # 每個區間保留絕對值最大的值 (用於 MACD 柱狀圖)，區間與 aggregate_ohlc 一致
+    n = len(series)
+    if n <= max_bars: return series
+    starts = _bucket_starts(n, max_bars)
+    size = starts[1] - starts[0]
+    values = np.nan_to_num(series.to_numpy(dtype=np.float64))
+    padded = np.zeros(len(starts) * size)
+    padded[:n] = values
+    blocks = padded.reshape(-1, size)
+    picked = blocks[np.arange(len(blocks)), np.abs(blocks).argmax(axis=1)]
+    return pd.Series(picked, index=series.index[starts])
+
+def _decimated_line(series, max_points):
+    idx = lttb_indices(series.to_numpy(dtype=np.float64), max_points)
+    return series.index[idx], series.to_numpy()[idx]
 
-    # K線主圖
-    fig.add_trace(go.Candlestick(x=df.index, open=df['Open'], high=df['High'],
-                                 low=df['Low'], close=df['Close'], name='K線'), row=1, col=1)
-    fig.add_trace(go.Scatter(x=df.index, y=df['EMA_10'], mode='lines', name='EMA 10', line=dict(color='orange', width=1)), row=1, col=1)
-    fig.add_trace(go.Scatter(x=df.index, y=df['EMA_50'], mode='lines', name='EMA 50', line=dict(color='blue', width=1.5)), row=1, col=1)
-    fig.add_trace(go.Scatter(x=df.index, y=df['EMA_200'], mode='lines', name='EMA 200', line=dict(color='red', width=2)), row=1, col=1)
+def create_comprehensive_chart(df, symbol, period_key, max_points=CHART_MAX_POINTS, max_candles=CHART_MAX_CANDLES):
+    has_fusion = 'AI_Score' in df.columns
+    rows = 4 if has_fusion else 3
+    fig = make_subplots(rows=rows, cols=1, shared_xaxes=True, vertical_spacing=0.05,
+                        row_heights=[0.5, 0.15, 0.15, 0.2] if has_fusion else [0.6, 0.2, 0.2])
+
+    # K線主圖 (K線超過像素預算時彙整，折線以 LTTB 降採樣並使用 WebGL 繪製)
+    candles = aggregate_ohlc(df, max_candles)
+    fig.add_trace(go.Candlestick(x=candles.index, open=candles['Open'], high=candles['High'],
+                                 low=candles['Low'], close=candles['Close'], name='K線'), row=1, col=1)
+    for column, name, color, width in (('EMA_10', 'EMA 10', 'orange', 1), ('EMA_50', 'EMA 50', 'blue', 1.5), ('EMA_200', 'EMA 200', 'red', 2)):
+        x, y = _decimated_line(df[column], max_points)
+        fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', name=name, line=dict(color=color, width=width)), row=1, col=1)
 
     # MACD副圖
-    fig.add_trace(go.Scatter(x=df.index, y=df['MACD_Line'], name='MACD Line', line=dict(color='blue')), row=2, col=1)
-    fig.add_trace(go.Scatter(x=df.index, y=df['MACD_Signal'], name='Signal Line', line=dict(color='orange')), row=2, col=1)
-    fig.add_trace(go.Bar(x=df.index, y=df['MACD_Hist'], name='Histogram', marker_color=np.where(df['MACD_Hist'] > 0, 'green', 'red')), row=2, col=1)
+    x, y = _decimated_line(df['MACD_Line'], max_points)
+    fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', name='MACD Line', line=dict(color='blue')), row=2, col=1)
+    x, y = _decimated_line(df['MACD_Signal'], max_points)
+    fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', name='Signal Line', line=dict(color='orange')), row=2, col=1)
+    hist = aggregate_extreme(df['MACD_Hist'], max_candles)
+    fig.add_trace(go.Bar(x=hist.index, y=hist, name='Histogram', marker_color=np.where(hist > 0, 'green', 'red')), row=2, col=1)
 
     # RSI副圖
-    fig.add_trace(go.Scatter(x=df.index, y=df['RSI'], name='RSI', line=dict(color='purple')), row=3, col=1)
+    x, y = _decimated_line(df['RSI'], max_points)
+    fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', name='RSI', line=dict(color='purple')), row=3, col=1)
     fig.add_hrect(y0=70, y1=100, line_width=0, fillcolor="red", opacity=0.2, row=3, col=1)
     fig.add_hrect(y0=0, y1=30, line_width=0, fillcolor="green", opacity=0.2, row=3, col=1)
 
+    # AI融合評分副圖 (±1.5 偏買/偏賣、±4 買進/賣出門檻)
+    if has_fusion:
+        x, y = _decimated_line(df['AI_Score'], max_points)
+        fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', name='AI 評分', line=dict(color='#FA8072')), row=4, col=1)
+        fig.add_hrect(y0=1.5, y1=4, line_width=0, fillcolor="green", opacity=0.1, row=4, col=1)
+        fig.add_hrect(y0=-4, y1=-1.5, line_width=0, fillcolor="red", opacity=0.1, row=4, col=1)
+        for level, color in ((4, 'green'), (-4, 'red')): fig.add_hline(y=level, line_dash='dot', line_color=color, row=4, col=1)
+        fig.update_yaxes(title_text="AI 評分", row=4, col=1)
+
     fig.update_layout(
         title=f'{symbol} 技術分析圖 ({period_key})',
         xaxis_rangeslider_visible=False,
-        height=700,
+        height=850 if has_fusion else 700,
         legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
     )
     fig.update_yaxes(title_text="價格", row=1, col=1)
@@ -743,14 +2598,608 @@ def create_comprehensive_chart(df, symbol, period_key):
     fig.update_yaxes(title_text="RSI", row=3, col=1)
     return fig
 
+def create_capital_curve_chart(capital_curve, title, max_points=CHART_MAX_POINTS):
+    x, y = _decimated_line(capital_curve, max_points)
+    fig = go.Figure(go.Scattergl(x=x, y=y, mode='lines', name='資金曲線'))
+    fig.update_layout(title=title, height=300)
+    return fig
+
+def create_robustness_fan_chart(robustness, title, initial_capital=100000):
+    # 重抽樣權益的分位數扇形圖 (P5–P95、P25–P75 兩層區間與中位數)，並疊上實際的歷史路徑
+    fan, fig = robustness['fan'] * initial_capital, go.Figure()
+    for low, high, color in (('P5', 'P95', 'rgba(31, 119, 180, 0.15)'), ('P25', 'P75', 'rgba(31, 119, 180, 0.3)')):
+        fig.add_trace(go.Scatter(x=fan.index, y=fan[high], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=fan.index, y=fan[low], mode='lines', line=dict(width=0), fill='tonexty', fillcolor=color, name=f'{low}–{high}'))
+    fig.add_trace(go.Scatter(x=fan.index, y=fan['P50'], mode='lines', name='中位數', line=dict(color='rgb(31, 119, 180)', dash='dash')))
+    fig.add_trace(go.Scatter(x=fan.index, y=robustness['actual'] * initial_capital, mode='lines', name='實際路徑', line=dict(color='orange')))
+    fig.update_layout(title=title, height=300)
+    return fig
+
+def update_live_chart(fig, bars, levels, max_candles=LIVE_CHART_CANDLES):
+    # 增量更新即時K線圖：圖上已收完的K棒原樣保留，只替換最後一根 (輪詢前可能仍在變動) 並附加新K棒，
+    # 超出視窗的舊K棒自前端移除；SL/TP 水平線隨每次輪詢替換
+    if fig is None:
+        fig = go.Figure(go.Candlestick(x=[], open=[], high=[], low=[], close=[], name='K線'))
+        fig.update_layout(height=400, xaxis_rangeslider_visible=False, margin=dict(t=30, b=10))
+    trace = fig.data[0]
+    old_x = list(trace.x or ())
+    start, keep = (old_x[-1], len(old_x) - 1) if old_x else (bars.index[0], 0)
+    fresh = bars[bars.index >= start]
+    merged = {field: list(getattr(trace, field) or ())[:keep] + fresh[field.capitalize()].tolist() for field in ('open', 'high', 'low', 'close')}
+    merged['x'] = old_x[:keep] + list(fresh.index)
+    trace.update({field: values[-max_candles:] for field, values in merged.items()})
+    fig.layout.shapes, fig.layout.annotations = (), ()
+    for name, color in (('SL', 'red'), ('TP', 'green')):
+        if pd.notna(levels.get(name)): fig.add_hline(y=levels[name], line_dash='dash', line_color=color, annotation_text=name)
+    return fig
+
+def select_chart_window(df, key):
+    # 以時間區間滑桿代替圖表縮放：區間越小，降採樣後保留的細節越多
+    if len(df) <= CHART_MAX_CANDLES: return df
+    dates = df.index.tz_localize(None) if getattr(df.index, 'tz', None) is not None else df.index
+    start, end = dates[0].to_pydatetime(), dates[-1].to_pydatetime()
+    step = (dates[1:] - dates[:-1]).min().to_pytimedelta()
+    view_start, view_end = st.slider('🔍 顯示區間 (縮小區間以載入更細的K線)', min_value=start, max_value=end,
+                                     value=(start, end), step=step, key=key)
+    return df[(dates >= view_start) & (dates <= view_end)]
+
 # ==============================================================================
-# 6. UI 呈現與主邏輯
+# 6. 分析流程核心與無介面批次執行 (UI 與 CLI 共用)
 # ==============================================================================
+def run_analysis_pipeline(symbol, period_key, strategy_names=None, strategy_params=None):
+    # 各階段耗時記入 report["timings"]，並以一行 JSON 寫入 ai_trend.metrics 記錄器
+    with stage_trace() as trace, timed_stage("pipeline") as total:
+        report = _run_analysis_pipeline(symbol, period_key, strategy_names, strategy_params)
+        total["rows"] = len(report["df_raw"])
+    report["timings"] = trace
+    METRICS_LOGGER.info(json.dumps({
+        "event": "analysis_pipeline", "symbol": symbol, "period_key": period_key, "ok": report["ok"],
+        "stages": [{key: value for key, value in record.items() if value is not None} for record in trace],
+    }, ensure_ascii=False))
+    return report
+
+def _run_analysis_pipeline(symbol, period_key, strategy_names=None, strategy_params=None):
+    # 流程：1. 資料組裝 -> 2. 基礎指標 -> 3. AI融合信號 -> 4. 獨立策略TP/SL -> 5. 回測
+    period, interval = PERIOD_MAP[period_key]
+    report = {"symbol": symbol, "period_key": period_key, "interval": interval, "ok": False, "strategy_params": strategy_params or {}}
+    with timed_stage("fetch"): report.update(assemble_report_data(symbol, period, interval))
+    df_raw = report["df_raw"]
+    if df_raw.empty and "df_raw" in report["fetch_errors"]:
+        report["error"] = f"資料來源暫時無法連線 (可能遭 Yahoo 限流)：{report['fetch_errors']['df_raw']}"
+        return report
+    if df_raw.empty or len(df_raw) < MIN_ANALYSIS_BARS: return report
+
+    if PIPELINE_LOW_MEMORY: report["df_raw"] = df_raw = compact_ohlcv(df_raw)
+    names = list(strategy_names or STRATEGY_FUNCTIONS.keys())
+    rows = len(df_raw)
+    ctx = get_indicator_cache(df_raw)
+    with timed_stage("indicators", rows=rows): df_tech = calculate_technical_indicators_incremental((symbol, interval), df_raw)
+    sltp = compute_strategy_sltp(df_raw, names, ctx, strategy_params) # 策略只計算一次，SL/TP 同時供報告與回測使用
+    strategy_levels = {name: {"SL": sl[-1], "TP": tp[-1]} for name, (sl, tp) in sltp.items()}
+    with timed_stage("fusion_signal", rows=rows):
+        fusion = generate_ai_fusion_signal_series(df_tech, report["fa_rating"], report["chips_data"])
+        analysis = generate_ai_fusion_signal(df_tech, report["fa_rating"], report["chips_data"])
+    with timed_stage("fusion_backtest", rows=rows): fusion_backtest = run_fusion_backtest(df_raw, fusion)
+    with timed_stage("backtest", rows=rows): backtest = run_backtest(df_raw)
+    with timed_stage("robustness", rows=rows): robustness = run_robustness_analysis(df_raw)
+    with timed_stage("strategy_backtest", rows=rows): strategy_backtests = run_strategy_backtest(df_raw, names, sltp=sltp)
+    report.update(
+        ok=True,
+        df_tech=df_tech,
+        analysis=analysis,
+        fusion_signal=fusion,
+        fusion_backtest=fusion_backtest,
+        strategy_levels=strategy_levels,
+        backtest=backtest,
+        robustness=robustness,
+        strategy_backtests=strategy_backtests,
+    )
+    return report
+
+def _json_number(value):
+    value = float(value)
+    return None if np.isnan(value) or np.isinf(value) else value
+
+def robustness_to_record(robustness):
+    # 各指標的 P5/P50/P95 (重抽樣信賴區間) 與虧損機率
+    if not robustness["paths"]: return {"method": robustness["method"], "paths": 0}
+    intervals = robustness["intervals"]
+    return {
+        "method": robustness["method"], "paths": robustness["paths"], "loss_probability": _json_number(robustness["loss_probability"]),
+        **{key: [_json_number(intervals.iloc[row][column]) for column in ("P5", "P50", "P95")] for row, key in enumerate(ROBUSTNESS_METRIC_LABELS)},
+    }
+
+def report_to_record(report):
+    # 將分析報告轉為可寫入 JSON/Parquet 的純資料 (不含 DataFrame)
+    record = {"symbol": report["symbol"], "period_key": report["period_key"], "interval": report["interval"], "ok": report["ok"]}
+    if not report["ok"]:
+        record["error"] = report.get("error", f"數據不足或代碼無效 (至少需要 {MIN_ANALYSIS_BARS} 根K棒)")
+        return record
+    df_raw, analysis, bt = report["df_raw"], report["analysis"], report["backtest"]
+    price, prev_close = df_raw['Close'].iloc[-1], df_raw['Close'].iloc[-2]
+    record.update({
+        "name": report["info"]["name"], "category": report["info"]["category"], "currency": report["info"]["currency"],
+        "bars": len(df_raw), "last_bar": df_raw.index[-1].isoformat(), "stale": report["stale"],
+        "price": _json_number(price), "change_pct": _json_number((price - prev_close) / prev_close * 100),
+        "action": analysis["action"], "score": _json_number(analysis["score"]), "confidence": _json_number(analysis["confidence"]),
+        "ai_opinions": analysis.get("ai_opinions", {}),
+        "fa_score": report["fa_rating"].get("score", 0), "fa_summary": report["fa_rating"].get("summary", ""),
+        "inst_hold_pct": _json_number(report["chips_data"].get("inst_hold_pct", 0)),
+        "ma_crossover_backtest": {key: (_json_number(bt[key]) if key in bt else None) for key in ("total_return", "win_rate", "max_drawdown", "total_trades")},
+        "ma_crossover_robustness": robustness_to_record(report["robustness"]),
+        "fusion_backtest": {key: _json_number(report["fusion_backtest"][key]) for key in ("total_return", "win_rate", "max_drawdown", "total_trades")},
+        "strategies": {
+            name: {
+                "SL": _json_number(levels["SL"]), "TP": _json_number(levels["TP"]),
+                "total_return": _json_number(report["strategy_backtests"][name]["total_return"]),
+                "win_rate": _json_number(report["strategy_backtests"][name]["win_rate"]),
+                "max_drawdown": _json_number(report["strategy_backtests"][name]["max_drawdown"]),
+                "total_trades": int(report["strategy_backtests"][name]["total_trades"]),
+            } for name, levels in report["strategy_levels"].items()
+        },
+    })
+    return record
+
+def _batch_worker(task):
+    symbol, period_key, strategy_names = task
+    try:
+        return report_to_record(run_analysis_pipeline(symbol, period_key, strategy_names))
+    except Exception as e:
+        return {"symbol": symbol, "period_key": period_key, "interval": PERIOD_MAP[period_key][1], "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+def _init_batch_worker(workers):
+    # 每個工作程序各有自己的 UPSTREAM 令牌桶：平分全域額度，使所有程序合計不超過 UPSTREAM_RATE_PER_SECOND
+    if UPSTREAM.bucket: UPSTREAM.bucket = TokenBucket(UPSTREAM.bucket.rate / workers, max(1, UPSTREAM.bucket.burst // workers))
+
+def run_batch_analysis(symbols, period_key, strategy_names=None, workers=None):
+    # 以多行程池平行分析多個標的，回傳與輸入順序相同的紀錄列表
+    tasks = [(symbol, period_key, strategy_names) for symbol in symbols]
+    if workers == 1 or len(tasks) <= 1: return [_batch_worker(task) for task in tasks]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(workers,)) as pool:
+        return list(pool.map(_batch_worker, tasks))
+
+def _optimize_worker(task):
+    symbol, df, strategy_name, method, samples, folds, seed = task
+    try:
+        return symbol, strategy_name, optimize_strategy(df, strategy_name, method, samples, folds, seed), None
+    except Exception as e:
+        return symbol, strategy_name, None, f"{type(e).__name__}: {e}"
+
+def run_optimization(frames, strategy_names, method="halving", samples=OPTIMIZER_RANDOM_SAMPLES, folds=OPTIMIZER_FOLDS, seed=0, workers=None):
+    # 以多行程池平行最佳化每個 (標的, 策略)，回傳 ({代碼: {策略名稱: 結果}}, 錯誤訊息列表)；沒有可調參數的策略略過
+    tasks = [(symbol, df, name, method, samples, folds, seed) for symbol, df in frames.items()
+             for name in strategy_names if STRATEGY_PARAM_SPACES.get(STRATEGY_FUNCTIONS[name].__name__)]
+    if workers == 1 or len(tasks) <= 1: outputs = [_optimize_worker(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool: outputs = list(pool.map(_optimize_worker, tasks))
+    results, errors = {}, []
+    updated = pd.Timestamp.now(tz='UTC').isoformat(timespec='seconds')
+    for symbol, name, result, error in outputs:
+        if result is not None: results.setdefault(symbol, {})[name] = {**result, "updated": updated}
+        elif error: errors.append(f"{symbol} / {name}: {error}")
+    return results, errors
+
+def run_optimize_command(args, symbols, strategy_names):
+    period_key = {interval: key for key, (_, interval) in PERIOD_MAP.items()}[args.interval]
+    period, interval = PERIOD_MAP[period_key]
+    frames, failed = {}, []
+    for symbol in symbols:
+        try:
+            df = get_stock_data(symbol, period, interval)
+        except Exception:
+            df = pd.DataFrame()
+        if len(df) >= MIN_ANALYSIS_BARS: frames[symbol] = df
+        else: failed.append(symbol)
+    started = time.perf_counter()
+    results, errors = run_optimization(frames, strategy_names, args.method, args.samples, args.folds, args.seed, args.workers)
+    save_optimized_params(interval, results, args.output)
+    for symbol, strategies in results.items():
+        for name, result in strategies.items():
+            print(f"{symbol} | {name}: {result['params']} 全期 {result['total_return']:.2f}% / 樣本外 {result['oos_return']:.2f}% ({result['evaluations']} 次評估)")
+    for error in errors: print(f"最佳化錯誤: {error}")
+    print(f"完成 {len(results)}/{len(symbols)} 個標的，耗時 {time.perf_counter() - started:.1f} 秒 -> {args.output}" + (f"；數據不足: {', '.join(failed)}" if failed else ""))
+    return 0 if results else 1
+
+def batch_records_to_frame(records):
+    # 每個 (標的, 策略) 一列的扁平表，供 Parquet 輸出
+    rows = []
+    for record in records:
+        base = {k: v for k, v in record.items() if k not in ("ai_opinions", "strategies", "ma_crossover_backtest")}
+        for key, value in record.get("ma_crossover_backtest", {}).items(): base[f"ma_crossover_{key}"] = value
+        strategies = record.get("strategies") or {None: {}}
+        for name, values in strategies.items():
+            rows.append({**base, "strategy": name, **{f"strategy_{k}": v for k, v in values.items()}})
+    return pd.DataFrame(rows)
+
+def benchmark_cases(df):
+    # 每次執行都建立新的指標快取，量測的是完整計算而非記憶化後的查表
+    fresh_ctx = lambda: IndicatorCache(df[OHLCV_COLUMNS])
+    # 回看期間掃描：同一份指標快取查詢多個視窗的滾動高低點
+    range_extrema_windows = lambda ctx: [ctx.get(name, column=column, window=window) for name, column in (('rolling_max', 'High'), ('rolling_min', 'Low'))
+                                         for window in STRATEGY_PARAM_SPACES["support_resistance"]["lookback"]]
+    df_tech = calculate_technical_indicators(df.copy(), ctx=fresh_ctx())
+    cases = {
+        "pandas_rsi": lambda: pandas_rsi(df['Close']),
+        "pandas_true_range": lambda: pandas_true_range(df),
+        "pandas_atr": lambda: pandas_atr(df),
+        "pandas_adx": lambda: pandas_adx(df),
+        "pandas_macd": lambda: pandas_macd(df['Close']),
+        "range_extrema_windows": lambda: range_extrema_windows(fresh_ctx()),
+        "calculate_technical_indicators": lambda: calculate_technical_indicators(df.copy(), ctx=fresh_ctx()),
+    }
+    for func in STRATEGY_FUNCTIONS.values(): cases[f"strategy.{func.__name__}"] = lambda func=func: func(df, ctx=fresh_ctx())
+    cases.update({
+        "generate_ai_fusion_signal": lambda: generate_ai_fusion_signal(df_tech, SCANNER_NEUTRAL_FA, SCANNER_NEUTRAL_CHIPS),
+        "generate_ai_fusion_signal_series": lambda: generate_ai_fusion_signal_series(df_tech, SCANNER_NEUTRAL_FA, SCANNER_NEUTRAL_CHIPS),
+        "run_backtest": lambda: run_backtest(df),
+        "run_robustness_analysis": lambda: run_robustness_analysis(df),
+        "create_comprehensive_chart": lambda: create_comprehensive_chart(df_tech, "BENCH", "bench"),
+    })
+    return cases
+
+def run_benchmarks(sizes=BENCH_SIZES, repeat=3, selectors=None):
+    # 以可重現的合成1分K (離線數據來源) 量測每個案例：第一次執行以 tracemalloc 記錄記憶體峰值，之後取 repeat 次中最快的時間
+    provider = OfflineProvider()
+    selected = lambda name: not selectors or any(sel.lower() in name.lower() for sel in selectors)
+    for name, func in benchmark_cases(provider.synthetic_ohlcv("BENCH", "1m", bars=300)).items(): # 預先完成 numba 編譯
+        if selected(name): func()
+    rows = []
+    for size in sizes:
+        for name, func in benchmark_cases(provider.synthetic_ohlcv("BENCH", "1m", bars=size)).items():
+            if not selected(name): continue
+            tracemalloc.start()
+            try:
+                func()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - started)
+            rows.append({"case": name, "bars": size, "seconds": min(timings), "peak_mb": peak / 2**20})
+    return pd.DataFrame(rows)
+
+def compare_benchmarks(results, baseline, tolerance=BENCH_REGRESSION_TOLERANCE):
+    # 時間或記憶體峰值超過基準 (1 + tolerance) 倍且超過最小絕對差時標記為退步；基準中沒有的案例不比較
+    base = pd.DataFrame(baseline, columns=["case", "bars", "seconds", "peak_mb"]).rename(columns={"seconds": "baseline_seconds", "peak_mb": "baseline_peak_mb"})
+    merged = results.merge(base, on=["case", "bars"], how="left")
+    merged["time_ratio"] = merged["seconds"] / merged["baseline_seconds"]
+    slower = (merged["time_ratio"] > 1 + tolerance) & (merged["seconds"] - merged["baseline_seconds"] > BENCH_MIN_DELTA_SECONDS)
+    heavier = (merged["peak_mb"] > merged["baseline_peak_mb"] * (1 + tolerance)) & (merged["peak_mb"] - merged["baseline_peak_mb"] > BENCH_MIN_DELTA_MB)
+    merged["regression"] = slower | heavier
+    return merged
+
+def run_benchmark_command(args):
+    results = run_benchmarks(args.sizes, args.repeat, args.cases)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f: json.dump(results.to_dict(orient="records"), f, indent=2)
+        print(results.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+        print(f"已儲存基準 -> {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(results.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+        print(f"找不到基準檔 {args.baseline}，以 --save-baseline 建立")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f: compared = compare_benchmarks(results, json.load(f), args.tolerance)
+    print(compared.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    regressions = compared[compared["regression"]]
+    if not regressions.empty: print(f"效能退步 {len(regressions)} 項: " + ", ".join(f"{r.case} ({r.bars})" for r in regressions.itertuples()))
+    return 1 if not regressions.empty else 0
+
+def resolve_strategy_names(selectors):
+    # 接受完整名稱、名稱片段 (不分大小寫，例如 supertrend) 或 all
+    if not selectors or any(sel.lower() == 'all' for sel in selectors): return list(STRATEGY_FUNCTIONS.keys())
+    names = []
+    for selector in selectors:
+        matches = [name for name in STRATEGY_FUNCTIONS if selector.lower() in name.lower()]
+        if not matches: raise ValueError(f"找不到策略: {selector}")
+        names.extend(m for m in matches if m not in names)
+    return names
+
+def load_watchlist(path):
+    with open(path, encoding='utf-8') as f:
+        return [line.split('#', 1)[0].strip() for line in f if line.split('#', 1)[0].strip()]
+
+def run_cli(argv):
+    interval_to_period_key = {interval: key for key, (_, interval) in PERIOD_MAP.items()}
+    parser = argparse.ArgumentParser(prog="app3.0.py", description="AI 趨勢分析無介面批次執行 (例如每晚排程產生報告) 與效能基準測試")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    def add_target_arguments(subparser):
+        targets = subparser.add_mutually_exclusive_group(required=True)
+        targets.add_argument("--symbols", nargs="+", help="代碼或名稱 (例如 NVDA 2330 台積電)")
+        targets.add_argument("--watchlist", help="觀察清單檔案，每行一個代碼，# 之後為註解")
+        targets.add_argument("--category", choices=["all"] + list(CATEGORY_MAP.keys()), help="使用內建資產類別 (all 為全部標的)")
+        subparser.add_argument("--interval", choices=list(interval_to_period_key.keys()), default="1d", help="K棒週期 (預設 1d)")
+        subparser.add_argument("--strategies", nargs="+", default=["all"], help="策略名稱或片段，預設 all")
+        subparser.add_argument("--workers", type=int, default=os.cpu_count(), help="行程數 (預設為 CPU 核心數)")
+    batch = subparsers.add_parser("batch", help="批次分析觀察清單並輸出 JSON/Parquet")
+    add_target_arguments(batch)
+    batch.add_argument("--output", required=True, help="輸出檔案路徑 (.json 或 .parquet)")
+    optimize = subparsers.add_parser("optimize", help="以前進分析搜尋各策略參數，結果寫入最佳化參數檔供介面使用")
+    add_target_arguments(optimize)
+    optimize.add_argument("--method", choices=OPTIMIZER_METHODS, default="halving", help="搜尋方式：網格、隨機抽樣或逐次減半 (預設 halving)")
+    optimize.add_argument("--samples", type=int, default=OPTIMIZER_RANDOM_SAMPLES, help=f"random 每個策略的抽樣組數 (預設 {OPTIMIZER_RANDOM_SAMPLES})")
+    optimize.add_argument("--folds", type=int, default=OPTIMIZER_FOLDS, help=f"前進分析的測試段數 (預設 {OPTIMIZER_FOLDS})")
+    optimize.add_argument("--seed", type=int, default=0, help="random 抽樣的亂數種子")
+    optimize.add_argument("--output", default=OPTIMIZED_PARAMS_PATH, help="最佳化參數檔 (JSON，合併寫入)")
+    bench = subparsers.add_parser("bench", help="以合成K線量測指標、策略、回測與圖表的執行時間與記憶體峰值，並與基準比較")
+    bench.add_argument("--sizes", nargs="+", type=int, default=list(BENCH_SIZES), help="K棒筆數 (預設 1k 10k 100k 1M)")
+    bench.add_argument("--repeat", type=int, default=3, help="每個案例的計時次數，取最快一次 (預設 3)")
+    bench.add_argument("--cases", nargs="+", help="只執行名稱包含這些片段的案例 (例如 supertrend pandas_)")
+    bench.add_argument("--baseline", default=BENCH_BASELINE_PATH, help="基準檔路徑 (JSON)")
+    bench.add_argument("--save-baseline", action="store_true", help="將本次結果寫入基準檔")
+    bench.add_argument("--tolerance", type=float, default=BENCH_REGRESSION_TOLERANCE, help="判定退步的容許比例 (預設 0.25)")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("streamlit").setLevel(logging.ERROR) # 無介面執行時略過 Streamlit 的 bare mode 警告
+    if args.command == "bench": return run_benchmark_command(args)
+    if args.symbols: symbols = [get_symbol_from_query(q) for q in args.symbols]
+    elif args.watchlist: symbols = [get_symbol_from_query(q) for q in load_watchlist(args.watchlist)]
+    else: symbols = list(FULL_SYMBOLS_MAP.keys()) if args.category == "all" else CATEGORY_MAP[args.category]
+    try:
+        strategy_names = resolve_strategy_names(args.strategies)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.command == "optimize": return run_optimize_command(args, symbols, strategy_names)
+
+    records = run_batch_analysis(symbols, interval_to_period_key[args.interval], strategy_names, workers=args.workers)
+    if args.output.endswith(".parquet"):
+        batch_records_to_frame(records).to_parquet(args.output, index=False)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f: json.dump(records, f, ensure_ascii=False, indent=2)
+    failed = [r["symbol"] for r in records if not r["ok"]]
+    print(f"完成 {len(records) - len(failed)}/{len(records)} 個標的 -> {args.output}" + (f"；失敗: {', '.join(failed)}" if failed else ""))
+    return 0 if len(failed) < len(records) else 1
+
+class CachePrewarmer:
+    # 背景執行緒依排程更新價格、基本面與指標快取，並以獨立的執行緒池限制同時請求數 (不佔用互動請求的資源)
+    FUNDAMENTAL_SOURCES = (get_ticker_info, get_institutional_holders, get_ticker_news)
+
+    def __init__(self, concurrency=PREWARM_CONCURRENCY, rate=PREWARM_RATE_PER_SECOND):
+        self.bucket = TokenBucket(rate, PREWARM_BURST) if rate and MARKET_DATA.rate_limited else None
+        # 每個標的每輪價格更新 1 次請求，另外平均分攤基本面的請求；受限速時只預熱一輪內請求得完的標的數
+        requests_per_target = 1 + len(self.FUNDAMENTAL_SOURCES) * PREWARM_PRICE_INTERVAL_SECONDS / PREWARM_FUNDAMENTALS_INTERVAL_SECONDS
+        self.max_targets = int(PREWARM_PRICE_INTERVAL_SECONDS * rate * PREWARM_BUDGET_SHARE / requests_per_target) if self.bucket else None
+        self.request_counts = Counter()
+        self._last_refresh = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix="cache-prewarm")
+        self._thread = threading.Thread(target=self._run, daemon=True, name="cache-prewarmer")
+
+    def start(self):
+        if not self._thread.is_alive(): self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def record_request(self, symbol, period_key):
+        with self._lock: self.request_counts[(symbol, period_key)] += 1
+
+    def targets(self):
+        # 最常被查詢的 (標的, 週期) 優先，其次為各類別熱門清單 (預設週期，各類別輪流取，名額不足時每個類別都保留前幾名)
+        with self._lock: most_requested = [key for key, _ in self.request_counts.most_common(PREWARM_TOP_REQUESTED)]
+        ranked = itertools.zip_longest(*(list(options.values()) for options in CATEGORY_HOT_OPTIONS.values()))
+        hot = [(code, PREWARM_DEFAULT_PERIOD_KEY) for codes in ranked for code in codes if code is not None]
+        return list(dict.fromkeys(most_requested + hot))[:self.max_targets]
+
+    def _due(self, key, interval_seconds, now):
+        return now - self._last_refresh.get(key, float('-inf')) >= interval_seconds
+
+    @staticmethod
+    def _fresh(func, args, interval_seconds):
+        age = func.age(*args)
+        return age is not None and age < interval_seconds
+
+    def refresh_prices(self, symbol, period_key):
+        period, interval = PERIOD_MAP[period_key]
+        if self._fresh(get_stock_data, (symbol, period, interval), PREWARM_PRICE_INTERVAL_SECONDS): return
+        base_interval, base_period, _ = timeframe_source(interval, period)
+        # 只向上游請求一次 (增量更新本地儲存)，失敗時拋出例外並保留原有快取；價格快取直接由這份基礎序列產生
+        base = get_base_history.refresh(symbol, base_period, base_interval)
+        df = get_stock_data.store(stock_frame_from_base(base, symbol, period, interval), symbol, period, interval)
+        if len(df) >= MIN_ANALYSIS_BARS: calculate_technical_indicators_incremental((symbol, interval), df)
+
+    def refresh_fundamentals(self, symbol):
+        # 上游失敗時拋出例外 (由下一輪重試)，共用快取中原有的項目不受影響
+        for func in self.FUNDAMENTAL_SOURCES:
+            if not self._fresh(func, (symbol,), PREWARM_FUNDAMENTALS_INTERVAL_SECONDS): func.refresh(symbol)
+
+    def _run_job(self, func, *args):
+        with UPSTREAM.budget(self.bucket): return func(*args)
+
+    def run_once(self):
+        now = time.monotonic()
+        jobs = []
+        for symbol, period_key in self.targets():
+            if self._due(('prices', symbol, period_key), PREWARM_PRICE_INTERVAL_SECONDS, now):
+                jobs.append((('prices', symbol, period_key), self.refresh_prices, (symbol, period_key)))
+            if self._due(('fundamentals', symbol), PREWARM_FUNDAMENTALS_INTERVAL_SECONDS, now):
+                jobs.append((('fundamentals', symbol), self.refresh_fundamentals, (symbol,)))
+        jobs = list({key: (key, func, args) for key, func, args in jobs}.values())
+        futures = [(key, self._pool.submit(self._run_job, func, *args)) for key, func, args in jobs]
+        for key, future in futures:
+            try:
+                future.result()
+                self._last_refresh[key] = time.monotonic()
+            except Exception:
+                pass # 下一輪重試
+        return len(futures)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(PREWARM_TICK_SECONDS)
+
+@st.cache_resource
+def get_cache_prewarmer():
+    prewarmer = CachePrewarmer()
+    return prewarmer.start() if PREWARM_ENABLED else prewarmer
+
+@st.cache_resource
+def get_metrics_server():
+    return start_metrics_server() if METRICS_PORT else None
+
+def cached_analysis_report(symbol, period_key, strategy_params=None):
+    # 報告依 (代碼, 週期, 策略參數, 數據版本) 保存在工作階段中：選單、滑桿等元件造成的重跑只重新繪製，
+    # 價格快取更新 (數據版本改變) 後才重跑整個分析流程
+    period, interval = PERIOD_MAP[period_key]
+    try:
+        # 只有快取未命中 (需要向上游請求) 時才顯示下載中的提示
+        with st.spinner("正在從 Yahoo Finance 獲取最新市場數據...") if get_stock_data.age(symbol, period, interval) is None else nullcontext():
+            version = data_version(get_stock_data_or_stale(symbol, period, interval))
+    except Exception:
+        version = None
+    key = (symbol, period_key, json.dumps(strategy_params or {}, sort_keys=True), version)
+    cached = st.session_state.get('analysis_report')
+    if version is not None and cached is not None and cached['key'] == key: return cached['report']
+    report = run_analysis_pipeline(symbol, period_key, strategy_params=strategy_params)
+    st.session_state['analysis_report'] = {'key': key, 'report': report}
+    return report
+
+def report_extra(report, name, func, *args):
+    # 報告上按需計算的附加結果 (其他重抽樣方法、參數掃描) 隨報告快取，同一份報告只計算一次
+    extras = report.setdefault("extras", {})
+    if (name, args) not in extras: extras[(name, args)] = func(*args)
+    return extras[(name, args)]
+
+def profile_analysis_pipeline(symbol, period_key, strategy_params=None):
+    # 以 cProfile 執行一次分析流程 (只涵蓋主執行緒；平行的資料請求另見階段耗時)，回傳報告與依累計時間排序的前 40 個函式
+    profiler = cProfile.Profile()
+    report = profiler.runcall(run_analysis_pipeline, symbol, period_key, strategy_params=strategy_params)
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(40)
+    return report, stream.getvalue()
+
+def live_snapshot(symbol, period_key, strategy_name, fa_rating, chips_data, strategy_params=None):
+    # 即時模式的單次輪詢：略過價格快取直接增量更新本地儲存 (只請求最後一根已存K棒之後的資料)；
+    # 已收完的K棒延續串流指標引擎的狀態，只重算目前價格、AI 評分與所選策略的 SL/TP
+    period, interval = PERIOD_MAP[period_key]
+    with timed_stage("live_fetch"):
+        closed, partial = fetch_ohlcv_with_partial(symbol, period, interval)
+    closed = trim_to_period(closed, period)
+    if len(closed) < MIN_ANALYSIS_BARS: return None
+    # 不清除價格快取：完整報告依快取 TTL 更新，輪詢不會讓每次頁面互動都重跑整個分析流程
+    with timed_stage("live_update", rows=len(closed)):
+        df_tech = calculate_technical_indicators_incremental((symbol, interval), closed)
+        sl, tp = compute_strategy_sltp(closed, [strategy_name], strategy_params=strategy_params)[strategy_name]
+        analysis = generate_ai_fusion_signal(df_tech, fa_rating, chips_data)
+    bars = pd.concat([closed.iloc[-LIVE_CHART_CANDLES:], partial])
+    return {
+        "bars": bars,
+        "price": bars['Close'].iloc[-1],
+        "prev_close": bars['Close'].iloc[-2],
+        "analysis": analysis,
+        "levels": {"SL": sl[-1], "TP": tp[-1]},
+        "partial": not partial.empty,
+    }
+
+# ==============================================================================
+# 7. UI 呈現與主邏輯
+# ==============================================================================
+def render_debug_panel(report, profile_text=None):
+    with st.expander("🛠️ 效能偵錯面板", expanded=True):
+        timings = pd.DataFrame(report.get("timings", []), columns=["stage", "seconds", "cache", "rows"])
+        timings["ms"] = (timings.pop("seconds") * 1000).round(1)
+        st.dataframe(timings.rename(columns={"stage": "階段", "cache": "快取", "rows": "筆數", "ms": "耗時 (ms)"}), use_container_width=True, hide_index=True)
+        st.caption("fetch 為平行請求的總等待時間，其中各資料請求 (get_stock_data 等) 在工作執行緒中同時進行。")
+        if profile_text: st.code(profile_text, language="text")
+        with st.expander("Prometheus 指標 (本程序累計)"): st.code(STAGE_METRICS.prometheus_text(), language="text")
+
+def render_market_scanner():
+    scan_options = ["全部標的 (All)"] + list(CATEGORY_MAP.keys())
+    scan_category = st.sidebar.selectbox('1. 選擇掃描範圍', scan_options, index=0, key='scan_category_selector')
+    scan_period_key = st.sidebar.selectbox('2. 選擇分析週期', list(PERIOD_MAP.keys()), index=2, key='scan_period_selector')
+    st.sidebar.markdown("---")
+
+    if st.sidebar.button('🔎 執行市場掃描', use_container_width=True):
+        st.session_state['scan_request'] = (scan_category, scan_period_key)
+
+    if 'scan_request' not in st.session_state:
+        st.markdown("<h1 style='color: #FA8072;'>🔎 市場掃描</h1>", unsafe_allow_html=True)
+        st.markdown("選擇掃描範圍與週期後，點擊 <span style='color: #FA8072; font-weight: bold;'>『🔎 執行市場掃描』</span>，AI將批次分析所有標的並依評分排序。", unsafe_allow_html=True)
+        return
+
+    scan_category, scan_period_key = st.session_state['scan_request']
+    symbols = list(FULL_SYMBOLS_MAP.keys()) if scan_category == scan_options[0] else CATEGORY_MAP[scan_category]
+    period, interval = PERIOD_MAP[scan_period_key]
+    with st.spinner(f"🔍 正在掃描 **{len(symbols)}** 個標的..."):
+        ranking = scan_market(symbols, period, interval)
+
+    st.header(f"🔎 市場掃描排行 ({scan_category} | {scan_period_key})")
+    failed = ranking.attrs.get('failed', {})
+    if failed:
+        shown = "、".join(list(failed)[:SCANNER_FAILED_SHOWN]) + (" 等" if len(failed) > SCANNER_FAILED_SHOWN else "")
+        st.error(f"❌ **{len(failed)} 個標的下載失敗：** {shown} ({next(iter(failed.values()))})，這些標的未列入排行，請稍後再試。")
+    if ranking.empty:
+        st.error("❌ **掃描失敗：** 無法取得足夠的市場數據。")
+        return
+    st.caption(f"成功分析 {len(ranking)} / {len(symbols)} 個標的。掃描僅使用技術面與成交量評分 (基本面與籌碼以中性值計)，點擊欄位標題可排序。")
+    view = st.radio("排行依據", list(SCANNER_RANKINGS), horizontal=True, key='scan_ranking_view')
+    ranked = rank_market_scan(ranking, view)
+    if ranked.empty:
+        st.info(f"目前沒有標的突破前 {SCANNER_DONCHIAN_WINDOW} 根K棒的唐奇安通道。")
+        return
+    st.dataframe(ranked, use_container_width=True, hide_index=True)
+
+def render_price_and_levels(price, prev_close, analysis, strategy_name, levels, currency_symbol):
+    st.subheader("💡 核心行動與量化評分")
+    change, pct = price - prev_close, (price - prev_close) / prev_close * 100
+    
+    c1, c2, c3, c4 = st.columns(4)
+    pf = ".4f" if price < 100 and currency_symbol != 'NT$' else ".2f"
+    c1.metric("💰 當前價格", f"{currency_symbol}{price:{pf}}", f"{change:{pf}} ({pct:+.2f}%)")
+    c2.metric("🎯 AI 行動建議", analysis['action'])
+    c3.metric("🔥 AI 總量化評分", f"{analysis['score']:.2f}")
+    c4.metric("🛡️ AI 信心指數", f"{analysis['confidence']:.0f}%")
+    
+    st.markdown("---")
+    st.subheader(f"🛡️ 精確交易策略 ({strategy_name})")
+    s1, s2, s3 = st.columns(3)
+    s1.metric("建議進場價:", f"{currency_symbol}{price:{pf}}")
+    s2.metric("🚀 止盈價 (TP):", f"{currency_symbol}{levels['TP']:{pf}}" if pd.notna(levels['TP']) else "N/A")
+    s3.metric("🛑 止損價 (SL):", f"{currency_symbol}{levels['SL']:{pf}}" if pd.notna(levels['SL']) else "N/A")
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def render_live_section(symbol, period_key, strategy_name, fa_rating, chips_data, currency_symbol, strategy_params=None):
+    # 片段重跑：計時器只重跑這個區塊 (價格、SL/TP、最近K線)，頁面其餘的報告、表格與完整圖表不會重建
+    state_key = (symbol, period_key, strategy_name, json.dumps(strategy_params, sort_keys=True))
+    live = st.session_state.get('live_state')
+    if live is None or live['key'] != state_key: live = st.session_state['live_state'] = {'key': state_key, 'fig': None, 'snapshot': None, 'polled_at': None}
+    # 片段也會隨整頁重跑執行：只在計時器週期到達時輪詢上游 (容許半個週期的計時誤差)，其餘重跑沿用上一次的快照
+    now = time.monotonic()
+    snapshot = live['snapshot']
+    if snapshot is None or now - live['polled_at'] >= LIVE_REFRESH_SECONDS / 2:
+        live['polled_at'], live['updated'] = now, pd.Timestamp.now()
+        try:
+            snapshot = live_snapshot(symbol, period_key, strategy_name, fa_rating, chips_data, strategy_params) or snapshot
+        except Exception as e:
+            st.warning(f"⚠️ 即時更新失敗，顯示上一次的數據：{type(e).__name__}: {e}")
+    if snapshot is None:
+        st.error(f"❌ **數據不足：** {symbol} 目前無法取得即時K線。")
+        return
+    live['snapshot'] = snapshot
+    render_price_and_levels(snapshot['price'], snapshot['prev_close'], snapshot['analysis'], strategy_name, snapshot['levels'], currency_symbol)
+    live['fig'] = update_live_chart(live['fig'], snapshot['bars'], snapshot['levels'])
+    st.caption(f"🔴 即時模式：每 {LIVE_REFRESH_SECONDS} 秒更新 (最後更新 {live['updated']:%H:%M:%S})，"
+               f"最近 {LIVE_CHART_CANDLES} 根K線{'，最後一根尚未收完' if snapshot['partial'] else ''}。")
+    st.plotly_chart(live['fig'], use_container_width=True, key='live_chart')
+
 def main():
     if 'run_analysis' not in st.session_state: st.session_state['run_analysis'] = False
+    get_cache_prewarmer() # 每個行程啟動一次背景快取預熱
+    get_metrics_server()
 
     st.sidebar.title("🚀 AI 趨勢分析")
     st.sidebar.markdown("---")
+    app_mode = st.sidebar.radio('模式', ['單一標的分析', '市場掃描'], horizontal=True, key='app_mode')
+    if app_mode == '市場掃描':
+        render_market_scanner()
+        return
     
     selected_category = st.sidebar.selectbox('1. 選擇資產類別', list(CATEGORY_HOT_OPTIONS.keys()), index=2, key='category_selector')
     hot_options_map = CATEGORY_HOT_OPTIONS.get(selected_category, {})
@@ -760,6 +3209,13 @@ def main():
     
     st.sidebar.selectbox('2. 選擇熱門標的', list(hot_options_map.keys()), index=default_index, key='hot_target_selector', on_change=sync_text_input_from_selection)
     st.sidebar.text_input('...或手動輸入代碼/名稱:', st.session_state.get('sidebar_search_input', 'SOL-USD'), key='sidebar_search_input')
+    search_query = st.session_state.get('sidebar_search_input', '')
+    if search_query and not SYMBOL_INDEX.resolve(search_query):
+        suggestions = SYMBOL_INDEX.suggest(search_query)
+        if suggestions:
+            st.sidebar.selectbox('🔍 相符標的建議', suggestions, index=None, placeholder="選擇建議的標的...", key='symbol_suggestion',
+                                 format_func=lambda c: f"{c} - {FULL_SYMBOLS_MAP[c]['name']}", on_change=apply_symbol_suggestion)
+        else: st.sidebar.caption("找不到相符的標的，將直接以輸入的代碼查詢。")
     
     st.sidebar.markdown("---")
     selected_period_key = st.sidebar.selectbox('3. 選擇分析週期', list(PERIOD_MAP.keys()), index=2)
@@ -771,32 +3227,37 @@ def main():
         st.session_state['symbol_to_analyze'] = get_symbol_from_query(st.session_state.sidebar_search_input)
         st.session_state['period_key'] = selected_period_key
         st.session_state['strategy_name'] = selected_strategy_name
+        get_cache_prewarmer().record_request(st.session_state['symbol_to_analyze'], selected_period_key)
+    show_debug = st.sidebar.checkbox('🛠️ 顯示效能偵錯面板', key='show_debug_panel')
+    profile_run = show_debug and st.sidebar.checkbox('⏱️ 以 cProfile 剖析分析流程', key='profile_run')
+    use_optimized = st.sidebar.checkbox('⚙️ 使用最佳化策略參數', key='use_optimized_params',
+                                        help="採用 optimize 指令為此標的與週期找到的策略參數；沒有最佳化結果的策略使用預設參數。")
+    live_mode = st.sidebar.checkbox('🔴 即時模式 (自動更新)', key='live_mode',
+                                    help=f"適用於 {'、'.join(LIVE_PERIOD_KEYS)} 週期：每 {LIVE_REFRESH_SECONDS} 秒輪詢新K棒，只更新價格、SL/TP 與最近K線。")
 
     if st.session_state.get('run_analysis', False):
         final_symbol = st.session_state['symbol_to_analyze']
         period_key = st.session_state['period_key']
         strategy_name = st.session_state['strategy_name']
-        period, interval = PERIOD_MAP[period_key]
 
+        strategy_params = load_optimized_params(final_symbol, PERIOD_MAP[period_key][1]) if use_optimized else {}
         with st.spinner(f"🔍 正在啟動AI模型，分析 **{final_symbol}**..."):
-            df_raw = get_stock_data(final_symbol, period, interval)
+            profile_text = None
+            if profile_run: report, profile_text = profile_analysis_pipeline(final_symbol, period_key, strategy_params)
+            else: report = cached_analysis_report(final_symbol, period_key, strategy_params)
+            df_raw = report["df_raw"]
             
-            if df_raw.empty or len(df_raw) < 52:
-                st.error(f"❌ **數據不足或代碼無效：** {final_symbol}。AI模型至少需要52個數據點才能進行精準分析。")
+            if not report["ok"] and report.get("error"):
+                st.error(f"❌ **{final_symbol}：** {report['error']}，請稍後再試。")
+            elif not report["ok"]:
+                st.error(f"❌ **數據不足或代碼無效：** {final_symbol}。AI模型至少需要{MIN_ANALYSIS_BARS}個數據點才能進行精準分析。")
             else:
-                info = get_company_info(final_symbol)
-                fa_rating = calculate_advanced_fundamental_rating(final_symbol)
-                chips_data = get_chips_and_news_analysis(final_symbol)
-                
-                # 流程：1. 基礎指標 -> 2. AI融合信號 -> 3. 獨立策略TP/SL
-                df_tech = calculate_technical_indicators(df_raw.copy())
-                analysis = generate_ai_fusion_signal(df_tech, fa_rating, chips_data)
-                
-                strategy_func = STRATEGY_FUNCTIONS[strategy_name]
-                df_strategy = strategy_func(df_tech.copy())
-                
-                strategy_sl = df_strategy.iloc[-1].get('SL', np.nan)
-                strategy_tp = df_strategy.iloc[-1].get('TP', np.nan)
+                if report["stale"]:
+                    st.warning(f"⚠️ 資料來源暫時無法連線，以下分析使用本地儲存的最後一份數據 (截至 {df_raw.index[-1]})，可能已過時。")
+                info, fa_rating, chips_data = report["info"], report["fa_rating"], report["chips_data"]
+                df_tech, analysis = report["df_tech"], report["analysis"]
+                strategy_sl = report["strategy_levels"][strategy_name]["SL"]
+                strategy_tp = report["strategy_levels"][strategy_name]["TP"]
                 
                 st.header(f"📈 {info['name']} ({final_symbol}) AI趨勢分析報告")
 
@@ -807,25 +3268,16 @@ def main():
                     st.markdown(f"**分析週期:** {period_key} | **FA評級:** **{fa_rating.get('score',0):.1f}/7.0** | **診斷:** {fa_rating.get('summary','N/A')}")
                 st.markdown("---")
                 
-                st.subheader("💡 核心行動與量化評分")
-                price = df_raw['Close'].iloc[-1]
-                prev_close = df_raw['Close'].iloc[-2]
-                change, pct = price - prev_close, (price - prev_close) / prev_close * 100
-                currency_symbol = get_currency_symbol(final_symbol)
-                
-                c1, c2, c3, c4 = st.columns(4)
-                pf = ".4f" if price < 100 and currency_symbol != 'NT$' else ".2f"
-                c1.metric("💰 當前價格", f"{currency_symbol}{price:{pf}}", f"{change:{pf}} ({pct:+.2f}%)")
-                c2.metric("🎯 AI 行動建議", analysis['action'])
-                c3.metric("🔥 AI 總量化評分", f"{analysis['score']:.2f}")
-                c4.metric("🛡️ AI 信心指數", f"{analysis['confidence']:.0f}%")
-                
-                st.markdown("---")
-                st.subheader(f"🛡️ 精確交易策略 ({strategy_name})")
-                s1, s2, s3 = st.columns(3)
-                s1.metric("建議進場價:", f"{currency_symbol}{price:{pf}}")
-                s2.metric("🚀 止盈價 (TP):", f"{currency_symbol}{strategy_tp:{pf}}" if pd.notna(strategy_tp) else "N/A")
-                s3.metric("🛑 止損價 (SL):", f"{currency_symbol}{strategy_sl:{pf}}" if pd.notna(strategy_sl) else "N/A")
+                currency_symbol = format_currency_symbol(info.get('currency', 'USD'))
+                if live_mode and period_key in LIVE_PERIOD_KEYS:
+                    render_live_section(final_symbol, period_key, strategy_name, fa_rating, chips_data, currency_symbol, strategy_params)
+                else:
+                    render_price_and_levels(df_raw['Close'].iloc[-1], df_raw['Close'].iloc[-2], analysis, strategy_name,
+                                            {"SL": strategy_sl, "TP": strategy_tp}, currency_symbol)
+                if strategy_name in strategy_params:
+                    st.caption("⚙️ 最佳化參數：" + "、".join(f"{key}={value}" for key, value in strategy_params[strategy_name].items()))
+                elif use_optimized:
+                    st.caption(f"⚙️ {strategy_name} 尚無此標的與週期的最佳化結果，使用預設參數。")
                 
                 st.markdown("---")
                 st.subheader("📊 AI判讀細節")
@@ -836,24 +3288,72 @@ def main():
                 
                 st.markdown("---")
                 st.subheader("🧪 策略回測報告 (SMA 20/EMA 50 交叉)")
-                bt = run_backtest(df_raw.copy())
+                bt = report["backtest"]
                 if bt.get("total_trades", 0) > 0:
                     b1, b2, b3, b4 = st.columns(4)
                     b1.metric("📊 總回報率", f"{bt['total_return']}%", delta=bt['message'], delta_color='off')
                     b2.metric("📈 勝率", f"{bt['win_rate']}%")
                     b3.metric("📉 最大回撤", f"{bt['max_drawdown']}%")
                     b4.metric("🤝 交易次數", f"{bt['total_trades']} 次")
+                    method = st.selectbox("🎲 穩健度分析 (蒙地卡羅重抽樣)", list(ROBUSTNESS_METHODS), format_func=ROBUSTNESS_METHODS.get, key='robustness_method')
+                    robustness = report["robustness"] if report["robustness"]["method"] == method else report_extra(report, "robustness", lambda m: run_robustness_analysis(df_raw, m), method)
+                    c1, c2 = st.columns(2)
                     if 'capital_curve' in bt and not bt['capital_curve'].empty:
-                        fig = go.Figure(go.Scatter(x=bt['capital_curve'].index, y=bt['capital_curve'], name='資金曲線'))
-                        fig.update_layout(title='SMA 20/EMA 50 交叉策略資金曲線', height=300)
-                        st.plotly_chart(fig, use_container_width=True)
+                        c1.plotly_chart(create_capital_curve_chart(bt['capital_curve'], 'SMA 20/EMA 50 交叉策略資金曲線'), use_container_width=True)
+                    if robustness["paths"]:
+                        c2.plotly_chart(create_robustness_fan_chart(robustness, f'{robustness["paths"]} 條重抽樣路徑資金扇形圖'), use_container_width=True)
+                        note = (f"區塊長度 {robustness['block_size']} 根K棒，區塊接縫會切斷交易，故以獲利K棒比例代替勝率" if robustness["block_size"]
+                                else "勝率以連續相同持倉為一筆交易計算，與上方依換倉K棒計算的勝率定義不同")
+                        st.caption(f"{ROBUSTNESS_METHODS[method]}：{note}。虧損機率 {robustness['loss_probability']:.1f}%。")
+                        st.dataframe(robustness["intervals"].round(2), use_container_width=True, hide_index=True)
+                    else: c2.info(robustness["message"])
                 else: st.warning(f"回測無法執行：{bt.get('message', '錯誤')}")
+
+                st.markdown("---")
+                st.subheader("🧪 策略停損/停利回測 (全部策略)")
+                strategy_bt = report["strategy_backtests"]
+                st.caption("依各策略每根K棒的 SL/TP 判斷多空並於下一根開盤進場，以盤中高低價模擬停損/停利成交。")
+                st.dataframe(summarize_strategy_backtests(strategy_bt), use_container_width=True, hide_index=True)
+                selected_bt = strategy_bt[strategy_name]
+                if selected_bt['total_trades'] > 0:
+                    st.plotly_chart(create_capital_curve_chart(selected_bt['capital_curve'], f'{strategy_name} 停損/停利資金曲線'), use_container_width=True)
+                    with st.expander(f"📋 {strategy_name} 交易明細"): st.dataframe(selected_bt['trades'], use_container_width=True, hide_index=True)
+                else: st.info(f"{strategy_name} 在此期間沒有產生有效的 SL/TP 進場訊號。")
+
+                st.markdown("---")
+                st.subheader("🧪 AI 融合評分回測")
+                fusion_bt = report["fusion_backtest"]
+                st.caption("逐根K棒重算 AI 總量化評分：偏買以上持多、偏賣以下持空、其餘空手，於下一根K棒生效。基本面與籌碼分數以目前數值套用於全部歷史。")
+                f1, f2, f3, f4 = st.columns(4)
+                f1.metric("📊 總回報率", f"{fusion_bt['total_return']:.2f}%")
+                f2.metric("📈 勝率", f"{fusion_bt['win_rate']:.2f}%")
+                f3.metric("📉 最大回撤", f"{fusion_bt['max_drawdown']:.2f}%")
+                f4.metric("🤝 交易次數", f"{fusion_bt['total_trades']} 次")
+                if fusion_bt['total_trades'] > 0:
+                    st.plotly_chart(create_capital_curve_chart(fusion_bt['capital_curve'], 'AI 融合評分策略資金曲線'), use_container_width=True)
+                    with st.expander("📋 AI 融合評分交易明細"): st.dataframe(fusion_bt['trades'], use_container_width=True, hide_index=True)
+
+                with st.expander("🧮 均線參數掃描 (快/慢均線網格)"):
+                    sweep = report_extra(report, "sweep", lambda: run_parameter_sweep(df_raw))
+                    if sweep.empty: st.warning("數據不足，無法執行參數掃描。")
+                    else:
+                        p1, p2, p3 = st.columns(3)
+                        sweep_metric = p1.selectbox('績效指標', list(SWEEP_METRICS.keys()), format_func=SWEEP_METRICS.get, key='sweep_metric')
+                        fast_type = p2.selectbox('快線類型', list(SWEEP_MA_TYPES), index=0, key='sweep_fast_type')
+                        slow_type = p3.selectbox('慢線類型', list(SWEEP_MA_TYPES), index=1, key='sweep_slow_type')
+                        st.plotly_chart(create_sweep_heatmap(sweep, sweep_metric, fast_type, slow_type), use_container_width=True)
                 
                 st.markdown("---")
                 st.subheader(f"📊 完整技術分析圖表")
-                st.plotly_chart(create_comprehensive_chart(df_tech, final_symbol, period_key), use_container_width=True)
+                chart_df = select_chart_window(df_tech.join(report["fusion_signal"][['AI_Score']]), key=f"chart_range_{final_symbol}_{period_key}")
+                if len(chart_df) > CHART_MAX_CANDLES: st.caption(f"區間內共 {len(chart_df)} 根K線，已彙整為約 {CHART_MAX_CANDLES} 根顯示；縮小區間可查看原始K線。")
+                with stage_trace(report["timings"]), timed_stage("chart", rows=len(chart_df)):
+                    fig = create_comprehensive_chart(chart_df, final_symbol, period_key)
+                st.plotly_chart(fig, use_container_width=True)
                 with st.expander("📰 點此查看近期相關新聞"): st.markdown(chips_data['news_summary'].replace("\n", "\n\n"))
 
+            if show_debug: render_debug_panel(report, profile_text)
+
     else:
         st.markdown("<h1 style='color: #FA8072;'>🚀 歡迎使用 AI 趨勢分析</h1>", unsafe_allow_html=True)
         st.markdown(f"請在左側選擇或輸入您想分析的標的（例如：**2330.TW**、**NVDA**、**BTC-USD**），然後點擊 <span style='color: #FA8072; font-weight: bold;'>『📊 執行AI分析』</span> 按鈕開始。", unsafe_allow_html=True)
@@ -866,6 +3366,7 @@ def main():
         st.markdown(f"5. **執行分析**：點擊 <span style='color: #FA8072; font-weight: bold;'>『📊 執行AI分析』</span>，AI將融合綜合指標與您指定的策略提供完整報告。", unsafe_allow_html=True)
 
 if __name__ == "__main__":
+    if not st.runtime.exists() and len(sys.argv) > 1: sys.exit(run_cli(sys.argv[1:])) # python app3.0.py batch ...
     main()
     st.markdown("---")
     st.markdown("⚠️ **免責聲明**")
@@ -0,0 +1,42 @@
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app3.0.py")
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    # app3.0.py 不是合法的模組名稱，以檔案路徑載入；使用離線數據來源與暫存目錄，不啟動背景預熱
+    os.environ.update(
+        MARKET_DATA_PROVIDER="offline",
+        OHLCV_STORE_DIR=str(tmp_path_factory.mktemp("store")),
+        SHARED_CACHE_BACKEND="memory",
+        PREWARM_ENABLED="0",
+    )
+    spec = importlib.util.spec_from_file_location("app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["app"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_ohlcv(n=500, seed=7):
+    # 固定亂數種子的合成日K (對數常態隨機漫步，High/Low 包住開收盤)
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, n)))
+    open_ = close * (1 + rng.normal(0, 0.004, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.006, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.006, n)))
+    volume = rng.integers(100_000, 1_000_000, n).astype(float)
+    index = pd.date_range("2020-01-01", periods=n, freq="D", name="Date")
+    return pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume}, index=index)
+
+
+@pytest.fixture
+def ohlcv():
+    return make_ohlcv()
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+FA = {'score': 5}
+CHIPS = {'inst_hold_pct': 0.55}
+
+
+def scalar_fusion_score(last, prev, fa_rating, chips_news_data):
+    # 向量化之前逐根K棒的評分規則，作為等價性的基準
+    ta_score = 0
+    if last['EMA_10'] > last['EMA_50'] > last['EMA_200']: ta_score += 2
+    elif last['EMA_10'] < last['EMA_50'] < last['EMA_200']: ta_score -= 2
+    if last['RSI'] > 70: ta_score -= 1.5
+    elif last['RSI'] < 30: ta_score += 1.5
+    elif last['RSI'] > 50: ta_score += 1
+    else: ta_score -= 1
+    if last['MACD_Hist'] > 0 and last['MACD_Hist'] > prev['MACD_Hist']: ta_score += 1.5
+    elif last['MACD_Hist'] < 0 and last['MACD_Hist'] < prev['MACD_Hist']: ta_score -= 1.5
+    ta_score *= 1.2 if last['ADX'] > 25 else 0.8
+    fa_score = ((fa_rating.get('score', 0) / 7.0) - 0.5) * 8.0
+    chips_score = (chips_news_data.get('inst_hold_pct', 0) - 0.4) * 4
+    volume_score = 1 if last['OBV'] > last['OBV_MA_20'] else -1
+    return ta_score * 0.5 + fa_score * 0.25 + (chips_score + volume_score) * 0.25
+
+
+@pytest.fixture
+def indicators(app, ohlcv):
+    return app.calculate_technical_indicators(ohlcv.copy())
+
+
+def test_series_matches_per_bar_scalar_rule(app, indicators):
+    series = app.generate_ai_fusion_signal_series(indicators, FA, CHIPS)
+    clean = indicators.dropna()
+    expected = pd.Series([scalar_fusion_score(clean.iloc[i], clean.iloc[i - 1], FA, CHIPS) for i in range(1, len(clean))],
+                         index=clean.index[1:])
+    np.testing.assert_allclose(series['AI_Score'].loc[expected.index], expected, rtol=1e-6)
+    assert series['AI_Score'].drop(expected.index).isna().all() # 暖機期與第一根有效K棒沒有前值
+    confidence = np.minimum(100, 50 + expected.abs() * 8)
+    np.testing.assert_allclose(series['AI_Confidence'].loc[expected.index], confidence, rtol=1e-6)
+
+
+def test_scalar_signal_uses_last_bar_of_series(app, indicators):
+    series = app.generate_ai_fusion_signal_series(indicators, FA, CHIPS)
+    for end in (250, 400, len(indicators)):
+        result = app.generate_ai_fusion_signal(indicators.iloc[:end], FA, CHIPS)
+        assert result['score'] == pytest.approx(series['AI_Score'].iloc[end - 1])
+        assert result['action'] == app.FUSION_ACTIONS[int(series['AI_Signal'].iloc[end - 1])]
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def row_loop_supertrend(app, df, period, multiplier):
+    # 改寫為 NumPy 核心之前的逐列 pandas 實作，作為等價性的基準
+    df = df.copy()
+    df['ATR'] = app.pandas_atr(df, period=period)
+    df['Upper_Band'] = ((df['High'] + df['Low']) / 2) + (multiplier * df['ATR'])
+    df['Lower_Band'] = ((df['High'] + df['Low']) / 2) - (multiplier * df['ATR'])
+    df['Supertrend'] = df['Lower_Band']
+    for i in range(1, len(df)):
+        if df['Close'].iloc[i-1] <= df['Supertrend'].iloc[i-1]:
+            df.loc[df.index[i], 'Supertrend'] = min(df['Upper_Band'].iloc[i], df['Supertrend'].iloc[i-1])
+        else:
+            df.loc[df.index[i], 'Supertrend'] = max(df['Lower_Band'].iloc[i], df['Supertrend'].iloc[i-1])
+    if df['Close'].iloc[-1] > df['Supertrend'].iloc[-1]:
+        df['TP'] = df['Close'] + (df['Close'] - df['Supertrend']) * 2
+    else:
+        df['TP'] = df['Close'] - (df['Supertrend'] - df['Close']) * 2
+    df['SL'] = df['Supertrend']
+    return df
+
+
+@pytest.mark.parametrize("period,multiplier", [(14, 3.5), (7, 1.5), (30, 5.0)])
+def test_supertrend_matches_row_loop(app, ohlcv, period, multiplier):
+    expected = row_loop_supertrend(app, ohlcv, period, multiplier)
+    result = app.supertrend(ohlcv, period=period, multiplier=multiplier)
+    for column in ('Supertrend', 'SL', 'TP'):
+        pd.testing.assert_series_equal(result[column], expected[column], check_names=False)
+
+
+def test_supertrend_kernel_keeps_nan_semantics(app):
+    # 頻帶有 NaN 時與內建 min()/max() 的比較語意相同
+    close = np.array([10.0, 11.0, 9.0, 12.0])
+    upper = np.array([np.nan, 12.0, np.nan, 13.0])
+    lower = np.array([np.nan, 9.0, 8.0, np.nan])
+    expected = [lower[0]]
+    for i in range(1, len(close)):
+        prev = expected[-1]
+        expected.append(min(upper[i], prev) if close[i - 1] <= prev else max(lower[i], prev))
+    np.testing.assert_array_equal(app.supertrend_kernel(close, upper, lower), np.array(expected))
+
+
+def test_atr_trailing_stop_ratchets_and_flips(app):
+    close = np.array([10.0, 11.0, 12.0, 11.5, 9.0, 8.0, 8.5, 10.5])
+    stop, direction = app.atr_trailing_stop_kernel(close, np.ones(len(close)), 1.0)
+    # 持多時止損只上移 (11.5 時維持 11)，跌破後翻空改用收盤 + ATR，持空時只下移，突破後再翻多
+    np.testing.assert_array_equal(stop, [9.0, 10.0, 11.0, 11.0, 10.0, 9.0, 9.0, 9.5])
+    np.testing.assert_array_equal(direction, [1, 1, 1, 1, -1, -1, -1, 1])
+
+
+def test_atr_trailing_stop_never_loosens(app, ohlcv):
+    atr = app.pandas_atr(ohlcv, period=14).to_numpy()
+    stop, direction = app.atr_trailing_stop_kernel(ohlcv['Close'].to_numpy(), atr, 3.0)
+    held = direction[1:] == direction[:-1]
+    assert np.all(np.diff(stop)[held & (direction[1:] > 0)] >= 0)
+    assert np.all(np.diff(stop)[held & (direction[1:] < 0)] <= 0)
+    assert np.any(~held)
+
+
+def test_chandelier_exit_holds_stops_while_price_is_beyond_them(app):
+    # 原始頻帶逐根後退，但前一根收盤仍在止損之外，止損維持不動
+    close = np.array([11.0, 11.0, 11.0])
+    long_stop, short_stop, _ = app.chandelier_exit_kernel(close, np.array([10.0, 9.0, 8.0]), np.array([12.0, 13.0, 14.0]), np.zeros(3), 1.0)
+    np.testing.assert_array_equal(long_stop, [10.0, 10.0, 10.0])
+    np.testing.assert_array_equal(short_stop, [12.0, 12.0, 12.0])
+
+
+def test_chandelier_exit_ratchets_only_in_favour(app, ohlcv):
+    close = ohlcv['Close'].to_numpy()
+    high_max = ohlcv['High'].rolling(22).max().to_numpy()
+    low_min = ohlcv['Low'].rolling(22).min().to_numpy()
+    atr = app.pandas_atr(ohlcv, period=14).to_numpy()
+    long_stop, short_stop, direction = app.chandelier_exit_kernel(close, high_max, low_min, atr, 3.5)
+    above = (close[:-1] > long_stop[:-1]) & ~np.isnan(long_stop[:-1])
+    below = (close[:-1] < short_stop[:-1]) & ~np.isnan(short_stop[:-1])
+    assert np.all(long_stop[1:][above] >= long_stop[:-1][above])
+    assert np.all(short_stop[1:][below] <= short_stop[:-1][below])
+    # 未受棘輪約束的K棒與原始頻帶相同
+    raw_long = high_max - atr * 3.5
+    free = np.concatenate([[True], ~above])
+    np.testing.assert_array_equal(long_stop[free], raw_long[free])
+    assert set(np.unique(direction)) <= {-1.0, 1.0}
@@ -0,0 +1,87 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_ohlcv
+
+
+@pytest.fixture
+def store(app, monkeypatch, tmp_path):
+    # 本地儲存與離線快照都放在暫存目錄；快照檔案就是「上游」目前提供的數據
+    monkeypatch.setattr(app, "OHLCV_STORE_DIR", str(tmp_path / "store"))
+    monkeypatch.setattr(app.MARKET_DATA, "snapshot_dir", str(tmp_path / "snapshots"))
+    calls = []
+    history = app.MARKET_DATA.history
+    def recording_history(symbol, interval, period=None, start=None):
+        calls.append("full" if start is None else "incremental")
+        return history(symbol, interval, period=period, start=start)
+    monkeypatch.setattr(app.MARKET_DATA, "history", recording_history)
+
+    def publish(df, symbol="TEST", interval="1d"):
+        path = os.path.join(str(tmp_path / "snapshots"), interval, f"{symbol}.parquet")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_parquet(path)
+    return calls, publish
+
+
+def test_cold_fetch_then_incremental_append(app, store):
+    calls, publish = store
+    bars = make_ohlcv(320)
+    publish(bars.iloc[:300])
+    df, partial = app.fetch_ohlcv_with_partial("TEST", "max", "1d")
+    assert calls == ["full"]
+    pd.testing.assert_frame_equal(df, bars.iloc[:299], check_freq=False)
+    assert partial.index[0] == bars.index[299]
+    publish(bars)
+    df, partial = app.fetch_ohlcv_with_partial("TEST", "max", "1d")
+    assert calls == ["full", "incremental"]
+    pd.testing.assert_frame_equal(df, bars.iloc[:319], check_freq=False)
+    pd.testing.assert_frame_equal(app.load_local_history("TEST", "1d"), bars.iloc[:319], check_freq=False)
+
+
+def test_adjusted_overlap_bar_triggers_full_reload(app, store):
+    calls, publish = store
+    bars = make_ohlcv(320)
+    publish(bars.iloc[:300])
+    app.fetch_ohlcv_incremental("TEST", "max", "1d")
+    # 除權息後上游回溯調整整段還原價，重疊K棒的收盤價與儲存的不同
+    adjusted = bars.copy()
+    adjusted[['Open', 'High', 'Low', 'Close']] *= 0.9
+    publish(adjusted)
+    df = app.fetch_ohlcv_incremental("TEST", "max", "1d")
+    assert calls == ["full", "incremental", "full"]
+    np.testing.assert_allclose(df['Close'], adjusted['Close'].iloc[:319])
+    np.testing.assert_allclose(app.load_local_history("TEST", "1d")['Close'], adjusted['Close'].iloc[:319])
+
+
+def test_save_is_atomic(app, store, monkeypatch, caplog):
+    bars = make_ohlcv(50)
+    app.save_local_history("TEST", "1d", bars)
+    directory = os.path.dirname(app._store_path("TEST", "1d"))
+    assert os.listdir(directory) == ["TEST.parquet"]
+
+    def failing_to_parquet(self, path, *args, **kwargs):
+        with open(path, "wb") as f: f.write(b"half")
+        raise OSError("disk full")
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", failing_to_parquet)
+    with caplog.at_level(logging.WARNING, logger="ai_trend"):
+        app.save_local_history("TEST", "1d", bars.iloc[:10])
+    assert "無法寫入本地儲存" in caplog.text
+    assert os.listdir(directory) == ["TEST.parquet"]
+    pd.testing.assert_frame_equal(app.load_local_history("TEST", "1d"), bars, check_freq=False)
+
+
+def test_corrupt_store_file_is_reloaded(app, store, caplog):
+    calls, publish = store
+    path = app._store_path("TEST", "1d")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f: f.write(b"not a parquet file")
+    with caplog.at_level(logging.WARNING, logger="ai_trend"):
+        assert app.load_local_history("TEST", "1d").empty
+    assert "無法讀取本地儲存" in caplog.text
+    publish(make_ohlcv(60))
+    assert len(app.fetch_ohlcv_incremental("TEST", "max", "1d")) == 59
+    assert calls == ["full"]
@@ -0,0 +1,25 @@
+import numpy as np
+
+from conftest import make_ohlcv
+
+
+def accumulated(app, monkeypatch, name):
+    # 低記憶體模式：OHLCV 為 float32 區塊，指標結果降為 float32
+    monkeypatch.setattr(app, "PIPELINE_LOW_MEMORY", True)
+    df = make_ohlcv(20_000, seed=11)
+    df['Volume'] *= 300 # 大型股的成交量級距，float32 累加的捨入誤差明顯
+    compact = app.compact_ohlcv(df)
+    result = app.IndicatorCache(compact).get(name).to_numpy(np.float64)
+    # 基準：同一份 float32 數據以 float64 累加
+    reference = app.INDICATOR_REGISTRY[name](app.IndicatorCache(compact.astype(np.float64))).to_numpy(np.float64)
+    return result, reference
+
+
+def test_low_memory_obv_accumulates_in_float64(app, monkeypatch):
+    result, reference = accumulated(app, monkeypatch, 'obv')
+    assert np.nanmax(np.abs(result - reference)) <= 1e-7 * np.nanmax(np.abs(reference))
+
+
+def test_low_memory_vwap_accumulates_in_float64(app, monkeypatch):
+    result, reference = accumulated(app, monkeypatch, 'vwap')
+    np.testing.assert_allclose(result, reference, rtol=1e-6)
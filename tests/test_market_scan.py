@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+
+from conftest import make_ohlcv
+
+
+@pytest.fixture
+def frames():
+    # 長度不同的序列：面板尾端補值不能影響較短的標的
+    return {"AAA": make_ohlcv(500, seed=1), "BBB": make_ohlcv(320, seed=2), "CCC": make_ohlcv(410, seed=3)}
+
+
+def test_panel_scan_matches_per_symbol_path(app, monkeypatch, frames):
+    monkeypatch.setattr(app, "get_batch_stock_data", lambda symbols, period, interval: (frames, {}))
+    ranking = app.scan_market(list(frames), "5y", "1d").set_index("代碼")
+    assert set(ranking.index) == set(frames)
+    for symbol, df in frames.items():
+        indicators = app.calculate_technical_indicators(df.copy())
+        fusion = app.generate_ai_fusion_signal_series(indicators, app.SCANNER_NEUTRAL_FA, app.SCANNER_NEUTRAL_CHIPS).iloc[-1]
+        row = ranking.loc[symbol]
+        assert row["AI 評分"] == pytest.approx(round(fusion['AI_Score'], 2)), symbol
+        assert row["AI 行動建議"] == app.FUSION_ACTIONS[int(fusion['AI_Signal'])]
+        assert row["RSI"] == pytest.approx(round(indicators['RSI'].iloc[-1], 1))
+        assert row["ADX"] == pytest.approx(round(indicators['ADX'].iloc[-1], 1))
+        assert row["價格"] == pytest.approx(df['Close'].iloc[-1])
+        assert row["最後K棒"] == df.index[-1]
+    assert list(ranking["AI 評分"]) == sorted(ranking["AI 評分"], reverse=True)
+
+
+def test_panel_skips_short_series(app, monkeypatch, frames):
+    frames = dict(frames, SHORT=make_ohlcv(app.MIN_ANALYSIS_BARS - 1, seed=4))
+    monkeypatch.setattr(app, "get_batch_stock_data", lambda symbols, period, interval: (frames, {}))
+    assert "SHORT" not in set(app.scan_market(list(frames), "5y", "1d")["代碼"])
+
+
+def test_failed_batch_is_logged_and_reported(app, monkeypatch, caplog):
+    monkeypatch.setattr(app, "SCANNER_BATCH_SIZE", 2)
+    download = app.MARKET_DATA.download
+    def flaky_download(symbols, period, interval):
+        if "MSFT" in symbols: raise ConnectionError("429 Too Many Requests")
+        return download(symbols, period, interval)
+    monkeypatch.setattr(app.MARKET_DATA, "download", flaky_download)
+    monkeypatch.setattr(app.UPSTREAM, "max_retries", 0)
+    with caplog.at_level(logging.WARNING, logger="ai_trend"):
+        ranking = app.scan_market(["AAPL", "NVDA", "MSFT", "TSLA"], "5y", "1d")
+    assert "批次下載失敗" in caplog.text
+    assert ranking.attrs["failed"] == {"MSFT": "429 Too Many Requests", "TSLA": "429 Too Many Requests"}
+    assert set(ranking["代碼"]) == {"AAPL", "NVDA"}
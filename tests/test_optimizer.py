@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from conftest import make_ohlcv
+
+
+def alter_after(df, position):
+    # 把 position 之後的K棒改成反向走勢，模擬「未來」與原數據完全不同
+    altered = df.copy()
+    tail = altered.iloc[position:]
+    mirror = 2 * df['Close'].iloc[position - 1] - tail[['Open', 'High', 'Low', 'Close']]
+    altered.iloc[position:, altered.columns.get_indexer(['Open', 'Close'])] = mirror[['Open', 'Close']].to_numpy()
+    altered.iloc[position:, altered.columns.get_indexer(['High', 'Low'])] = mirror[['Low', 'High']].to_numpy()
+    return altered
+
+
+def segment_return(app, func, df, start, end):
+    out = func(df.copy())
+    ohlc = tuple(df[c].to_numpy(float) for c in ('Open', 'High', 'Low', 'Close'))
+    sl, tp = out['SL'].to_numpy(float)[None, :], out['TP'].to_numpy(float)[None, :]
+    return app._score_segment(ohlc, sl, tp, start, end)[1][0]
+
+
+def test_strategy_sl_tp_are_causal(app, ohlcv):
+    # 每根K棒的 SL/TP 只能用到當時已知的數據：只取前段計算的結果必須與全期計算的前段相同
+    for name, func in app.STRATEGY_FUNCTIONS.items():
+        full, prefix = func(ohlcv.copy()), func(ohlcv.iloc[:350].copy())
+        for column in ('SL', 'TP'):
+            np.testing.assert_allclose(prefix[column].to_numpy(float), full[column].iloc[:350].to_numpy(float),
+                                       rtol=1e-9, err_msg=f"{name} {column}")
+
+
+def test_test_fold_return_ignores_bars_after_fold(app):
+    df = make_ohlcv(900, seed=3)
+    ends = app.walk_forward_splits(len(df))
+    altered = alter_after(df, ends[1])
+    for name, func in app.STRATEGY_FUNCTIONS.items():
+        expected = segment_return(app, func, df, ends[0], ends[1])
+        assert segment_return(app, func, altered, ends[0], ends[1]) == pytest.approx(expected, nan_ok=True), name
+
+
+def test_walk_forward_folds_ignore_later_bars(app):
+    # 前兩段的選參與測試期報酬只取決於第三個視窗終點之前的K棒 (抽樣少量候選參數以縮短測試時間)
+    df = make_ohlcv(900, seed=3)
+    ends = app.walk_forward_splits(len(df))
+    altered = alter_after(df, ends[2])
+    for name, func in app.STRATEGY_FUNCTIONS.items():
+        if func.__name__ not in app.STRATEGY_PARAM_SPACES: continue
+        original, changed = app.optimize_strategy(df, name, "random", samples=12), app.optimize_strategy(altered, name, "random", samples=12)
+        if original is None: continue
+        assert changed["walk_forward"][:2] == original["walk_forward"][:2], name
@@ -0,0 +1,16 @@
+import pytest
+
+
+def test_sweep_grid_point_matches_run_backtest(app, ohlcv):
+    # 網格中的 SMA 20 / EMA 50 組合就是 run_backtest 的交叉策略
+    sweep = app.run_parameter_sweep(ohlcv, fast_windows=(10, 20), slow_windows=(50, 100), ma_types=("SMA", "EMA"))
+    row = sweep[(sweep.fast_type == "SMA") & (sweep.fast == 20) & (sweep.slow_type == "EMA") & (sweep.slow == 50)].iloc[0]
+    expected = app.run_backtest(ohlcv)
+    assert row.total_trades == expected["total_trades"]
+    for metric in ("total_return", "win_rate", "max_drawdown"):
+        assert row[metric] == pytest.approx(float(expected[metric]), abs=0.005), metric
+
+
+def test_sweep_only_pairs_fast_below_slow(app, ohlcv):
+    sweep = app.run_parameter_sweep(ohlcv, fast_windows=(10, 60), slow_windows=(50,), ma_types=("SMA",))
+    assert list(zip(sweep.fast, sweep.slow)) == [(10, 50)]
@@ -0,0 +1,24 @@
+def test_refresh_prices_makes_one_upstream_call(app, monkeypatch):
+    calls = []
+    history = app.MARKET_DATA.history
+    monkeypatch.setattr(app.MARKET_DATA, "history", lambda *args, **kwargs: calls.append(args) or history(*args, **kwargs))
+    prewarmer = app.CachePrewarmer(rate=0)
+    prewarmer.refresh_prices("2330.TW", "1 日")
+    assert len(calls) == 1
+    period, interval = app.PERIOD_MAP["1 日"]
+    assert app.get_stock_data.age("2330.TW", period, interval) is not None
+    app.get_stock_data("2330.TW", period, interval)
+    assert len(calls) == 1
+
+
+def test_targets_fit_one_price_cycle(app, monkeypatch):
+    # 受限速時每輪價格與分攤的基本面請求不超過預熱速率在一個價格週期內的額度
+    monkeypatch.setattr(app.MARKET_DATA, "rate_limited", True)
+    prewarmer = app.CachePrewarmer(rate=1)
+    prewarmer.record_request("AAPL", "1 週")
+    targets = prewarmer.targets()
+    assert targets[0] == ("AAPL", "1 週")
+    requests_per_cycle = len(targets) * (1 + 3 * app.PREWARM_PRICE_INTERVAL_SECONDS / app.PREWARM_FUNDAMENTALS_INTERVAL_SECONDS)
+    assert requests_per_cycle <= app.PREWARM_PRICE_INTERVAL_SECONDS * app.PREWARM_BUDGET_SHARE
+    categories = {code: category for category, options in app.CATEGORY_HOT_OPTIONS.items() for code in options.values()}
+    assert {categories[code] for code, _ in targets[1:] if code in categories} == set(app.CATEGORY_HOT_OPTIONS)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+WINDOWS = [1, 2, 3, 7, 8, 9, 26, 52, 64, 99, 100, 101, 250]
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(3)
+    data = rng.normal(100, 5, 100)
+    data[[0, 17, 18, 60]] = np.nan
+    return data
+
+
+@pytest.mark.parametrize("op,method", [(np.maximum, "max"), (np.minimum, "min")])
+@pytest.mark.parametrize("window", WINDOWS)
+def test_rolling_matches_pandas(app, values, op, method, window):
+    expected = getattr(pd.Series(values).rolling(window), method)().to_numpy()
+    np.testing.assert_array_equal(app.RangeExtremaIndex(values, op).rolling(window), expected)
+
+
+@pytest.mark.parametrize("op,method", [(np.maximum, "max"), (np.minimum, "min")])
+def test_rolling_many_matches_pandas(app, values, op, method):
+    expected = np.stack([getattr(pd.Series(values).rolling(window), method)().to_numpy() for window in WINDOWS])
+    np.testing.assert_array_equal(app.RangeExtremaIndex(values, op).rolling_many(WINDOWS), expected)
+
+
+@pytest.mark.parametrize("op,method", [(np.maximum, "max"), (np.minimum, "min")])
+def test_rolling_on_panel_matches_pandas(app, op, method):
+    # (K棒 × 代碼) 面板沿時間軸計算，各欄互不影響
+    rng = np.random.default_rng(5)
+    panel = rng.normal(50, 3, (80, 4))
+    panel[10, 1] = panel[40:45, 2] = np.nan
+    panel[70:, 3] = np.nan # 較短的序列以 NaN 補齊
+    index = app.RangeExtremaIndex(panel, op)
+    for window in (1, 5, 16, 33, 80, 81):
+        expected = getattr(pd.DataFrame(panel).rolling(window), method)().to_numpy()
+        np.testing.assert_array_equal(index.rolling(window), expected)
+    assert index.rolling_many([3, 9]).shape == (2, 80, 4)
+
+
+def test_rolling_indicators_use_the_shared_index(app, ohlcv):
+    ctx = app.get_indicator_cache(ohlcv)
+    pd.testing.assert_series_equal(ctx.get('rolling_max', column='High', window=20), ohlcv['High'].rolling(20).max())
+    pd.testing.assert_series_equal(ctx.get('rolling_min', column='Low', window=20), ohlcv['Low'].rolling(20).min())
+
+
+def test_ichimoku_tenkan_uses_low(app, ohlcv):
+    out = app.ichimoku_cloud(ohlcv)
+    expected = (ohlcv['High'].rolling(9).max() + ohlcv['Low'].rolling(9).min()) / 2
+    pd.testing.assert_series_equal(out['Tenkan'], expected, check_names=False)
+    # 原本的錯誤是把最低價也取自 High
+    with_high_min = (ohlcv['High'].rolling(9).max() + ohlcv['High'].rolling(9).min()) / 2
+    assert not np.allclose(out['Tenkan'].dropna(), with_high_min.dropna())
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.mark.parametrize("method", ["block", "bootstrap", "shuffle"])
+def test_quantiles_reproducible_with_seed(app, ohlcv, method):
+    first = app.run_robustness_analysis(ohlcv, method, paths=300)
+    second = app.run_robustness_analysis(ohlcv, method, paths=300)
+    pd.testing.assert_frame_equal(first["intervals"], second["intervals"])
+    pd.testing.assert_frame_equal(first["fan"], second["fan"])
+    assert first["loss_probability"] == second["loss_probability"]
+    other = app.run_robustness_analysis(ohlcv, method, paths=300, seed=app.ROBUSTNESS_SEED + 1)
+    assert not np.allclose(other["intervals"].iloc[:, 2:], first["intervals"].iloc[:, 2:])
+
+
+def test_batching_does_not_change_paths(app, ohlcv):
+    # 路徑分批只限制記憶體，同一個種子的抽樣序列與結果不變
+    whole = app.run_robustness_analysis(ohlcv, "bootstrap", paths=200)
+    batched = app.run_robustness_analysis(ohlcv, "bootstrap", paths=200, max_cells=len(ohlcv) * 7)
+    pd.testing.assert_frame_equal(whole["intervals"], batched["intervals"])
+
+
+def test_observed_metrics_match_single_path(app, ohlcv):
+    result = app.run_robustness_analysis(ohlcv, "block", paths=200)
+    observed = result["intervals"].set_index("指標")["實際"]
+    expected = app.run_backtest(ohlcv)
+    assert observed[app.ROBUSTNESS_METRIC_LABELS["total_return"]] == pytest.approx(float(expected["total_return"]), abs=0.005)
+    assert observed[app.ROBUSTNESS_METRIC_LABELS["max_drawdown"]] == pytest.approx(float(expected["max_drawdown"]), abs=0.005)
@@ -0,0 +1,96 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from conftest import make_ohlcv
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, app, monkeypatch, tmp_path):
+    # 兩種後端跑同一組測試；time.time 換成可控制的時鐘
+    clock = Clock()
+    monkeypatch.setattr(app.time, "time", clock)
+    cache = app.MemoryCacheBackend() if request.param == "memory" else app.SQLiteCacheBackend(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(app, "SHARED_CACHE", cache)
+    return cache, clock
+
+
+@pytest.fixture
+def counted(app, backend):
+    calls = []
+    @app.shared_cache(ttl=300)
+    def lookup(symbol):
+        calls.append(symbol)
+        return {"symbol": symbol, "call": len(calls)}
+    return lookup, calls
+
+
+def test_ttl_expiry(counted, backend):
+    lookup, calls = counted
+    _, clock = backend
+    assert lookup("AAPL") == lookup("AAPL") == {"symbol": "AAPL", "call": 1}
+    clock.now += 299
+    assert lookup("AAPL")["call"] == 1
+    clock.now += 1
+    assert lookup("AAPL")["call"] == 2
+    assert calls == ["AAPL", "AAPL"]
+
+
+def test_clear_refresh_and_age(counted, backend):
+    lookup, calls = counted
+    _, clock = backend
+    assert lookup.age("AAPL") is None
+    lookup("AAPL"), lookup("MSFT")
+    clock.now += 42
+    assert lookup.age("AAPL") == pytest.approx(42)
+    lookup.clear("AAPL")
+    assert lookup.age("AAPL") is None and lookup.age("MSFT") is not None
+    lookup.clear()
+    assert lookup.age("MSFT") is None
+    assert lookup.refresh("AAPL")["call"] == 3
+    assert lookup("AAPL")["call"] == 3 and lookup.age("AAPL") == pytest.approx(0)
+
+
+def test_refresh_failure_keeps_cached_value(app, backend):
+    results = iter([{"price": 1}])
+    @app.shared_cache(ttl=300)
+    def quote(symbol):
+        return next(results)
+    assert quote("AAPL") == {"price": 1}
+    with pytest.raises(StopIteration): quote.refresh("AAPL")
+    assert quote("AAPL") == {"price": 1}
+
+
+def test_dataframe_round_trip_keeps_tz_index(app, backend):
+    df = make_ohlcv(30)
+    df.index = df.index.tz_localize("America/New_York")
+    @app.shared_cache(ttl=300)
+    def history(symbol):
+        return df
+    history("AAPL")
+    cached = history("AAPL")
+    assert cached is not df
+    pd.testing.assert_frame_equal(cached, df, check_freq=False)
+    assert str(cached.index.tz) == "America/New_York"
+
+
+def test_sqlite_hit_updates_access_time_only_when_stale(app, monkeypatch, tmp_path):
+    clock = Clock()
+    monkeypatch.setattr(app.time, "time", clock)
+    cache = app.SQLiteCacheBackend(str(tmp_path / "cache.sqlite"))
+    cache.set("k", "ns", b"value", None)
+    accessed = lambda: sqlite3.connect(cache.path).execute("SELECT accessed_at FROM cache WHERE key = 'k'").fetchone()[0]
+    written = accessed()
+    clock.now += app.SHARED_CACHE_TOUCH_SECONDS - 1
+    assert cache.get("k") == b"value" and accessed() == written
+    clock.now += 1
+    assert cache.get("k") == b"value" and accessed() == clock.now
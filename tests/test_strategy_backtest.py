@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+
+def bars(open_, high, low, close):
+    return tuple(np.array(a, dtype=np.float64) for a in (open_, high, low, close))
+
+
+def test_kernel_enters_next_open_and_exits_at_levels(app):
+    # t0 多頭訊號 -> t1 開盤進場並觸及停利 12；t1 再次訊號 -> t2 開盤進場並觸及停損 9；t2 訊號 -> t3 進場、期末以收盤平倉
+    ohlc = bars([10, 10, 10, 10], [10, 12.5, 10.5, 11], [10, 9.5, 8.5, 9.5], [10, 10, 10, 10.5])
+    sl, tp = np.full((1, 4), 9.0), np.full((1, 4), 12.0)
+    equity, entries, exits, directions = (a[0] for a in app.sltp_backtest_kernel(*ohlc, sl, tp))
+    np.testing.assert_array_equal(entries, [np.nan, 10, 10, 10])
+    np.testing.assert_array_equal(exits, [np.nan, 12, 9, 10.5])
+    assert equity[-1] == pytest.approx(1.2 * 0.9 * 1.05)
+    assert list(directions) == [0, 1, 1, 1]
+
+
+def test_kernel_short_gap_fills_at_open(app):
+    # 空頭 (TP < 收盤 < SL)：隔日跳空高開越過停損，以開盤價出場
+    ohlc = bars([10, 10, 11.5], [10, 10.2, 11.8], [10, 9.8, 11.2], [10, 10, 11.5])
+    sl, tp = np.full((1, 3), 11.0), np.full((1, 3), 8.0)
+    equity, entries, exits, directions = (a[0] for a in app.sltp_backtest_kernel(*ohlc, sl, tp))
+    np.testing.assert_array_equal(exits, [np.nan, np.nan, 11.5])
+    assert directions[1] == -1 and equity[-1] == pytest.approx(1 - 0.15)
+
+
+def test_batched_strategies_match_single_runs(app, ohlcv):
+    sltp = app.compute_strategy_sltp(ohlcv)
+    ohlc = tuple(ohlcv[c].to_numpy(np.float64) for c in ('Open', 'High', 'Low', 'Close'))
+    sl = np.vstack([sl for sl, _ in sltp.values()])
+    tp = np.vstack([tp for _, tp in sltp.values()])
+    batched = app.sltp_backtest_kernel(*ohlc, sl, tp)[0]
+    results = app.run_strategy_backtest(ohlcv, sltp=sltp)
+    for row, name in zip(batched, sltp):
+        assert results[name]["total_return"] == pytest.approx((row[-1] - 1) * 100), name
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_ohlcv
+
+
+def batch_indicators(app, df):
+    return app.calculate_technical_indicators(df.copy())[app.StreamingIndicatorEngine.COLUMNS]
+
+
+def assert_matches_batch(app, result, df):
+    expected = batch_indicators(app, df)
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_exact=False, rtol=1e-9, atol=1e-6)
+
+
+@pytest.fixture
+def history():
+    return make_ohlcv(n=600, seed=11)
+
+
+def test_cold_start_matches_batch(app, history):
+    app._streaming_indicator_store().clear()
+    assert_matches_batch(app, app.calculate_technical_indicators_incremental(("COLD", "1d"), history), history)
+
+
+def test_appended_bars_stream_from_seeded_state(app, history):
+    app._streaming_indicator_store().clear()
+    key = ("APPEND", "1d")
+    app.calculate_technical_indicators_incremental(key, history.iloc[:400])
+    engine = app._streaming_indicator_store()[key]["engine"]
+    result = app.calculate_technical_indicators_incremental(key, history.iloc[:450])
+    assert app._streaming_indicator_store()[key]["engine"] is engine # 沿用引擎，只串流新增的50根
+    assert_matches_batch(app, result, history.iloc[:450])
+
+
+def test_sliding_window_reseeds(app, history):
+    # trim_to_period 使視窗起點後移：遞迴指標必須以新起點重算，儲存的指標表不保留視窗之前的列
+    app._streaming_indicator_store().clear()
+    key = ("SLIDE", "1d")
+    app.calculate_technical_indicators_incremental(key, history.iloc[:400])
+    window = history.iloc[100:500]
+    assert_matches_batch(app, app.calculate_technical_indicators_incremental(key, window), window)
+    assert app._streaming_indicator_store()[key]["indicators"].index[0] == window.index[0]
+
+
+def test_engine_seed_matches_bar_by_bar_updates(app, history):
+    seeded = app.StreamingIndicatorEngine().seed(history.iloc[:300])
+    stepped = app.StreamingIndicatorEngine()
+    stepped.update_frame(history.iloc[:300])
+    tail = history.iloc[300:]
+    np.testing.assert_allclose(seeded.update_frame(tail).to_numpy(), stepped.update_frame(tail).to_numpy(), rtol=1e-9, atol=1e-6)
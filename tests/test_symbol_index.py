@@ -0,0 +1,33 @@
+import pytest
+
+SYMBOLS = {
+    "2330.TW": {"name": "台積電", "keywords": ["台積電", "2330", "TSMC"]},
+    "AAPL": {"name": "蘋果 (Apple)", "keywords": ["蘋果", "Apple", "AAPL"]},
+    "AMZN": {"name": "亞馬遜 (Amazon)", "keywords": ["亞馬遜", "Amazon"]},
+    "APP": {"name": "AppLovin", "keywords": ["AppLovin"]},
+}
+
+
+@pytest.fixture
+def index(app):
+    return app.SymbolIndex(SYMBOLS)
+
+
+def test_resolve_exact_code_keyword_and_name(index):
+    assert index.resolve("2330") == "2330.TW"
+    assert index.resolve(" tsmc ") == "2330.TW"
+    assert index.resolve("蘋果 (Apple)") == "AAPL"
+    assert index.resolve("unknown") is None
+
+
+def test_suggest_ranks_exact_then_prefix_then_fuzzy(index):
+    assert index.suggest("app")[:2] == ["APP", "AAPL"]
+    assert index.suggest("amaz") == ["AMZN"]
+    assert "AMZN" in index.suggest("amazn")
+    assert index.suggest("") == []
+
+
+def test_get_symbol_from_query_falls_back_to_taiwan_code(app):
+    assert app.get_symbol_from_query("2330") == "2330.TW"
+    assert app.get_symbol_from_query("6789") == "6789.TW"
+    assert app.get_symbol_from_query("BTC-USD") == "BTC-USD"
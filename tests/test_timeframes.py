@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def upstream_calls(app, monkeypatch, tmp_path):
+    # 以暫存目錄作為本地儲存，並記錄每次向數據來源的請求參數
+    monkeypatch.setattr(app, "OHLCV_STORE_DIR", str(tmp_path))
+    calls = []
+    history = app.MARKET_DATA.history
+    def recording_history(symbol, interval, period=None, start=None):
+        calls.append({"interval": interval, "period": period, "start": start})
+        return history(symbol, interval, period=period, start=start)
+    monkeypatch.setattr(app.MARKET_DATA, "history", recording_history)
+    return calls
+
+
+def test_daily_uses_five_year_base(app):
+    assert app.timeframe_source("1d", "5y") == ("1d", "5y", None)
+    assert app.timeframe_source("1wk", "max") == ("1d", "max", "1wk")
+
+
+def test_weekly_after_daily_reloads_full_history(app, upstream_calls):
+    daily = app.fetch_ohlcv_incremental("AAPL", "5y", "1d")
+    assert [call["period"] for call in upstream_calls] == ["5y"]
+    weekly_base = app.fetch_ohlcv_incremental("AAPL", "max", "1d")
+    assert upstream_calls[-1]["period"] == "max" and len(weekly_base) > len(daily)
+    # 已下載過全部歷史後，兩個週期都只做增量請求
+    app.fetch_ohlcv_incremental("AAPL", "5y", "1d")
+    app.fetch_ohlcv_incremental("AAPL", "max", "1d")
+    assert [call["start"] is not None for call in upstream_calls[2:]] == [True, True]
+
+
+def hourly_bars(hours, day="2024-03-04"):
+    index = pd.DatetimeIndex([pd.Timestamp(f"{day} {hour:02d}:00") for hour in hours]).tz_localize("Asia/Taipei")
+    return pd.DataFrame({"Open": 1.0, "High": 2.0, "Low": 0.5, "Close": 1.5, "Volume": 10.0}, index=index.rename("Date"))
+
+
+def taipei(text):
+    return pd.Timestamp(text, tz="Asia/Taipei")
+
+
+def test_resample_keeps_completed_last_bucket(app):
+    # 09:00-12:00 的四根60分K已涵蓋 09:00 開始的4小時K棒
+    out = app.resample_ohlcv(hourly_bars([9, 10, 11, 12]), "2330.TW", "4h", now=taipei("2024-03-04 13:05"))
+    assert list(out.index.hour) == [9] and out["Volume"].iloc[-1] == 40
+    # 13:00 開始的K棒在 13:30 收盤時結束
+    out = app.resample_ohlcv(hourly_bars([9, 10, 11, 12, 13]), "2330.TW", "4h", now=taipei("2024-03-04 13:40"))
+    assert list(out.index.hour) == [9, 13]
+
+
+def test_resample_drops_incomplete_last_bucket(app):
+    bars = hourly_bars([9, 10, 11])
+    assert list(app.resample_ohlcv(bars, "2330.TW", "4h", now=taipei("2024-03-04 12:10")).index) == []
+    # 時間已過K棒終點 (例如盤中停止交易) 時不再捨棄
+    assert len(app.resample_ohlcv(bars, "2330.TW", "4h", now=taipei("2024-03-05 09:00"))) == 1
+
+
+def test_weekly_last_bucket_depends_on_trading_days(app):
+    days = pd.date_range("2024-03-04", "2024-03-08", freq="D", tz="Asia/Taipei", name="Date")
+    daily = pd.DataFrame({"Open": 1.0, "High": 2.0, "Low": 0.5, "Close": 1.5, "Volume": 10.0}, index=days)
+    friday_night = taipei("2024-03-08 20:00")
+    assert len(app.resample_ohlcv(daily, "2330.TW", "1wk", now=friday_night)) == 1
+    assert len(app.resample_ohlcv(daily.iloc[:3], "2330.TW", "1wk", now=taipei("2024-03-06 20:00"))) == 0
+    # 加密貨幣週末也交易：週五時本週尚未收完
+    crypto = daily.set_axis(days.tz_localize(None).tz_localize("UTC").rename("Date"))
+    assert len(app.resample_ohlcv(crypto, "BTC-USD", "1wk", now=pd.Timestamp("2024-03-08 20:00", tz="UTC"))) == 0
+    assert len(app.resample_ohlcv(crypto, "BTC-USD", "1wk", now=pd.Timestamp("2024-03-11 00:00", tz="UTC"))) == 1
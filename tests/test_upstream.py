@@ -0,0 +1,53 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+def test_concurrent_identical_requests_share_one_call(app):
+    fetcher = app.UpstreamFetcher(rate=None, max_retries=0)
+    release, started, calls = threading.Event(), threading.Barrier(5), []
+    def slow_info(symbol):
+        calls.append(symbol)
+        release.wait(5)
+        return {"symbol": symbol}
+    def request():
+        started.wait(5)
+        return fetcher.call(('info', 'AAPL'), slow_info, 'AAPL')
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(request) for _ in range(4)]
+        started.wait(5)
+        time.sleep(0.2) # 讓四個請求都進入 call 後才完成上游呼叫
+        release.set()
+        results = [future.result(timeout=5) for future in futures]
+    assert calls == ['AAPL']
+    assert all(result is results[0] for result in results)
+    assert fetcher._inflight == {}
+
+
+def test_failure_is_retried_then_served_from_last_good(app, monkeypatch):
+    monkeypatch.setattr(app.time, "sleep", lambda seconds: None) # 略過退避等待
+    fetcher = app.UpstreamFetcher(rate=None, max_retries=2)
+    responses = iter([{"price": 1}, ConnectionError("429"), ConnectionError("429"), {"price": 2}])
+    def flaky(symbol):
+        response = next(responses)
+        if isinstance(response, Exception): raise response
+        return response
+    key = ('info', 'AAPL')
+    assert fetcher.call(key, flaky, 'AAPL') == {"price": 1}
+    assert fetcher.call(key, flaky, 'AAPL') == {"price": 2} # 兩次失敗後第三次重試成功
+    failing = lambda symbol: (_ for _ in ()).throw(ConnectionError("down"))
+    with pytest.raises(ConnectionError): fetcher.call(key, failing, 'AAPL')
+    assert fetcher.last_good(key) == {"price": 2}
+    monkeypatch.setattr(app, "UPSTREAM", fetcher)
+    assert app.fetch_or_default(lambda: fetcher.call(key, failing, 'AAPL'), default={}, stale_key=key) == {"price": 2}
+
+
+def test_last_good_is_bounded_lru(app):
+    fetcher = app.UpstreamFetcher(rate=None, max_retries=0, last_good_size=2)
+    for symbol in ('A', 'B', 'A', 'C'): fetcher.call(('info', symbol), str.lower, symbol)
+    assert fetcher.last_good(('info', 'B')) is None
+    assert fetcher.last_good(('info', 'A')) == 'a' and fetcher.last_good(('info', 'C')) == 'c'
+    fetcher.call(('history', 'A'), str.lower, 'A')
+    assert fetcher.last_good(('history', 'A')) is None # 價格序列不保留 (由本地儲存提供過時數據)